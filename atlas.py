@@ -0,0 +1,83 @@
+import hashlib
+import os
+import numpy as np
+from PyQt5.QtGui import QImage, QColor
+from slot_store import SlotStore
+
+ATLAS_TILE_SIZE = 32
+BACKGROUND = 64
+
+def atlas_paths_for(db_path):
+    stem = os.path.splitext(db_path)[0]
+    return stem + '.atlas.npy', stem + '.atlas.ids.npy'
+
+def image_to_array(image):
+    # QImage -> (height, width, 3) uint8 (줄 끝 padding 제외)
+    image = image.convertToFormat(QImage.Format_RGB888)
+    pixels = np.frombuffer(image.constBits().asstring(image.sizeInBytes()), dtype=np.uint8)
+    return pixels.reshape(image.height(), image.bytesPerLine())[:, :image.width() * 3].reshape(image.height(), image.width(), 3)
+
+def image_to_tile(image, size=ATLAS_TILE_SIZE):
+    # 타일 크기 안에 비율을 유지해 가운데 놓는다
+    tile = np.full((size, size, 3), BACKGROUND, dtype=np.uint8)
+    if image.isNull():
+        return tile
+    pixels = image_to_array(image)[:size, :size]
+    height, width = pixels.shape[:2]
+    top, left = (size - height) // 2, (size - width) // 2
+    tile[top:top + height, left:left + width] = pixels
+    return tile
+
+def class_color(cls):
+    # 실행할 때마다 같은 색이 나오도록 클래스 이름의 해시로 hue 를 정한다
+    hue = int(hashlib.md5(str(cls).encode()).hexdigest()[:4], 16) % 360
+    color = QColor.fromHsv(hue, 200, 230)
+    return np.array([color.red(), color.green(), color.blue()], dtype=np.uint8)
+
+class TileAtlas:
+    # 고정 크기 썸네일을 (slot, tile, tile, 3) uint8 배열 하나에 모은 memmap 파일
+    def __init__(self, db_path, tile_size=ATLAS_TILE_SIZE, capacity=4096):
+        self.path, ids_path = atlas_paths_for(db_path)
+        self.tile_size = tile_size
+        self.store = SlotStore(ids_path, {'tiles': (self.path, np.uint8, (tile_size, tile_size, 3))}, capacity)
+
+    def __len__(self):
+        return len(self.store)
+
+    def lookup(self, ladybird_ids):
+        return self.store.lookup(ladybird_ids)
+
+    def add(self, ladybird_ids, tiles):
+        self.store.add(ladybird_ids, tiles=tiles)
+
+    def flush(self):
+        self.store.flush()
+
+    def mosaic(self, ladybird_ids, classes, columns=None, tint=0.35):
+        # NumPy 슬라이스만으로 큰 모자이크 한 장을 만든다. 없는 타일은 클래스 색으로 채운다.
+        # id 가 None 인 칸은 빈칸 (클래스별로 줄을 맞출 때 사용)
+        count = len(ladybird_ids)
+        size = self.tile_size
+        columns = columns or max(1, int(np.ceil(np.sqrt(count))))
+        rows = max(1, -(-count // columns))
+        colors = {cls: class_color(cls) for cls in set(classes)}
+        tile_colors = np.array([colors[cls] for cls in classes], dtype=np.uint8).reshape(-1, 3)
+        blank = np.array([ladybird_id is None for ladybird_id in ladybird_ids], dtype=bool)
+        with self.store.lock:
+            slots = self.lookup(['' if ladybird_id is None else ladybird_id for ladybird_id in ladybird_ids])
+            found = slots >= 0
+            tiles = np.empty((rows * columns, size, size, 3), dtype=np.uint8)
+            tiles[:] = BACKGROUND
+            tiles[:count][found] = self.store.read('tiles', slots[found])
+        missing = ~found & ~blank
+        tiles[:count][missing] = tile_colors[missing][:, None, None, :] // 2
+        if tint:
+            shown = np.flatnonzero(~blank)
+            blended = tiles[shown].astype(np.float32) * (1 - tint) + tile_colors[shown][:, None, None, :].astype(np.float32) * tint
+            tiles[shown] = blended.astype(np.uint8)
+        image = tiles.reshape(rows, columns, size, size, 3).transpose(0, 2, 1, 3, 4).reshape(rows * size, columns * size, 3)
+        return np.ascontiguousarray(image), columns
+
+def mosaic_to_image(array):
+    height, width = array.shape[:2]
+    return QImage(array.data, width, height, width * 3, QImage.Format_RGB888).copy()
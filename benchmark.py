@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+
+# 합성 데이터셋으로 주요 경로의 시간을 재고 결과를 JSON 으로 남긴다.
+# tag_bug 를 import 하기 전에 Qt/데이터 경로 환경 변수를 정해야 한다.
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {'k': 1000, 'm': 1000000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+def zipf_weights(n_classes, skew):
+    weights = 1.0 / np.arange(1, n_classes + 1) ** skew
+    return weights / weights.sum()
+
+def generate_database(db_path, n_rows, n_classes, skew, seed, chunk_size=200000):
+    from sqlalchemy import insert
+    from create_db import LadybirdDB, open_engine
+    engine = open_engine(db_path)
+    rng = np.random.default_rng(seed)
+    classes = np.array(['None'] + [f'class_{i}' for i in range(1, n_classes)], dtype=object)
+    weights = zipf_weights(n_classes, skew)
+    table = LadybirdDB.__table__
+    written = 0
+    while written < n_rows:
+        n = min(chunk_size, n_rows - written)
+        ids = rng.integers(0, 2 ** 63, size=n, dtype=np.int64).astype(str)
+        labels = classes[rng.choice(n_classes, size=n, p=weights)]
+        with engine.begin() as connection:
+            connection.execute(insert(table).prefix_with('OR IGNORE'), [{'id': i, 'class_': c} for i, c in zip(ids, labels)])
+        written += n
+    engine.dispose()
+
+def generate_images(root, ladybird_ids, size, seed):
+    from PyQt5.QtGui import QImage, QColor
+    rng = random.Random(seed)
+    for ladybird_id in ladybird_ids:
+        for sub in ('ladybirds', 'patterns'):
+            path = os.path.join(root, ladybird_id, sub)
+            os.makedirs(path, exist_ok=True)
+            image = QImage(size, size * 3 // 4, QImage.Format_RGB32)
+            image.fill(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+            image.save(os.path.join(path, f'{ladybird_id}.jpg'))
+
+def measure(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'max': max(times), 'runs': times}
+
+class Bench:
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.results = []
+
+    def record(self, size, name, timing, **extra):
+        entry = dict(size=size, name=name, **timing, **extra)
+        self.results.append(entry)
+        print(f"{size:>10} {name:<28} median {timing['median'] * 1000:9.1f} ms  min {timing['min'] * 1000:9.1f} ms", flush=True)
+
+    def run_size(self, n_rows):
+        import sqlite3
+        from PyQt5.QtWidgets import QApplication, QFileDialog, QMessageBox
+        import tag_bug
+
+        app = QApplication.instance()
+        db_path = os.path.join(self.workdir, f'bench_{n_rows}.db')
+        if not os.path.exists(db_path):
+            start = time.perf_counter()
+            generate_database(db_path, n_rows, self.args.classes, self.args.skew, self.args.seed)
+            print(f"generated {db_path} in {time.perf_counter() - start:.1f}s", flush=True)
+        connection = sqlite3.connect(db_path)
+        sample_ids = [row[0] for row in connection.execute('SELECT id FROM ladybirds ORDER BY id LIMIT ?', (self.args.images,))]
+        all_count = connection.execute('SELECT count(*) FROM ladybirds').fetchone()[0]
+        connection.close()
+        generate_images(tag_bug.DATA_ROOT, [i for i in sample_ids if not os.path.exists(os.path.join(tag_bug.DATA_ROOT, i))], self.args.image_size, self.args.seed)
+
+        # 다이얼로그는 모두 고정된 값으로 대체한다
+        npy_path = os.path.join(self.workdir, f'bench_{n_rows}_subset.npy')
+        dialog_answers = {'Select DB File': db_path, 'Select NPY File': npy_path}
+        QFileDialog.getOpenFileName = staticmethod(lambda parent, title, *a, **k: (dialog_answers[title], ''))
+        QMessageBox.question = staticmethod(lambda *a, **k: QMessageBox.Yes)
+        QMessageBox.information = staticmethod(lambda *a, **k: QMessageBox.Ok)
+        QMessageBox.warning = staticmethod(lambda *a, **k: QMessageBox.Ok)
+        QMessageBox.critical = staticmethod(lambda parent, title, text, *a, **k: print(f"critical: {text}", file=sys.stderr))
+
+        window = tag_bug.MainWindow()
+        window.grid_width = window.grid_height = self.args.grid
+        window.images_per_page = self.args.grid * self.args.grid
+        window.pager.set_page_size(window.images_per_page)
+        repeat = self.args.repeat
+
+        loader = window.tile_loader
+
+        def settle():
+            # 화면에 보이는 타일이 모두 채워질 때까지 (프리페치는 기다리지 않는다)
+            while loader.wanted & loader.in_flight:
+                app.processEvents()
+            app.processEvents()
+
+        def drain():
+            app.processEvents()
+            loader.pool.waitForDone()
+            app.processEvents()
+
+        def cold():
+            drain()
+            loader.buffer.clear()
+            window.page_buffer.clear()
+            for label in window.grid_slots:
+                label.clear_tile()
+
+        self.record(n_rows, 'load_db', measure(lambda: (window.load_db(), settle()), 1))
+        window.all_activate()
+        drain()
+
+        def render():
+            window.display_images()
+            settle()
+        self.record(n_rows, 'display_images_cold', measure(render, repeat, cold), images=window.images_per_page)
+        self.record(n_rows, 'display_images_warm', measure(render, repeat, drain))
+
+        def recount():
+            cold()
+            window.pager.invalidate()
+        self.record(n_rows, 'display_images_recount', measure(render, repeat, recount))
+
+        def first_page():
+            window.current_page = 0
+            window.display_images()
+            drain()
+
+        def next_page():
+            window.next_page()
+            settle()
+        self.record(n_rows, 'next_page_prefetched', measure(next_page, repeat, first_page))
+
+        def last_page():
+            cold()
+            window.pager.invalidate()
+            window.current_page = max(0, (all_count - 1) // window.images_per_page)
+        self.record(n_rows, 'deep_page', measure(render, repeat, last_page))
+        window.current_page = 0
+        window.display_images()
+        drain()
+
+        def unselect():
+            drain()
+            window.unselect_all()
+        self.record(n_rows, 'select_all_images', measure(window.select_all_images, repeat, unselect))
+        window.unselect_all()
+
+        def grayscale():
+            window.toggle_grayscale()
+            settle()
+        self.record(n_rows, 'toggle_grayscale', measure(grayscale, repeat * 2, drain))
+        if window.grayscale:
+            window.toggle_grayscale()
+        drain()
+
+        ids = [row.id for row in window.build_query().with_entities(tag_bug.LadybirdDB.id).limit(self.args.selection)]
+        labels = iter(range(repeat * 6))
+
+        def select():
+            window.flush_writes()
+            drain()
+            window.selection.clear()
+            for ladybird_id in ids:
+                window.selection.add(ladybird_id)
+
+        def enqueue_selection():
+            window.update_image_class(f'bench_{next(labels)}')
+            settle()
+
+        def tag_selection():
+            # 쓰기는 write-behind 큐로 가므로 커밋까지 기다려야 예전 결과와 비교할 수 있다
+            enqueue_selection()
+            window.flush_writes()
+            settle()
+        self.record(n_rows, 'update_image_class_enqueue', measure(enqueue_selection, repeat, select), selection=len(ids))
+        self.record(n_rows, 'update_image_class', measure(tag_selection, repeat, select), selection=len(ids))
+
+        def select_matching():
+            window.flush_writes()
+            drain()
+            window.all_activate()
+            window.select_all_matching()
+        self.record(n_rows, 'tag_all_matching', measure(tag_selection, repeat, select_matching), selection=all_count)
+        window.all_activate()
+        drain()
+
+        window.flush_writes()
+        drain()
+        count_window = tag_bug.LabelCountWindow(window, window.db_session, window.label_stats)
+        self.record(n_rows, 'label_stats_load', measure(lambda: window.label_stats.load(window.db_session), repeat))
+        self.record(n_rows, 'update_counts', measure(count_window.update_counts, repeat))
+        count_window.done(0)
+
+        np.save(npy_path, np.array([os.path.join(tag_bug.DATA_ROOT, i, 'ladybirds', f'{i}.jpg') for i in ids + sample_ids], dtype=object))
+        self.record(n_rows, 'load_npy', measure(lambda: (window.load_npy(), settle()), repeat, drain), subset=len(ids) + len(sample_ids))
+        window.npy_deactivate()
+        drain()
+        window.close()
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = {(r['size'], r['name']): r for r in json.load(f)['results']}
+    regressions = 0
+    for r in results:
+        old = baseline.get((r['size'], r['name']))
+        if old is None:
+            continue
+        ratio = r['median'] / max(old['median'], 1e-9)
+        flag = 'REGRESSION' if ratio > 1 + threshold else ''
+        regressions += bool(flag)
+        print(f"{r['size']:>10} {r['name']:<28} {old['median'] * 1000:9.1f} -> {r['median'] * 1000:9.1f} ms ({ratio:5.2f}x) {flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tag Bug performance benchmark on synthetic datasets')
+    parser.add_argument('--sizes', nargs='+', default=['10k'], help='DB sizes, e.g. 10k 1M 10M')
+    parser.add_argument('--classes', type=int, default=12)
+    parser.add_argument('--skew', type=float, default=1.2, help='zipf exponent of the class distribution')
+    parser.add_argument('--images', type=int, default=2000, help='number of ids that get synthetic images')
+    parser.add_argument('--image-size', type=int, default=640)
+    parser.add_argument('--grid', type=int, default=10)
+    parser.add_argument('--selection', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='reuse generated DBs and images from this directory')
+    parser.add_argument('-o', '--output', default='bench_output.json')
+    parser.add_argument('--compare', help='previous output to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='tag_bug_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    os.environ['TAG_BUG_DATA_ROOT'] = os.path.join(workdir, 'images')
+    os.environ['TAG_BUG_CACHE_DIR'] = os.path.join(workdir, 'cache')
+    shutil.rmtree(os.environ['TAG_BUG_CACHE_DIR'], ignore_errors=True)
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1])
+    bench = Bench(args, workdir)
+    for size in args.sizes:
+        bench.run_size(parse_size(size))
+
+    output = {
+        'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'cpus': os.cpu_count(), 'args': vars(args), 'workdir': workdir},
+        'results': bench.results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"results written to {args.output}")
+    if args.compare:
+        sys.exit(1 if compare(bench.results, args.compare, args.threshold) else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import os
+import socket
+import uuid
+from collections import namedtuple
+from sqlalchemy import func
+from create_db import ChangeLogDB
+from db_ops import CHANGE_LOG_ROWS
+
+# 같은 DB 를 여러 창/사람이 같이 열 때 다른 쪽이 커밋한 태그/삭제를 change_log 에서 읽어 온다.
+# 평소에는 max(seq) 한 번만 읽고 (rowid 라서 바로 찾는다), 새 행이 있을 때만 그 뒤를 읽는다.
+# 자기 창이 쓴 변경은 이미 화면에 반영했으므로 건너뛴다
+
+# kind: 'tag' 또는 'delete'. new_class 는 delete 면 None
+Change = namedtuple('Change', ['ladybird_id', 'kind', 'previous_class', 'new_class'])
+
+def client_name():
+    # 같은 사람이 창을 여러 개 열어도 구분되도록 프로세스마다 다르게 만든다
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+class ChangeFeed:
+    def __init__(self, client, max_changes=CHANGE_LOG_ROWS):
+        self.client = client
+        self.max_changes = max_changes
+        self.last_seq = 0
+
+    def latest(self, session):
+        return session.query(func.max(ChangeLogDB.seq)).scalar() or 0
+
+    def sync(self, session, load, attempts=5):
+        # load (통계 전체 읽기) 와 같은 시점 이후의 변경만 받는다.
+        # SELECT 마다 스냅샷이 다르므로 읽는 사이에 커밋된 변경이 있으면 다시 읽는다
+        for _ in range(attempts):
+            latest = self.latest(session)
+            load()
+            if self.latest(session) == latest:
+                break
+        self.last_seq = latest
+
+    def poll(self, session):
+        # 새 변경 목록. 전체를 다시 읽어야 하면 None
+        # (대량 변경, 오래된 로그가 정리되어 놓친 변경, DB 가 바뀐 경우)
+        latest = self.latest(session)
+        if latest == self.last_seq:
+            return []
+        if latest < self.last_seq or latest - self.last_seq > self.max_changes:
+            self.last_seq = latest
+            return None
+        table = ChangeLogDB
+        rows = session.query(table.seq, table.id, table.kind, table.previous_class, table.class_, table.client) \
+            .filter(table.seq > self.last_seq, table.seq <= latest).order_by(table.seq).all()
+        # seq 는 AUTOINCREMENT 라 비어 있는 번호가 있으면 그 사이가 정리된 것이다
+        complete = len(rows) == latest - self.last_seq
+        self.last_seq = latest
+        if not complete:
+            return None
+        changes = []
+        for row in rows:
+            if row.client is not None and row.client == self.client:
+                continue
+            if row.kind == 'reload':
+                return None
+            changes.append(Change(row.id, row.kind, row.previous_class, row.class_))
+        return changes
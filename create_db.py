@@ -1,19 +1,92 @@
-from sqlalchemy import create_engine, Column, String
+from sqlalchemy import create_engine, event, Column, String, Integer, Float, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import hashlib
 import random
+import os
+import sys
 
 Base = declarative_base()
 
+# PRAGMA user_version 에 기록되는 스키마 버전 (2: change_log)
+SCHEMA_VERSION = 2
+
+# 다른 창이 쓰는 중이면 에러 대신 이만큼 (ms) 기다린다
+BUSY_TIMEOUT = int(os.environ.get('TAG_BUG_SQLITE_BUSY_TIMEOUT', '30000'))
+
 class LadybirdDB(Base):
     __tablename__ = 'ladybirds'
     id = Column(String, primary_key=True)
     class_ = Column(String)
+    __table_args__ = (
+        Index('ix_ladybirds_class_', 'class_'),
+        Index('ix_ladybirds_class_id', 'class_', 'id'),
+    )
+
+class ChangeLogDB(Base):
+    # 같은 DB 를 여러 창/사람이 같이 열 때 태그/삭제를 서로 알리는 로그 (change_feed.py 가 읽는다).
+    # kind 가 'reload' 인 행 (id 없음) 은 대량 변경이라 전체를 다시 읽으라는 표시
+    __tablename__ = 'change_log'
+    __table_args__ = {'sqlite_autoincrement': True}
+    seq = Column(Integer, primary_key=True)
+    id = Column(String)
+    kind = Column(String)
+    previous_class = Column(String)
+    class_ = Column(String)
+    client = Column(String)
+    changed_at = Column(Float)
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # 태깅처럼 작은 쓰기가 잦은 작업에 맞춘 설정 (네트워크 파일시스템이면 TAG_BUG_SQLITE_WAL=0)
+    cursor = dbapi_connection.cursor()
+    if os.environ.get('TAG_BUG_SQLITE_WAL', '1') != '0':
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT}')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-65536')
+    cursor.close()
+
+def migrate(engine):
+    with engine.begin() as connection:
+        version = connection.exec_driver_sql('PRAGMA user_version').scalar()
+        if version >= SCHEMA_VERSION:
+            return version
+        # 여러 창이 같이 열어도 한 곳만 올리도록 쓰기 잠금을 먼저 잡고 버전을 다시 읽는다
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        version = connection.exec_driver_sql('PRAGMA user_version').scalar()
+        if version >= SCHEMA_VERSION:
+            return version
+        Base.metadata.create_all(connection)
+        if version < 1:
+            for index in LadybirdDB.__table__.indexes:
+                index.create(connection, checkfirst=True)
+            connection.exec_driver_sql('ANALYZE ladybirds')
+        connection.exec_driver_sql(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return SCHEMA_VERSION
+
+def open_engine(db_path, **kwargs):
+    engine = create_engine(f'sqlite:///{db_path}', **kwargs)
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+    migrate(engine)
+    return engine
+
+def explain_query_plan(session, query):
+    statement = query.statement.compile(dialect=session.bind.dialect, compile_kwargs={'literal_binds': True})
+    rows = session.execute(text(f'EXPLAIN QUERY PLAN {statement}'))
+    return [row[-1] for row in rows]
+
+def uses_index(plan, index_name):
+    return any(index_name in detail for detail in plan)
 
-def create_database():
-    engine = create_engine('sqlite:///test_1000.db')
+def create_database(db_path='test_1000.db'):
+    engine = open_engine(db_path)
     Base.metadata.create_all(engine)
+    return engine
 
 
-create_database()
+if __name__ == '__main__':
+    engine = create_database(*sys.argv[1:2])
+    session = sessionmaker(bind=engine)()
+    plan = explain_query_plan(session, session.query(LadybirdDB.id).filter(LadybirdDB.class_.in_(['None'])))
+    print('\n'.join(plan))
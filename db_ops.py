@@ -0,0 +1,110 @@
+import time
+from collections import namedtuple, Counter
+from sqlalchemy import update, delete, insert, select, func, literal, String
+from sqlalchemy.exc import OperationalError
+from create_db import LadybirdDB, ChangeLogDB
+
+# SQLite 의 bound parameter 기본 한도(999) 아래로 나눠서 실행한다
+MAX_VARIABLES = 900
+
+# 한 번에 이보다 많은 행을 바꾸면 행마다 남기지 않고 'reload' 표시 하나만 남긴다
+CHANGE_LOG_ROWS = 20000
+
+# writer 가 시작할 때 change_log 는 최근 이만큼만 남긴다 (그보다 뒤처진 창은 어차피 전체를 다시 읽는다)
+CHANGE_LOG_KEEP = 5 * CHANGE_LOG_ROWS
+
+# previous: 변경 전 클래스별 개수 (라벨 통계를 증분 갱신하는 데 사용)
+BulkResult = namedtuple('BulkResult', ['affected', 'missing', 'previous'])
+
+def chunked(items, size=MAX_VARIABLES):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def count_classes(session, chunk):
+    rows = session.query(LadybirdDB.class_, func.count()).filter(LadybirdDB.id.in_(chunk)).group_by(LadybirdDB.class_)
+    return Counter(dict(rows.all()))
+
+def log_changes(session, condition, kind, new_class=None, client=None):
+    # 바꾸기 전에 같은 트랜잭션에서 조건에 맞는 행을 이전 클래스와 함께 change_log 에 남긴다
+    rows = select(LadybirdDB.id, literal(kind), LadybirdDB.class_, literal(new_class, String),
+                  literal(client, String), literal(time.time())).where(condition)
+    columns = ['id', 'kind', 'previous_class', 'class_', 'client', 'changed_at']
+    session.execute(insert(ChangeLogDB).from_select(columns, rows))
+
+def log_reload(session, client=None):
+    session.execute(insert(ChangeLogDB).values(kind='reload', client=client, changed_at=time.time()))
+
+def prune_change_log(session, keep=CHANGE_LOG_KEEP):
+    # seq (rowid) 범위로 지우므로 인덱스 없이도 앞쪽만 읽는다
+    latest = session.query(func.max(ChangeLogDB.seq)).scalar()
+    if latest is not None and latest > keep:
+        session.execute(delete(ChangeLogDB).where(ChangeLogDB.seq <= latest - keep))
+
+def is_busy_error(error):
+    # busy_timeout 동안 기다려도 다른 connection 이 쓰기 잠금을 놓지 않았을 때
+    return isinstance(error, OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+def bulk_update_class(session, ladybird_ids, new_class, client=None):
+    # 커밋은 호출하는 쪽에서 한 번에 한다
+    affected = 0
+    missing = []
+    previous = Counter()
+    log_rows = len(ladybird_ids) <= CHANGE_LOG_ROWS
+    if not log_rows:
+        log_reload(session, client)
+    for chunk in chunked(ladybird_ids, MAX_VARIABLES - 1):
+        if log_rows:
+            log_changes(session, LadybirdDB.id.in_(chunk), 'tag', new_class, client)
+        previous.update(count_classes(session, chunk))
+        statement = update(LadybirdDB).where(LadybirdDB.id.in_(chunk)).values(class_=new_class).returning(LadybirdDB.id)
+        found = {row.id for row in session.execute(statement, execution_options={'synchronize_session': False})}
+        affected += len(found)
+        missing.extend(ladybird_id for ladybird_id in chunk if ladybird_id not in found)
+    return BulkResult(affected, missing, previous)
+
+def bulk_delete(session, ladybird_ids, client=None):
+    affected = 0
+    missing = []
+    previous = Counter()
+    log_rows = len(ladybird_ids) <= CHANGE_LOG_ROWS
+    if not log_rows:
+        log_reload(session, client)
+    for chunk in chunked(ladybird_ids):
+        if log_rows:
+            log_changes(session, LadybirdDB.id.in_(chunk), 'delete', client=client)
+        previous.update(count_classes(session, chunk))
+        statement = delete(LadybirdDB).where(LadybirdDB.id.in_(chunk)).returning(LadybirdDB.id)
+        found = {row.id for row in session.execute(statement, execution_options={'synchronize_session': False})}
+        affected += len(found)
+        missing.extend(ladybird_id for ladybird_id in chunk if ladybird_id not in found)
+    return BulkResult(affected, missing, previous)
+
+def query_classes(query):
+    rows = query.with_entities(LadybirdDB.class_, func.count()).group_by(LadybirdDB.class_)
+    return Counter(dict(rows.all()))
+
+def query_ids(query):
+    subquery = query.with_entities(LadybirdDB.id).subquery()
+    return select(subquery.c.id)
+
+def log_query_changes(session, query, previous, kind, new_class, client):
+    if sum(previous.values()) > CHANGE_LOG_ROWS:
+        log_reload(session, client)
+    else:
+        log_changes(session, LadybirdDB.id.in_(query_ids(query)), kind, new_class, client)
+
+def query_update_class(session, query, new_class, client=None):
+    # id 목록을 만들지 않고 조건에 맞는 행을 UPDATE 한 번으로 바꾼다
+    previous = query_classes(query)
+    log_query_changes(session, query, previous, 'tag', new_class, client)
+    statement = update(LadybirdDB).where(LadybirdDB.id.in_(query_ids(query))).values(class_=new_class)
+    affected = session.execute(statement, execution_options={'synchronize_session': False}).rowcount
+    return BulkResult(affected, [], previous)
+
+def query_delete(session, query, client=None):
+    previous = query_classes(query)
+    log_query_changes(session, query, previous, 'delete', None, client)
+    statement = delete(LadybirdDB).where(LadybirdDB.id.in_(query_ids(query)))
+    affected = session.execute(statement, execution_options={'synchronize_session': False}).rowcount
+    return BulkResult(affected, [], previous)
@@ -0,0 +1,124 @@
+import threading
+from collections import namedtuple
+from PyQt5.QtGui import QImage, QPainter, QPen
+from PyQt5.QtCore import Qt, QSize, QObject, QRunnable, QThreadPool, pyqtSignal
+from image_loader import TileBuffer, decode_source, fit_tile, image_to_thumbnail, thumbnail_to_image, DETAIL_SIZE
+from image_source import image_reader
+from manifest import MISSING_ENTRY
+from perf import profiler
+
+# 디테일 창 한 장: DETAIL_SIZE 로 맞춘 ladybird 이미지와 표시 영역까지 그린 pattern 이미지 (QImage)
+DetailFrame = namedtuple('DetailFrame', ['ladybird', 'pattern'])
+
+def load_detail_image(cache, image_path):
+    # (이미지, 원본 크기 QSize). 원본 대신 DETAIL_SIZE 로 줄인 캐시 이미지와 같이 저장한 원본 크기를 쓴다
+    # (prewarm 으로 미리 만들어 둘 수 있다). 캐시에 없을 때만 원본을 읽는다
+    thumbnail = cache.get_many([image_path], DETAIL_SIZE, DETAIL_SIZE, False, larger=True).get(image_path)
+    if thumbnail is None:
+        image, source_size = decode_source(image_path, DETAIL_SIZE, DETAIL_SIZE, False)
+        if not image.isNull():
+            cache.put(image_path, DETAIL_SIZE, DETAIL_SIZE, False, image_to_thumbnail(image, source_size))
+    else:
+        image = fit_tile(thumbnail_to_image(thumbnail), DETAIL_SIZE, DETAIL_SIZE, False)
+        source_size = thumbnail.source_width and (thumbnail.source_width, thumbnail.source_height)
+        if not source_size:
+            # 원본 크기를 저장하기 전에 만든 캐시: 한 번만 헤더를 읽어 채워 둔다
+            reader = image_reader(image_path)
+            size = reader.size() if reader is not None else QSize()
+            if size.isValid():
+                source_size = (size.width(), size.height())
+                cache.put(image_path, DETAIL_SIZE, DETAIL_SIZE, False, image_to_thumbnail(image, source_size))
+    return image, QSize(*source_size) if source_size else QSize()
+
+def render_detail(cache, entry):
+    # QImage 와 QPainter(QImage) 는 워커 스레드에서 쓸 수 있으므로 표시 영역까지 여기서 그린다
+    ladybird = pattern = QImage()
+    if entry.ladybird_path:
+        with profiler.span('detail.ladybird'):
+            ladybird, _ = load_detail_image(cache, entry.ladybird_path)
+            if not ladybird.isNull():
+                ladybird = ladybird.scaled(DETAIL_SIZE, DETAIL_SIZE, Qt.KeepAspectRatio)
+    if entry.pattern_path:
+        with profiler.span('detail.pattern'):
+            pattern, source_size = load_detail_image(cache, entry.pattern_path)
+            if not pattern.isNull():
+                pattern = pattern.convertToFormat(QImage.Format_RGB32)
+                painter = QPainter(pattern)
+                # 표시 영역은 원본 픽셀 좌표라서 줄여 읽은 비율만큼 같이 줄인다
+                if source_size.isValid() and source_size.width() > 0:
+                    scale = pattern.width() / source_size.width()
+                    painter.scale(scale, scale)
+                painter.setPen(QPen(Qt.green, 2))
+                painter.drawRect(36, 12, 55, 105)
+                painter.end()
+                pattern = pattern.scaled(DETAIL_SIZE, DETAIL_SIZE, Qt.KeepAspectRatio)
+    return DetailFrame(ladybird, pattern)
+
+class DetailTask(QRunnable):
+    def __init__(self, loader, generation, ladybird_id):
+        super().__init__()
+        self.loader = loader
+        self.generation = generation
+        self.ladybird_id = ladybird_id
+
+    def run(self):
+        # 그 사이 다른 곳으로 넘어가서 필요 없어졌으면 만들지 않는다
+        if self.ladybird_id not in self.loader.wanted:
+            self.loader.finish(self.generation, self.ladybird_id, None)
+            return
+        entry = self.loader.resolve([self.ladybird_id]).get(self.ladybird_id, MISSING_ENTRY)
+        self.loader.finish(self.generation, self.ladybird_id, render_detail(self.loader.thumbnail_cache, entry))
+
+class DetailLoader(QObject):
+    # 디테일 창의 프레임을 백그라운드에서 만들고 최근 것 몇 장을 LRU 로 들고 있는다.
+    # 보고 있는 id 를 먼저, 앞뒤 id 는 낮은 우선순위로 만든다
+    frame_loaded = pyqtSignal(str, object)
+
+    def __init__(self, thumbnail_cache, resolve, capacity=32, parent=None):
+        super().__init__(parent)
+        self.thumbnail_cache = thumbnail_cache
+        self.resolve = resolve
+        self.frames = TileBuffer(capacity)
+        self.wanted = set()
+        self.in_flight = set()
+        # clear() 할 때마다 올린다. 그 전에 시작한 작업의 결과는 버린다
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+
+    def request(self, ladybird_id, neighbours=()):
+        # 이미 만든 프레임이면 바로 돌려주고, 아니면 만들어지는 대로 frame_loaded 로 보낸다
+        self.wanted = {ladybird_id, *neighbours}
+        frame = self.frames.get(ladybird_id)
+        if frame is None:
+            self.start(ladybird_id, 1)
+        for neighbour in neighbours:
+            self.start(neighbour, 0)
+        return frame
+
+    def start(self, ladybird_id, priority):
+        with self.lock:
+            if ladybird_id in self.in_flight or ladybird_id in self.frames:
+                return
+            self.in_flight.add(ladybird_id)
+            generation = self.generation
+        self.pool.start(DetailTask(self, generation, ladybird_id), priority)
+
+    def finish(self, generation, ladybird_id, frame):
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.in_flight.discard(ladybird_id)
+            if frame is not None:
+                self.frames.put(ladybird_id, frame)
+        if frame is not None:
+            self.frame_loaded.emit(ladybird_id, frame)
+
+    def clear(self):
+        # DB 를 바꾸거나 manifest 를 다시 읽으면 경로가 달라질 수 있다
+        with self.lock:
+            self.generation += 1
+            self.in_flight = set()
+            self.wanted = set()
+            self.frames.clear()
@@ -0,0 +1,169 @@
+import csv
+import os
+import re
+import sys
+import numpy as np
+from numpy.lib.format import open_memmap
+from sqlalchemy import func
+from create_db import LadybirdDB
+
+# 필터 (클래스 + NPY subset) 에 맞는 행을 학습용 목록으로 내보낸다. UI 와 tag_cli export 가 같이 쓴다.
+#   npy: id (또는 '{path_root}/{id}') 의 고정 길이 'S' 배열. 개수를 먼저 세고 open_memmap 으로 미리 잡아 채운다
+#   csv: id,class
+# split 이면 클래스마다 '{이름}.{클래스}.npy|csv' 로 나눠 쓴다.
+# 행은 id 순서로 chunk 단위로 읽고 바로 쓰므로 메모리는 chunk 크기 (+ 샘플링할 때 행마다 1 byte) 만큼만 든다.
+# 센 개수와 읽은 행이 다르면 (그 사이 커밋) ExportChanged 를 낸다.
+# 파일은 '{경로}.tmp' 에 쓰고 끝까지 쓴 경우에만 제자리로 옮긴다 (중간에 멈추면 임시 파일을 지운다)
+
+class ExportChanged(RuntimeError):
+    # SQLite 는 SELECT 마다 스냅샷이 달라서, 센 뒤에 다른 곳에서 태그/삭제를 커밋하면 개수가 맞지 않는다
+    def __init__(self):
+        super().__init__("The DB changed during export (tags or deletes were committed meanwhile). Run the export again.")
+
+def class_name(cls):
+    # 클래스가 NULL 인 행은 파일 이름과 요약에서 'None' 으로 쓴다
+    return 'None' if cls is None else str(cls)
+
+def class_order(item):
+    # (클래스, 값) 을 클래스 이름 순으로. NULL 클래스는 맨 뒤
+    return item[0] is None, class_name(item[0])
+
+def named_totals(totals):
+    # 요약에 쓰는 (이름, 개수). NULL 과 문자열 'None' 처럼 이름이 같은 클래스는 합친다
+    named = {}
+    for cls, count in sorted(totals.items(), key=class_order):
+        named[class_name(cls)] = named.get(class_name(cls), 0) + count
+    return list(named.items())
+
+def class_stats(query):
+    # 필터에 맞는 클래스별 개수와 가장 긴 id 길이
+    rows = query.with_entities(LadybirdDB.class_, func.count(LadybirdDB.id), func.max(func.length(LadybirdDB.id))) \
+        .group_by(LadybirdDB.class_).order_by(None)
+    counts, width = {}, 1
+    for cls, count, max_length in rows:
+        counts[cls] = count
+        width = max(width, max_length or 1)
+    return counts, width
+
+def sample_masks(counts, per_class=None, fraction=None, seed=0):
+    # 클래스별 층화 샘플링: 클래스 안에서 id 순서상 몇 번째 행을 남길지 표시한 bool 배열.
+    # 샘플링하지 않으면 None
+    if per_class is None and fraction is None:
+        return None
+    rng = np.random.default_rng(seed)
+    masks = {}
+    for cls, count in sorted(counts.items(), key=class_order):
+        keep = count if fraction is None else int(round(count * fraction))
+        if per_class is not None:
+            keep = min(keep, per_class)
+        keep = min(count, max(0, keep))
+        mask = np.zeros(count, dtype=bool)
+        mask[rng.choice(count, keep, replace=False)] = True
+        masks[cls] = mask
+    return masks
+
+def temp_path(path):
+    return path if path == '-' else path + '.tmp'
+
+def split_path(output, cls):
+    stem, ext = os.path.splitext(output)
+    name = re.sub(r'[^\w.-]+', '_', class_name(cls))
+    return f'{stem}.{name}{ext}'
+
+class NpyWriter:
+    def __init__(self, path, count, width):
+        self.array = open_memmap(path, mode='w+', dtype=f'S{width}', shape=(count,))
+        self.filled = 0
+
+    def write(self, values, classes):
+        self.array[self.filled:self.filled + len(values)] = values
+        self.filled += len(values)
+
+    def close(self):
+        self.array.flush()
+        self.array = None
+
+class CsvWriter:
+    # path 가 '-' 면 stdout 으로 쓴다
+    def __init__(self, path, delimiter, header):
+        self.file = sys.stdout if path == '-' else open(path, 'w', newline='')
+        self.writer = csv.writer(self.file, delimiter=delimiter)
+        self.writer.writerow([header, 'class'])
+
+    def write(self, values, classes):
+        self.writer.writerows(zip(values.astype('U').tolist(), classes.tolist()))
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+def export_query(query, output, output_format='csv', split=False, per_class=None, fraction=None, seed=0,
+                 path_root=None, delimiter=',', chunk_size=50000, progress=None):
+    # 클래스별로 쓴 행 수를 돌려준다
+    counts, id_width = class_stats(query)
+    masks = sample_masks(counts, per_class, fraction, seed)
+    totals = {cls: int(masks[cls].sum()) if masks is not None else count for cls, count in counts.items()}
+    prefix = b'' if path_root is None else path_root.rstrip('/').encode() + b'/'
+    width = id_width + len(prefix)
+
+    # 클래스 -> writer. 파일 이름이 같아지는 클래스 (NULL 과 'None') 는 한 파일에 같이 쓴다
+    writers = {}
+    files = {}
+    def open_writer(path, count):
+        if output_format == 'npy':
+            return NpyWriter(temp_path(path), count, width)
+        return CsvWriter(temp_path(path), delimiter, 'id' if path_root is None else 'path')
+
+    # 클래스마다 지금까지 읽은 행 수 (샘플 mask 의 위치)
+    seen = dict.fromkeys(counts, 0)
+    done = 0
+    total = sum(counts.values())
+    statement = query.with_entities(LadybirdDB.id, LadybirdDB.class_).order_by(LadybirdDB.id).statement
+    completed = False
+    try:
+        if split:
+            paths = {cls: split_path(output, cls) for cls in totals}
+            for path in sorted(set(paths.values())):
+                files[path] = open_writer(path, sum(totals[cls] for cls in totals if paths[cls] == path))
+            writers = {cls: files[path] for cls, path in paths.items()}
+        else:
+            files[output] = writers[None] = open_writer(output, sum(totals.values()))
+        result = query.session.execute(statement, execution_options={'yield_per': chunk_size})
+        for rows in result.partitions():
+            ids = np.array([row[0] for row in rows], dtype=f'S{id_width}')
+            classes = np.array([row[1] for row in rows], dtype=object)
+            keep = np.ones(len(rows), dtype=bool)
+            groups = {}
+            for cls in set(classes.tolist()):
+                positions = np.flatnonzero(classes == cls)
+                if seen.get(cls, 0) + len(positions) > counts.get(cls, 0):
+                    raise ExportChanged()
+                if masks is not None:
+                    keep[positions] = masks[cls][seen[cls]:seen[cls] + len(positions)]
+                seen[cls] += len(positions)
+                groups[cls] = positions
+            if prefix:
+                ids = np.char.add(prefix, ids)
+            if split:
+                for cls, positions in groups.items():
+                    positions = positions[keep[positions]]
+                    writers[cls].write(ids[positions], classes[positions])
+            else:
+                writers[None].write(ids[keep], classes[keep])
+            done += len(rows)
+            if progress is not None:
+                progress(done, total)
+        if seen != counts:
+            raise ExportChanged()
+        completed = True
+    finally:
+        for writer in files.values():
+            writer.close()
+        for path in files:
+            if path == '-':
+                continue
+            if completed:
+                os.replace(temp_path(path), path)
+            elif os.path.exists(temp_path(path)):
+                os.remove(temp_path(path))
+    return totals
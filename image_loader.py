@@ -0,0 +1,248 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtGui import QImage
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThread, QThreadPool, pyqtSignal
+from thumb_cache import Thumbnail
+from image_source import image_reader
+from perf import profiler
+
+THUMBNAIL_SIZE = 100
+DETAIL_SIZE = 400
+
+def image_to_thumbnail(image, source_size=None):
+    # source_size: decode_source 가 돌려준 원본 (width, height)
+    data = bytes(image.constBits().asstring(image.sizeInBytes()))
+    source_width, source_height = source_size or (None, None)
+    return Thumbnail(image.width(), image.height(), int(image.format()), image.bytesPerLine(), data, source_width, source_height)
+
+def thumbnail_to_image(thumbnail):
+    image = QImage(thumbnail.data, thumbnail.width, thumbnail.height, thumbnail.bytes_per_line, QImage.Format(thumbnail.image_format))
+    return image.copy()
+
+def decode_source(image_path, width, height, grayscale):
+    # (타일, 원본 (width, height) 또는 None). 원본 크기는 캐시에 같이 저장해 두고 다시 열지 않는다.
+    # QImage 는 QPixmap 과 달리 워커 스레드에서 사용할 수 있다. 경로는 파일이나 shard 멤버 (image_source)
+    reader = image_reader(image_path)
+    if reader is None:
+        return QImage(), None
+    with profiler.span('tile.read'):
+        source_size = reader.size()
+        if source_size.isValid() and (source_size.width() > width or source_size.height() > height):
+            # 처음부터 타일 크기로 읽는다 (JPEG 는 DCT 단계에서 줄여서 디코딩)
+            reader.setScaledSize(source_size.scaled(width, height, Qt.KeepAspectRatio))
+        image = reader.read()
+    if not source_size.isValid():
+        # 헤더에 크기가 없는 형식은 디코딩한 크기가 원본 크기다
+        source_size = image.size()
+    source = (source_size.width(), source_size.height()) if not image.isNull() else None
+    return fit_tile(image, width, height, grayscale), source
+
+def decode_tile(image_path, width, height, grayscale):
+    return decode_source(image_path, width, height, grayscale)[0]
+
+def fit_tile(image, width, height, grayscale):
+    # 디코딩했거나 캐시에서 꺼낸 (더 큰) 이미지를 타일 크기/색으로 맞춘다
+    if image.isNull():
+        return image
+    if image.width() > width or image.height() > height:
+        with profiler.span('tile.scale'):
+            image = image.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    if grayscale and image.format() != QImage.Format_Grayscale8:
+        # 줄인 뒤에 변환하므로 픽셀 수가 타일 크기만큼만 든다
+        with profiler.span('tile.grayscale'):
+            image = image.convertToFormat(QImage.Format_Grayscale8)
+    return image
+
+def cached_tiles(cache, paths, width, height, grayscale):
+    # 같은 크기가 없으면 더 큰 캐시 타일(예: prewarm 으로 만든 것)을 줄여서 쓴다
+    thumbnails = cache.get_many(paths, width, height, grayscale, larger=True)
+    return {path: fit_tile(thumbnail_to_image(thumbnail), width, height, grayscale) for path, thumbnail in thumbnails.items()}
+
+class TileBuffer:
+    # 메모리에 올려두는 디코딩된 타일 (LRU, 타일 개수 기준)
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.images = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self.lock:
+            self.images[key] = image
+            self.images.move_to_end(key)
+            while len(self.images) > self.capacity:
+                self.images.popitem(last=False)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.images
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+
+class TileTask(QRunnable):
+    def __init__(self, loader, image_path, width, height, grayscale):
+        super().__init__()
+        self.loader = loader
+        self.image_path = image_path
+        self.width = width
+        self.height = height
+        self.grayscale = grayscale
+
+    def key(self):
+        return (self.image_path, self.width, self.height, self.grayscale)
+
+    def is_needed(self):
+        return self.key() in self.loader.wanted
+
+    def run(self):
+        # 이미 다른 페이지로 넘어갔으면 디코딩하지 않는다
+        if not self.is_needed():
+            self.loader.finish(self.key(), None)
+            return
+        image = None
+        cache = self.loader.thumbnail_cache
+        if cache is not None:
+            with profiler.span('tile.cache_get'):
+                image = cached_tiles(cache, [self.image_path], self.width, self.height, self.grayscale).get(self.image_path)
+        if image is None:
+            image, source_size = decode_source(self.image_path, self.width, self.height, self.grayscale)
+            if not image.isNull() and cache is not None:
+                with profiler.span('tile.cache_put'):
+                    cache.put(self.image_path, self.width, self.height, self.grayscale, image_to_thumbnail(image, source_size))
+        self.loader.finish(self.key(), image)
+
+class PrefetchTask(TileTask):
+    def __init__(self, loader, generation, ladybird_id, resolve, width, height, grayscale):
+        super().__init__(loader, None, width, height, grayscale)
+        self.generation = generation
+        self.ladybird_id = ladybird_id
+        self.resolve = resolve
+
+    def is_needed(self):
+        return self.generation == self.loader.prefetch_generation or super().is_needed()
+
+    def run(self):
+        if not self.is_needed():
+            return
+        # listdir 도 백그라운드에서 미리 해 둔다
+        self.image_path = self.resolve(self.ladybird_id)
+        if self.image_path and self.loader.claim(self.key()):
+            super().run()
+
+class TileLoader(QObject):
+    tile_loaded = pyqtSignal(int, str, QImage)
+
+    def __init__(self, thumbnail_cache=None, capacity=400, parent=None):
+        super().__init__(parent)
+        self.thumbnail_cache = thumbnail_cache
+        self.buffer = TileBuffer(capacity)
+        self.generation = 0
+        self.prefetch_generation = 0
+        self.wanted = set()
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(QThread.idealThreadCount())
+
+    def cancel(self):
+        # 세대를 올려 대기/진행 중인 결과를 무시한다
+        with self.lock:
+            self.generation += 1
+            self.wanted = set()
+        return self.generation
+
+    def claim(self, key):
+        with self.lock:
+            if key in self.in_flight or key in self.buffer:
+                return False
+            self.in_flight.add(key)
+            return True
+
+    def finish(self, key, image):
+        with self.lock:
+            self.in_flight.discard(key)
+            if image is not None and not image.isNull():
+                self.buffer.put(key, image)
+            deliver = image is not None and key in self.wanted
+            generation = self.generation
+        if deliver:
+            self.tile_loaded.emit(generation, key[0], image)
+
+    def request(self, image_paths, width, height, grayscale):
+        # 메모리 버퍼와 캐시에 있는 타일은 바로 돌려주고 나머지는 풀에서 디코딩한다
+        generation = self.cancel()
+        images = {}
+        for image_path in image_paths:
+            image = self.buffer.get((image_path, width, height, grayscale))
+            if image is not None:
+                images[image_path] = image
+        missing = [path for path in image_paths if path not in images]
+        if missing and self.thumbnail_cache is not None:
+            for path, image in cached_tiles(self.thumbnail_cache, missing, width, height, grayscale).items():
+                images[path] = image
+                self.buffer.put((path, width, height, grayscale), image)
+        with self.lock:
+            self.wanted = {(path, width, height, grayscale) for path in image_paths if path not in images}
+            # 프리페치 중인 타일은 다시 디코딩하지 않고 완료될 때 전달받는다
+            pending = [key for key in self.wanted if key not in self.in_flight]
+            self.in_flight.update(pending)
+        for key in pending:
+            self.pool.start(TileTask(self, *key), 1)
+        return generation, images
+
+    def prefetch(self, ladybird_ids, resolve, width, height, grayscale):
+        self.prefetch_generation += 1
+        for ladybird_id in ladybird_ids:
+            self.pool.start(PrefetchTask(self, self.prefetch_generation, ladybird_id, resolve, width, height, grayscale), 0)
+
+    def resize(self, capacity):
+        with self.buffer.lock:
+            self.buffer.capacity = capacity
+
+class DecodeThread(QThread):
+    # id 들의 ladybird 이미지를 size 로 디코딩하고 convert 결과를 batch 단위로 store(ids, values) 에 넘긴다.
+    # 아틀라스 타일, 유사도 특징처럼 id 별 값을 디스크에 채우는 작업에 쓴다
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, manifest, ladybird_ids, size, convert, store, done=None, parent=None, workers=8, batch_size=256):
+        super().__init__(parent)
+        self.manifest = manifest
+        self.ladybird_ids = ladybird_ids
+        self.size = size
+        self.convert = convert
+        self.store = store
+        self.done = done
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def load(self, image_path):
+        image = decode_tile(image_path, self.size, self.size, False)
+        return None if image.isNull() else self.convert(image)
+
+    def run(self):
+        done = 0
+        with ThreadPoolExecutor(self.workers) as executor:
+            for start in range(0, len(self.ladybird_ids), self.batch_size):
+                if self.isInterruptionRequested():
+                    break
+                chunk = self.ladybird_ids[start:start + self.batch_size]
+                entries = self.manifest.resolve(chunk)
+                paths = [(ladybird_id, entries[ladybird_id].ladybird_path) for ladybird_id in chunk
+                         if ladybird_id in entries and entries[ladybird_id].ladybird_path]
+                values = executor.map(self.load, [image_path for _, image_path in paths])
+                loaded = [(ladybird_id, value) for (ladybird_id, _), value in zip(paths, values) if value is not None]
+                if loaded:
+                    self.store([ladybird_id for ladybird_id, _ in loaded], [value for _, value in loaded])
+                done += len(chunk)
+                self.progress.emit(done, len(self.ladybird_ids))
+        if self.done is not None:
+            self.done()
@@ -0,0 +1,220 @@
+import os
+import re
+import mmap
+import struct
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, select, Table, Column, String, Integer, MetaData
+from db_ops import chunked
+
+# 이미지 원본을 어디서 읽을지 정하는 층.
+#   DirectorySource: {root}/{id}/ladybirds/, {root}/{id}/patterns/ 아래 파일 (기존 구조)
+#   ShardSource: {root}/shards.index.db 에 (id, 종류) -> (shard, offset, length) 를 두고
+#                큰 tar/zip shard 안의 이미지를 memmap 으로 바로 읽는다 (pack_shards.py 로 만든다)
+# shard 안의 이미지는 '{shard 경로}#{offset}:{length}' 문자열을 경로처럼 쓰므로
+# manifest, 썸네일 캐시, 디코딩 코드는 파일과 똑같이 다룬다
+SHARD_INDEX = 'shards.index.db'
+MEMBER_PATTERN = re.compile(r'^(.+\.(?:tar|zip))#(\d+):(\d+)$')
+KINDS = ('ladybirds', 'patterns')
+
+index_metadata = MetaData()
+
+shard_members_table = Table('members', index_metadata,
+                            Column('name', String, primary_key=True),  # shard 안의 '{id}/{ladybirds|patterns}/{파일}'
+                            Column('id', String, index=True),
+                            Column('kind', String),
+                            Column('shard', String),  # root 기준 상대 경로
+                            Column('seq', Integer),  # shard 안의 순서 (디렉터리의 첫 파일을 고르는 데 쓴다)
+                            Column('offset', Integer),
+                            Column('length', Integer))
+
+def member_path(shard_path, offset, length):
+    return f'{shard_path}#{offset}:{length}'
+
+def split_member_path(path):
+    # shard 멤버 경로면 (shard 경로, offset, length), 아니면 None
+    match = MEMBER_PATTERN.match(path)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2)), int(match.group(3))
+
+shard_maps = {}
+shard_maps_lock = threading.Lock()
+
+def shard_map(shard_path):
+    # shard 는 프로세스마다 한 번만 memmap 한다 (prewarm 워커 프로세스에서도 각자 연다)
+    with shard_maps_lock:
+        mapped = shard_maps.get(shard_path)
+        if mapped is None:
+            with open(shard_path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            shard_maps[shard_path] = mapped
+        return mapped
+
+def read_member(path):
+    shard_path, offset, length = split_member_path(path)
+    return memoryview(shard_map(shard_path))[offset:offset + length]
+
+def image_reader(path):
+    # 파일이나 shard 멤버를 읽는 QImageReader. 원본이 없으면 None
+    # Qt 는 디코딩할 때만 불러온다 (pack_shards.py, 썸네일 캐시, manifest 는 바이트/경로만 다룬다)
+    from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+    from PyQt5.QtGui import QImageReader
+    member = split_member_path(path)
+    if member is None:
+        return QImageReader(path) if os.path.exists(path) else None
+    try:
+        data = read_member(path)
+    except OSError:
+        return None
+    # Qt 는 자기 QByteArray 가 있어야 읽을 수 있어서 memmap slice 를 여기서 한 번 복사한다
+    buffer = QBuffer()
+    buffer.setData(QByteArray(data.tobytes()))
+    buffer.open(QIODevice.ReadOnly)
+    reader = QImageReader(buffer)
+    reader.buffer = buffer  # reader 가 읽는 동안 buffer 가 살아 있어야 한다
+    return reader
+
+def source_stat(path):
+    # 썸네일 캐시 키로 쓰는 (mtime, size). shard 멤버는 shard 의 mtime 과 멤버 길이
+    member = split_member_path(path)
+    if member is None:
+        st = os.stat(path)
+        return st.st_mtime, st.st_size
+    return os.stat(member[0]).st_mtime, member[2]
+
+def path_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def entry_row(ladybird_id, ladybird=(None, None, None), pattern=(None, None, None), versions=(None, None)):
+    # manifest 에 저장하는 한 줄. versions 는 refresh 가 바뀐 id 를 찾을 때 비교하는 값
+    return dict(id=ladybird_id,
+                ladybird_path=ladybird[0], ladybird_size=ladybird[1], ladybird_mtime=ladybird[2],
+                pattern_path=pattern[0], pattern_size=pattern[1], pattern_mtime=pattern[2],
+                ladybirds_dir_mtime=versions[0], patterns_dir_mtime=versions[1])
+
+def first_file(path):
+    # os.listdir(path)[0] 과 같은 파일을 고르되 stat 을 같이 얻는다
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                st = entry.stat()
+                return entry.path, st.st_size, st.st_mtime
+    except OSError:
+        pass
+    return None, None, None
+
+class DirectorySource:
+    kind = 'directory tree'
+
+    def __init__(self, root, workers=32):
+        self.root = root
+        self.workers = workers
+
+    def scan_entry(self, ladybird_id):
+        base_path = os.path.join(self.root, ladybird_id)
+        return entry_row(ladybird_id,
+                         first_file(os.path.join(base_path, 'ladybirds')),
+                         first_file(os.path.join(base_path, 'patterns')),
+                         self.versions(ladybird_id))
+
+    def scan_entries(self, ladybird_ids):
+        # 순서대로 하나씩 돌려주므로 호출하는 쪽에서 진행률을 보여줄 수 있다
+        if len(ladybird_ids) == 1:
+            yield self.scan_entry(ladybird_ids[0])
+            return
+        with ThreadPoolExecutor(self.workers) as executor:
+            yield from executor.map(self.scan_entry, ladybird_ids)
+
+    def list_ids(self):
+        try:
+            with os.scandir(self.root) as entries:
+                return [entry.name for entry in entries if entry.is_dir()]
+        except OSError:
+            return []
+
+    def versions(self, ladybird_id):
+        base_path = os.path.join(self.root, ladybird_id)
+        return path_mtime(os.path.join(base_path, 'ladybirds')), path_mtime(os.path.join(base_path, 'patterns'))
+
+class ShardSource:
+    kind = 'shard archive'
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, SHARD_INDEX)
+        self.engine = create_engine(f'sqlite:///{self.index_path}', connect_args={'check_same_thread': False})
+        # 인덱스를 다시 만들면 (shard 추가) 모든 id 를 다시 읽는다
+        self.version = path_mtime(self.index_path)
+        self.shard_mtimes = {}
+
+    def shard_mtime(self, shard_path):
+        if shard_path not in self.shard_mtimes:
+            self.shard_mtimes[shard_path] = path_mtime(shard_path)
+        return self.shard_mtimes[shard_path]
+
+    def scan_entries(self, ladybird_ids):
+        # 디렉터리마다 첫 파일을 고르는 것처럼 (id, 종류) 마다 shard 순서상 첫 멤버를 쓴다
+        table = shard_members_table
+        with self.engine.connect() as connection:
+            for chunk in chunked(ladybird_ids):
+                found = {}
+                query = select(table.c.id, table.c.kind, table.c.shard, table.c.offset, table.c.length) \
+                    .where(table.c.id.in_(chunk)).order_by(table.c.shard, table.c.seq)
+                for member in connection.execute(query):
+                    shard_path = os.path.join(self.root, member.shard)
+                    found.setdefault((member.id, member.kind),
+                                     (member_path(shard_path, member.offset, member.length), member.length, self.shard_mtime(shard_path)))
+                for ladybird_id in chunk:
+                    yield entry_row(ladybird_id,
+                                    found.get((ladybird_id, 'ladybirds'), (None, None, None)),
+                                    found.get((ladybird_id, 'patterns'), (None, None, None)),
+                                    self.versions(ladybird_id))
+
+    def list_ids(self):
+        with self.engine.connect() as connection:
+            return [row.id for row in connection.execute(select(shard_members_table.c.id).distinct())]
+
+    def versions(self, ladybird_id):
+        return self.version, self.version
+
+def open_source(root, workers=32):
+    # root 에 shard 인덱스가 있으면 shard 백엔드, 아니면 디렉터리 백엔드
+    if os.path.exists(os.path.join(root, SHARD_INDEX)):
+        return ShardSource(root)
+    return DirectorySource(root, workers)
+
+def tar_members(shard_path):
+    # (이름, 데이터 offset, 길이). tar 는 압축하지 않으므로 데이터가 그대로 들어 있다
+    with tarfile.open(shard_path, 'r:') as tar:
+        for info in tar:
+            if info.isfile():
+                yield info.name, info.offset_data, info.size
+
+def zip_members(shard_path):
+    # 압축하지 않은 (ZIP_STORED) 멤버만 slice 로 읽을 수 있다
+    with zipfile.ZipFile(shard_path) as archive, open(shard_path, 'rb') as f:
+        for info in archive.infolist():
+            if info.is_dir() or info.compress_type != zipfile.ZIP_STORED:
+                continue
+            # 데이터 offset = local header 위치 + 30 + 파일 이름 길이 + extra 길이
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            yield info.filename, info.header_offset + 30 + name_length + extra_length, info.file_size
+
+def shard_rows(root, shard_path):
+    # shard 안의 '{id}/{ladybirds|patterns}/{파일}' 멤버를 인덱스 행으로 만든다 (다른 도구로 만든 shard 도 된다)
+    members = zip_members(shard_path) if shard_path.endswith('.zip') else tar_members(shard_path)
+    shard = os.path.relpath(shard_path, root)
+    rows = []
+    for seq, (name, offset, length) in enumerate(members):
+        parts = name.split('/')
+        if len(parts) >= 3 and parts[-2] in KINDS:
+            rows.append(dict(name=f'{shard}:{name}', id=parts[-3], kind=parts[-2], shard=shard,
+                             seq=seq, offset=offset, length=length))
+    return rows
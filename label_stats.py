@@ -0,0 +1,62 @@
+from collections import Counter
+from sqlalchemy import func
+from create_db import LadybirdDB
+
+class LabelStats:
+    # 클래스 목록과 개수를 GROUP BY 한 번으로 읽고 이후에는 증분으로 갱신한다
+    def __init__(self):
+        self.counts = Counter()
+        self.listeners = []
+
+    def load(self, session):
+        rows = session.query(LadybirdDB.class_, func.count()).group_by(LadybirdDB.class_).all()
+        self.counts = Counter(dict(rows))
+        self.notify()
+
+    def classes(self):
+        return {cls if cls else 'None' for cls in self.counts}
+
+    def labels(self):
+        return [(label, count) for label, count in self.counts.items() if label and count > 0]
+
+    def add_class(self, cls):
+        if cls not in self.counts:
+            self.counts[cls] = 0
+            self.notify()
+
+    def apply_retag(self, previous, new_class):
+        self.counts.subtract(previous)
+        self.counts[new_class] += sum(previous.values())
+        self.notify()
+
+    def apply_delete(self, previous):
+        self.counts.subtract(previous)
+        self.notify()
+
+    def correct(self, assumed, actual, new_class=None):
+        # 먼저 반영한 이전 클래스 (assumed) 가 커밋할 때의 값 (actual) 과 다르면
+        # (그 사이 다른 창이 같은 id 를 바꾸거나 지웠으면) 커밋된 값으로 고친다
+        self.counts.update(assumed)
+        self.counts.subtract(actual)
+        if new_class is not None:
+            self.counts[new_class] += sum(actual.values()) - sum(assumed.values())
+        self.notify()
+
+    def apply_changes(self, changes):
+        # 다른 창에서 커밋한 변경 (change_feed.Change)
+        for change in changes:
+            self.counts[change.previous_class] -= 1
+            if change.kind == 'tag':
+                self.counts[change.new_class] += 1
+        self.notify()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self):
+        for listener in list(self.listeners):
+            listener()
@@ -0,0 +1,159 @@
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event, Column, String, Integer, Float
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db_ops import chunked
+from image_source import open_source
+
+ManifestBase = declarative_base()
+
+DATA_ROOT = os.environ.get('TAG_BUG_DATA_ROOT', '/data1/lpf/augmented_230823')
+
+ManifestEntry = namedtuple('ManifestEntry', ['ladybird_path', 'ladybird_size', 'ladybird_mtime',
+                                             'pattern_path', 'pattern_size', 'pattern_mtime'])
+
+MISSING_ENTRY = ManifestEntry(None, None, None, None, None, None)
+
+class ManifestDB(ManifestBase):
+    __tablename__ = 'manifest'
+    id = Column(String, primary_key=True)
+    ladybird_path = Column(String)
+    ladybird_size = Column(Integer)
+    ladybird_mtime = Column(Float)
+    pattern_path = Column(String)
+    pattern_size = Column(Integer)
+    pattern_mtime = Column(Float)
+    # refresh 가 바뀐 id 를 찾을 때 비교하는 값 (디렉터리 백엔드는 디렉터리 mtime, shard 백엔드는 인덱스 mtime)
+    ladybirds_dir_mtime = Column(Float)
+    patterns_dir_mtime = Column(Float)
+
+class ManifestMetaDB(ManifestBase):
+    __tablename__ = 'manifest_meta'
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+def row_to_entry(row):
+    return ManifestEntry(row['ladybird_path'], row['ladybird_size'], row['ladybird_mtime'],
+                         row['pattern_path'], row['pattern_size'], row['pattern_mtime'])
+
+def manifest_path_for(db_path):
+    return os.path.splitext(db_path)[0] + '.manifest.db'
+
+class DatasetManifest:
+    # id -> ladybird/pattern 이미지 경로, 크기, mtime. UI 의 경로 조회는 모두 여기를 거친다.
+    # 경로는 root 의 이미지 소스 (디렉터리 또는 shard, image_source 참고) 에서 읽어 온다
+    def __init__(self, db_path, root, workers=32):
+        self.root = root
+        self.workers = workers
+        self.source = open_source(root, workers)
+        self.path = manifest_path_for(db_path)
+        self.engine = create_engine(f'sqlite:///{self.path}', connect_args={'check_same_thread': False})
+        event.listen(self.engine, 'connect', self._on_connect)
+        ManifestBase.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.check_root()
+
+    def check_root(self):
+        # 다른 root (또는 shard 로 바꾼 root) 로 열면 저장된 경로가 맞지 않으므로 비운다
+        with self.Session() as session:
+            stored = session.get(ManifestMetaDB, 'root')
+            if stored is not None and stored.value == self.root:
+                return
+            if stored is not None:
+                session.query(ManifestDB).delete()
+            session.merge(ManifestMetaDB(key='root', value=self.root))
+            session.commit()
+
+    @staticmethod
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+    def lookup(self, ladybird_id):
+        return self.resolve([ladybird_id]).get(ladybird_id, MISSING_ENTRY)
+
+    def resolve(self, ladybird_ids):
+        found = {}
+        missing = []
+        with self.lock:
+            for ladybird_id in ladybird_ids:
+                entry = self.entries.get(ladybird_id)
+                if entry is None:
+                    missing.append(ladybird_id)
+                else:
+                    found[ladybird_id] = entry
+        if missing:
+            stored = self.load(missing)
+            found.update(stored)
+            # manifest 에 없는 id 만 디렉터리를 읽는다
+            unknown = [ladybird_id for ladybird_id in missing if ladybird_id not in stored]
+            if unknown:
+                found.update(self.scan(unknown))
+        return found
+
+    def load(self, ladybird_ids):
+        loaded = {}
+        with self.Session() as session:
+            for chunk in chunked(ladybird_ids):
+                for row in session.query(ManifestDB).filter(ManifestDB.id.in_(chunk)):
+                    loaded[row.id] = ManifestEntry(row.ladybird_path, row.ladybird_size, row.ladybird_mtime,
+                                                   row.pattern_path, row.pattern_size, row.pattern_mtime)
+        with self.lock:
+            self.entries.update(loaded)
+        return loaded
+
+    def scan(self, ladybird_ids, progress=None):
+        scanned = {}
+        rows = []
+        for done, row in enumerate(self.source.scan_entries(ladybird_ids), 1):
+            rows.append(row)
+            scanned[row['id']] = row_to_entry(row)
+            if progress is not None and done % 1000 == 0:
+                progress(done, len(ladybird_ids))
+        self.store(rows)
+        with self.lock:
+            self.entries.update(scanned)
+        if progress is not None:
+            progress(len(ladybird_ids), len(ladybird_ids))
+        return scanned
+
+    def store(self, rows):
+        if not rows:
+            return
+        with self.Session() as session:
+            for chunk in chunked(rows, 5000):
+                statement = sqlite_insert(ManifestDB)
+                statement = statement.on_conflict_do_update(
+                    index_elements=['id'],
+                    set_={column: statement.excluded[column] for column in chunk[0] if column != 'id'})
+                session.execute(statement, chunk)
+            session.commit()
+
+    def refresh(self, progress=None):
+        # 디렉터리 mtime (shard 면 인덱스 mtime) 이 바뀐 id 만 다시 읽고, root 에 새로 생긴 id 를 추가한다
+        with self.Session() as session:
+            known = {row.id: (row.ladybirds_dir_mtime, row.patterns_dir_mtime)
+                     for row in session.query(ManifestDB.id, ManifestDB.ladybirds_dir_mtime, ManifestDB.patterns_dir_mtime)}
+        # shard 인덱스를 다시 만들었을 수 있으므로 소스를 새로 연다
+        self.source = open_source(self.root, self.workers)
+        on_disk = self.source.list_ids()
+
+        def changed(ladybird_id):
+            return self.source.versions(ladybird_id) != known.get(ladybird_id)
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            candidates = list(set(on_disk) | set(known))
+            stale = [ladybird_id for ladybird_id, is_changed in zip(candidates, executor.map(changed, candidates)) if is_changed]
+        with self.lock:
+            for ladybird_id in stale:
+                self.entries.pop(ladybird_id, None)
+        self.scan(stale, progress)
+        return len(stale)
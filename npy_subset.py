@@ -0,0 +1,161 @@
+import json
+import numpy as np
+from sqlalchemy import Table, Column, String, MetaData, text
+from create_db import LadybirdDB
+from db_ops import chunked
+
+subset_metadata = MetaData()
+
+# NPY 로 불러온 id 는 세션 connection 의 임시 테이블에 한 번만 써 두고 join 한다
+npy_subset_table = Table('npy_subset', subset_metadata, Column('id', String, primary_key=True),
+                         prefixes=['TEMPORARY'], sqlite_with_rowid=False)
+
+def id_from_path(value):
+    # '/data1/lpf/augmented_230823/{id}/...' 형식의 경로면 id 만 꺼낸다
+    value = str(value)
+    return value.split('/')[4] if '/' in value else value
+
+def locate_ids(codes, slash):
+    # 행마다 '/' 개수를 누적해서 네 번째 '/' 와 다섯 번째 '/' 사이를 찾는다 ('/' 가 없으면 값 전체)
+    is_slash = codes == slash
+    slashes = np.cumsum(is_slash, axis=1, dtype=np.uint8)
+    in_id = np.where(slashes[:, -1:] > 0, (slashes == 4) & ~is_slash, codes != 0)
+    return in_id.argmax(axis=1), in_id.sum(axis=1)
+
+def locate_ids_after(codes, slash, start):
+    # 데이터셋 경로는 앞부분 (/data1/lpf/augmented_230823/) 길이가 보통 같으므로
+    # id 가 start 에서 시작하는지 앞부분만 확인하고, 끝은 다음 '/' 까지만 찾는다
+    head = codes[:, :start]
+    matches = ((head == slash).sum(axis=1) == 4) & (head[:, -1] == slash)
+    tail = codes[:, start:]
+    stop = (tail == slash) | (tail == 0)
+    lengths = np.where(stop.any(axis=1), stop.argmax(axis=1), tail.shape[1])
+    return matches, lengths
+
+def extract_ids(values, chunk_size=1 << 18):
+    # id_from_path 와 같은 규칙을 고정 길이 문자열 배열에 NumPy 로 한 번에 적용한다.
+    # 정수 id 배열은 그대로 문자열로 바꾼다. 결과는 'S' (ASCII) 배열
+    values = np.asarray(values).reshape(-1)
+    if values.dtype.kind in 'iu':
+        return values.astype('S')
+    if values.dtype.kind == 'O':
+        values = values.astype('U')
+    if values.dtype.kind not in 'SU':
+        raise ValueError(f"Unsupported NPY dtype: {values.dtype}")
+    code_type = np.uint32 if values.dtype.kind == 'U' else np.uint8
+    width = values.dtype.itemsize // np.dtype(code_type).itemsize
+    slash = ord('/')
+    parts = []
+    for offset in range(0, len(values), chunk_size):
+        codes = np.ascontiguousarray(values[offset:offset + chunk_size]).view(code_type).reshape(-1, width)
+        if not (codes == slash).any():
+            # 이미 id 만 들어 있는 배열
+            picked = codes
+        else:
+            starts, lengths = locate_ids(codes[:1], slash)
+            if lengths[0] > 0 and starts[0] > 0:
+                matches, lengths = locate_ids_after(codes, slash, int(starts[0]))
+                starts = np.full(len(codes), starts[0])
+                if not matches.all():
+                    starts[~matches], lengths[~matches] = locate_ids(codes[~matches], slash)
+            else:
+                starts, lengths = locate_ids(codes, slash)
+            length = max(int(lengths.max(initial=0)), 1)
+            positions = np.minimum(starts[:, None] + np.arange(length), width - 1)
+            picked = np.take_along_axis(codes, positions, axis=1)
+            picked[np.arange(length) >= lengths[:, None]] = 0
+        if code_type is np.uint32:
+            if (picked > 127).any():
+                raise ValueError("Ids must be ASCII")
+            picked = picked.astype(np.uint8)
+        parts.append(np.ascontiguousarray(picked).view(f'S{picked.shape[1]}').reshape(-1))
+    if not parts:
+        return np.array([], dtype='S1')
+    return np.concatenate(parts)
+
+def open_npy(npy_path):
+    # 고정 길이 문자열/정수 배열은 memmap 으로 열어 복사 없이 읽는다.
+    # 예전 형식 (object 배열) 만 pickle 로 읽는다
+    try:
+        return np.load(npy_path, mmap_mode='r')
+    except ValueError:
+        return np.load(npy_path, allow_pickle=True)
+
+def load_npy_ids(npy_path):
+    ladybird_ids = extract_ids(open_npy(npy_path))
+    # 저장한 subset 처럼 이미 정렬되어 있으면 다시 정렬하지 않는다
+    if len(ladybird_ids) > 1 and not (ladybird_ids[1:] > ladybird_ids[:-1]).all():
+        ladybird_ids = np.unique(ladybird_ids)
+    return ladybird_ids[ladybird_ids != b'']
+
+def save_npy_ids(npy_path, ladybird_ids):
+    # pickle 없이 정렬된 고정 길이 ASCII ('S') 배열로 저장한다. load_npy_ids 가 memmap 으로 바로 읽는다
+    np.save(npy_path, np.asarray(ladybird_ids, dtype='S'), allow_pickle=False)
+
+class NpySubset:
+    # id 는 정렬된 'S' 배열과 살아 있는지 표시하는 mask 로 들고 있는다.
+    # 포함 여부는 searchsorted, 제거는 mask 만 끈다
+    def __init__(self, ladybird_ids):
+        ladybird_ids = np.asarray(ladybird_ids, dtype='S')
+        if len(ladybird_ids) > 1 and not (ladybird_ids[1:] > ladybird_ids[:-1]).all():
+            ladybird_ids = np.unique(ladybird_ids)
+        self.sorted_ids = ladybird_ids
+        self.alive = np.ones(len(ladybird_ids), dtype=bool)
+        self.count = len(ladybird_ids)
+        self.session = None
+
+    def __len__(self):
+        return self.count
+
+    def positions(self, ladybird_ids):
+        # 살아 있는 id 면 sorted_ids 의 위치, 아니면 -1
+        query = np.asarray(ladybird_ids, dtype='S')
+        if len(self.sorted_ids) == 0 or len(query) == 0:
+            return np.full(len(query), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_ids, query), len(self.sorted_ids) - 1)
+        found = (self.sorted_ids[positions] == query) & self.alive[positions]
+        return np.where(found, positions, -1)
+
+    def contains(self, ladybird_ids):
+        return self.positions(ladybird_ids) >= 0
+
+    def __contains__(self, ladybird_id):
+        return bool(self.contains([ladybird_id])[0])
+
+    def ids(self):
+        return self.sorted_ids[self.alive]
+
+    def attach(self, session, chunk_size=100000):
+        self.session = session
+        session.execute(text('DROP TABLE IF EXISTS temp.npy_subset'))
+        npy_subset_table.create(session.connection())
+        # 한 줄씩 bind 하지 않고 chunk 를 JSON 배열 하나로 넘겨 SQLite 안에서 펼친다
+        insert = text('INSERT OR IGNORE INTO temp.npy_subset (id) SELECT value FROM json_each(:ids)')
+        ladybird_ids = self.ids()
+        for start in range(0, len(ladybird_ids), chunk_size):
+            session.execute(insert, {'ids': json.dumps(ladybird_ids[start:start + chunk_size].astype('U').tolist())})
+        session.commit()
+
+    def detach(self):
+        if self.session is not None:
+            self.session.execute(text('DROP TABLE IF EXISTS temp.npy_subset'))
+            self.session.commit()
+            self.session = None
+
+    def filter(self, query):
+        return query.join(npy_subset_table, npy_subset_table.c.id == LadybirdDB.id)
+
+    def remove(self, ladybird_ids):
+        positions = self.positions(list(ladybird_ids))
+        positions = np.unique(positions[positions >= 0])
+        self.alive[positions] = False
+        self.count -= len(positions)
+        removed = self.sorted_ids[positions].astype('U').tolist()
+        if self.session is not None and removed:
+            for chunk in chunked(removed):
+                self.session.execute(npy_subset_table.delete().where(npy_subset_table.c.id.in_(chunk)))
+            self.session.commit()
+        return len(removed)
+
+    def save(self, npy_path):
+        save_npy_ids(npy_path, self.ids())
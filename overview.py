@@ -0,0 +1,211 @@
+import numpy as np
+from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QScrollArea, QPushButton, QCheckBox, QProgressBar, QRubberBand, QSpinBox
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtCore import Qt, QTimer, QRect, QSize, pyqtSignal
+from create_db import LadybirdDB
+from atlas import image_to_tile, class_color, mosaic_to_image
+from image_loader import DecodeThread
+
+class MosaicLabel(QLabel):
+    region_selected = pyqtSignal(QRect)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rubber_band = QRubberBand(QRubberBand.Rectangle, self)
+        self.origin = None
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.origin = event.pos()
+            self.rubber_band.setGeometry(QRect(self.origin, QSize()))
+            self.rubber_band.show()
+
+    def mouseMoveEvent(self, event):
+        if self.origin is not None:
+            self.rubber_band.setGeometry(QRect(self.origin, event.pos()).normalized())
+
+    def mouseReleaseEvent(self, event):
+        if self.origin is not None:
+            self.rubber_band.hide()
+            self.region_selected.emit(QRect(self.origin, event.pos()).normalized())
+            self.origin = None
+
+class OverviewWindow(QMainWindow):
+    # 현재 필터에 맞는 표본 수천 개를 아틀라스에서 모자이크 한 장으로 보여준다.
+    # 영역을 드래그하면 그 id 들로 태깅 격자를 연다
+    def __init__(self, main_window, atlas, max_tiles=10000):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.atlas = atlas
+        self.layout_ids = []
+        self.layout_classes = []
+        self.columns = 1
+        self.zoom = 1.0
+        self.mosaic = None
+        self.build_thread = None
+        self.initUI(max_tiles)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.render_mosaic)
+
+    def initUI(self, max_tiles):
+        self.setWindowTitle('Mosaic Overview')
+        self.setGeometry(150, 150, 1000, 800)
+
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        main_layout = QVBoxLayout(central_widget)
+
+        controls = QHBoxLayout()
+        self.group_check = QCheckBox('Group by class')
+        self.group_check.setChecked(True)
+        self.group_check.toggled.connect(self.load)
+        controls.addWidget(self.group_check)
+        self.tint_check = QCheckBox('Color by class')
+        self.tint_check.setChecked(True)
+        self.tint_check.toggled.connect(self.render_mosaic)
+        controls.addWidget(self.tint_check)
+        controls.addWidget(QLabel('Max tiles:'))
+        self.max_tiles_input = QSpinBox()
+        self.max_tiles_input.setRange(100, 200000)
+        self.max_tiles_input.setSingleStep(1000)
+        self.max_tiles_input.setValue(max_tiles)
+        self.max_tiles_input.editingFinished.connect(self.load)
+        controls.addWidget(self.max_tiles_input)
+        zoom_in_button = QPushButton('Zoom In')
+        zoom_in_button.clicked.connect(lambda: self.set_zoom(self.zoom * 2))
+        controls.addWidget(zoom_in_button)
+        zoom_out_button = QPushButton('Zoom Out')
+        zoom_out_button.clicked.connect(lambda: self.set_zoom(self.zoom / 2))
+        controls.addWidget(zoom_out_button)
+        controls.addStretch()
+        main_layout.addLayout(controls)
+
+        self.legend_label = QLabel()
+        self.legend_label.setWordWrap(True)
+        main_layout.addWidget(self.legend_label)
+
+        self.mosaic_label = MosaicLabel()
+        self.mosaic_label.region_selected.connect(self.open_region)
+        scroll_area = QScrollArea()
+        scroll_area.setWidget(self.mosaic_label)
+        main_layout.addWidget(scroll_area)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.hide()
+        main_layout.addWidget(self.progress_bar)
+
+    def load(self):
+        # 클래스마다 같은 개수까지만 가져와서 작은 클래스도 모자이크에 보이게 한다
+        main_window = self.main_window
+        if not main_window.db_session:
+            return
+        classes = sorted(main_window.class_filters)
+        per_class = max(1, self.max_tiles_input.value() // max(1, len(classes)))
+        self.layout_ids = []
+        self.layout_classes = []
+        counts = {}
+        for cls in classes:
+            rows = (main_window.build_query().filter(LadybirdDB.class_ == cls)
+                    .with_entities(LadybirdDB.id).order_by(LadybirdDB.id).limit(per_class).all())
+            counts[cls] = len(rows)
+            self.layout_ids.extend(row.id for row in rows)
+            self.layout_classes.extend([cls] * len(rows))
+        self.columns = max(1, int(np.ceil(np.sqrt(len(self.layout_ids)))))
+        if self.group_check.isChecked():
+            self.group_rows()
+        self.legend_label.setText('  '.join(
+            f"<span style='background-color: rgb({', '.join(map(str, class_color(cls)))})'>&nbsp;&nbsp;&nbsp;</span> {cls}: {count}"
+            for cls, count in counts.items() if count))
+        self.render_mosaic()
+        self.build_missing()
+
+    def group_rows(self):
+        # 클래스가 바뀌면 다음 줄에서 시작하도록 빈칸을 넣는다
+        ladybird_ids, classes = [], []
+        for ladybird_id, cls in zip(self.layout_ids, self.layout_classes):
+            if classes and classes[-1] != cls and len(classes) % self.columns:
+                padding = self.columns - len(classes) % self.columns
+                ladybird_ids.extend([None] * padding)
+                classes.extend([classes[-1]] * padding)
+            ladybird_ids.append(ladybird_id)
+            classes.append(cls)
+        self.layout_ids, self.layout_classes = ladybird_ids, classes
+
+    def build_missing(self):
+        ladybird_ids = [ladybird_id for ladybird_id in self.layout_ids if ladybird_id is not None]
+        missing = [ladybird_id for ladybird_id, slot in zip(ladybird_ids, self.atlas.lookup(ladybird_ids)) if slot < 0]
+        if not missing or self.main_window.manifest is None:
+            return
+        self.stop_build()
+        self.progress_bar.setMaximum(len(missing))
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        # 아틀라스에 없는 id 의 썸네일을 백그라운드에서 디코딩해 채운다
+        size = self.atlas.tile_size
+        self.build_thread = DecodeThread(self.main_window.manifest, missing, size,
+                                         lambda image: image_to_tile(image, size),
+                                         lambda ladybird_ids, tiles: self.atlas.add(ladybird_ids, np.stack(tiles)),
+                                         self.atlas.flush, self)
+        self.build_thread.progress.connect(self.on_build_progress)
+        self.build_thread.finished.connect(self.on_build_finished)
+        self.build_thread.start()
+        self.refresh_timer.start()
+
+    def on_build_progress(self, done, total):
+        self.progress_bar.setValue(done)
+
+    def on_build_finished(self):
+        self.refresh_timer.stop()
+        self.progress_bar.hide()
+        self.render_mosaic()
+
+    def stop_build(self):
+        if self.build_thread is not None and self.build_thread.isRunning():
+            self.build_thread.requestInterruption()
+            self.build_thread.wait()
+
+    def render_mosaic(self):
+        if not self.layout_ids:
+            self.mosaic_label.clear()
+            return
+        tint = 0.35 if self.tint_check.isChecked() else 0
+        array, self.columns = self.atlas.mosaic(self.layout_ids, self.layout_classes, self.columns, tint)
+        self.mosaic = QPixmap.fromImage(mosaic_to_image(array))
+        self.set_zoom(self.zoom)
+
+    def set_zoom(self, zoom):
+        self.zoom = min(8.0, max(0.125, zoom))
+        if self.mosaic is None:
+            return
+        size = self.mosaic.size() * self.zoom
+        self.mosaic_label.setPixmap(self.mosaic.scaled(size, Qt.KeepAspectRatio, Qt.FastTransformation))
+        self.mosaic_label.resize(size)
+
+    def wheelEvent(self, event):
+        if event.modifiers() & Qt.ControlModifier:
+            self.set_zoom(self.zoom * (2 if event.angleDelta().y() > 0 else 0.5))
+        else:
+            super().wheelEvent(event)
+
+    def open_region(self, rect):
+        # 드래그한 영역(클릭이면 그 칸 하나)의 id 로 태깅 격자를 연다
+        step = self.atlas.tile_size * self.zoom
+        rows = -(-len(self.layout_ids) // self.columns)
+        first_column = max(0, int(rect.left() // step))
+        last_column = min(self.columns - 1, int(rect.right() // step))
+        first_row = max(0, int(rect.top() // step))
+        last_row = min(rows - 1, int(rect.bottom() // step))
+        ladybird_ids = []
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                index = row * self.columns + column
+                if index < len(self.layout_ids) and self.layout_ids[index] is not None:
+                    ladybird_ids.append(self.layout_ids[index])
+        if ladybird_ids:
+            self.main_window.show_ids(ladybird_ids, f'overview region ({len(ladybird_ids)})')
+
+    def closeEvent(self, event):
+        self.refresh_timer.stop()
+        self.stop_build()
+        super().closeEvent(event)
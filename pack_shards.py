@@ -0,0 +1,130 @@
+import argparse
+import io
+import os
+import re
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db_ops import chunked
+from image_source import DirectorySource, SHARD_INDEX, KINDS, index_metadata, shard_members_table, shard_rows
+from tag_cli import Throughput
+
+# {root}/{id}/ladybirds|patterns/ 의 작은 파일들을 큰 tar/zip shard 몇 개와 인덱스 (shards.index.db) 로 묶는다.
+# 결과 디렉터리를 TAG_BUG_DATA_ROOT, File > Set Data Root, prewarm --root 로 쓰면 shard 에서 읽는다.
+# 인덱스에 이미 있는 id 는 건너뛰므로 중단했다가 다시 실행하면 이어서 한다.
+# 출력 디렉터리에 있지만 인덱스에 없는 shard (다른 도구로 만든 tar/zip 포함) 는 먼저 인덱스에 넣는다
+SHARD_NAME = re.compile(r'^shard-(\d+)\.(tar|zip)$')
+
+def read_files(source_root, ladybird_id):
+    # 워커 스레드: id 의 파일을 (shard 안 이름, 내용, mtime) 으로 읽는다.
+    # scandir 순서를 그대로 두어 디렉터리 백엔드와 같은 파일이 '첫 파일' 이 되게 한다
+    files = []
+    for kind in KINDS:
+        try:
+            with os.scandir(os.path.join(source_root, ladybird_id, kind)) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        with open(entry.path, 'rb') as f:
+                            files.append((f'{ladybird_id}/{kind}/{entry.name}', f.read(), entry.stat().st_mtime))
+        except OSError:
+            pass
+    return files
+
+class ShardWriter:
+    # 다 쓴 뒤에 이름을 바꾸므로 중단된 shard 는 .tmp 로 남고 인덱스에 들어가지 않는다
+    def __init__(self, output_root, number, archive_format):
+        self.path = os.path.join(output_root, f'shard-{number:05d}.{archive_format}')
+        self.temp_path = self.path + '.tmp'
+        if archive_format == 'zip':
+            # 압축하면 slice 로 읽을 수 없다 (JPEG/PNG 는 이미 압축되어 있다)
+            self.archive = zipfile.ZipFile(self.temp_path, 'w', zipfile.ZIP_STORED)
+        else:
+            self.archive = tarfile.open(self.temp_path, 'w')
+        self.size = 0
+
+    def add(self, name, data, mtime):
+        if isinstance(self.archive, zipfile.ZipFile):
+            info = zipfile.ZipInfo(name, time.localtime(mtime)[:6])
+            self.archive.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = mtime
+            self.archive.addfile(info, io.BytesIO(data))
+        self.size += len(data)
+
+    def close(self):
+        self.archive.close()
+        os.replace(self.temp_path, self.path)
+        return self.path
+
+def shard_files(output_root):
+    return sorted(name for name in os.listdir(output_root) if SHARD_NAME.match(name))
+
+def store_rows(engine, rows):
+    with engine.begin() as connection:
+        for chunk in chunked(rows, 5000):
+            connection.execute(sqlite_insert(shard_members_table).on_conflict_do_nothing(), chunk)
+
+def index_shard(engine, output_root, shard_path):
+    rows = shard_rows(output_root, shard_path)
+    store_rows(engine, rows)
+    return {row['id'] for row in rows}
+
+def pack(args):
+    os.makedirs(args.output, exist_ok=True)
+    engine = create_engine(f'sqlite:///{os.path.join(args.output, SHARD_INDEX)}')
+    index_metadata.create_all(engine)
+    with engine.connect() as connection:
+        indexed_shards = {row.shard for row in connection.execute(select(shard_members_table.c.shard).distinct())}
+        packed = {row.id for row in connection.execute(select(shard_members_table.c.id).distinct())}
+    shards = shard_files(args.output)
+    for name in shards:
+        if name not in indexed_shards:
+            print(f"indexing {name}", file=sys.stderr)
+            packed |= index_shard(engine, args.output, os.path.join(args.output, name))
+
+    ladybird_ids = sorted(set(DirectorySource(args.source).list_ids()) - packed)
+    number = max((int(SHARD_NAME.match(name).group(1)) for name in shards), default=-1) + 1
+    shard_bytes = args.shard_mb * 1024 * 1024
+    print(f"{len(packed)} ids already packed, {len(ladybird_ids)} to pack into {args.format} shards of {args.shard_mb} MB", file=sys.stderr)
+
+    throughput = Throughput('pack', 10000, unit='ids')
+    writer = None
+    written = 0
+    with ThreadPoolExecutor(args.workers) as executor:
+        for chunk in chunked(ladybird_ids, 1000):
+            for files in executor.map(lambda ladybird_id: read_files(args.source, ladybird_id), chunk):
+                if files and writer is None:
+                    writer = ShardWriter(args.output, number, args.format)
+                    number += 1
+                for name, data, mtime in files:
+                    writer.add(name, data, mtime)
+                # 한 id 의 파일은 한 shard 에 넣는다 (shard 가 인덱스에 들어가야 그 id 가 끝난 것)
+                if writer is not None and writer.size >= shard_bytes:
+                    index_shard(engine, args.output, writer.close())
+                    written += 1
+                    writer = None
+                throughput.add(1)
+    if writer is not None:
+        index_shard(engine, args.output, writer.close())
+        written += 1
+    throughput.report(final=True)
+    print(f"{written} shards written to {args.output}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pack a Tag Bug image directory tree into tar/zip shards with an offset index')
+    parser.add_argument('source', help='dataset root with {id}/ladybirds and {id}/patterns')
+    parser.add_argument('output', help='directory for the shards and shards.index.db (use it as the data root)')
+    parser.add_argument('--format', choices=['tar', 'zip'], default='tar')
+    parser.add_argument('--shard-mb', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=32, help='threads reading the small source files')
+    args = parser.parse_args(argv)
+    pack(args)
+
+if __name__ == '__main__':
+    main()
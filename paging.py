@@ -0,0 +1,110 @@
+from create_db import LadybirdDB
+from db_ops import chunked
+
+class Pager:
+    # OFFSET 대신 마지막으로 본 id 에서 이어서 읽는 keyset 페이지네이션
+    def __init__(self, page_size, index_stride=16):
+        self.page_size = page_size
+        self.index_stride = index_stride
+        self.counts = {}
+        self.boundaries = {}
+
+    def invalidate(self):
+        self.counts.clear()
+        self.boundaries.clear()
+
+    def shift(self, filter_key, ladybird_id):
+        # ladybird_id 와 그 뒤에서만 행이 들어오거나 빠졌을 때: 앞쪽 페이지 경계는 그대로 두고
+        # 개수와 뒤쪽 경계만 다시 읽는다. 다른 필터의 캐시는 버린다
+        bounds = self.boundaries.get(filter_key)
+        self.invalidate()
+        if bounds is not None:
+            self.boundaries[filter_key] = {page: first_id for page, first_id in bounds.items()
+                                           if first_id is None or first_id < ladybird_id}
+
+    def adjust(self, filter_key, ladybird_id, delta):
+        # 바뀐 개수를 이미 알면 (delta) 다시 세지 않고 경계만 shift 한다. delta 가 None 이면 다시 센다
+        count = self.counts.get(filter_key)
+        self.shift(filter_key, ladybird_id)
+        if count is not None and delta is not None:
+            self.counts[filter_key] = count + delta
+
+    def set_page_size(self, page_size):
+        if page_size != self.page_size:
+            self.page_size = page_size
+            self.boundaries.clear()
+
+    def count(self, filter_key, query):
+        if filter_key not in self.counts:
+            self.counts[filter_key] = query.count()
+        return self.counts[filter_key]
+
+    def page_count(self, filter_key, query):
+        return max(1, -(-self.count(filter_key, query) // self.page_size))
+
+    def page_ids(self, filter_key, query, page):
+        query = query.with_entities(LadybirdDB.id).order_by(LadybirdDB.id)
+        first_id = self.boundary(filter_key, query, page)
+        if first_id is None and page > 0:
+            return []
+        if first_id is not None:
+            query = query.filter(LadybirdDB.id >= first_id)
+        # 한 개를 더 읽어 다음 페이지의 시작 id 를 기록한다
+        ladybird_ids = [row.id for row in query.limit(self.page_size + 1)]
+        if len(ladybird_ids) > self.page_size:
+            self.boundaries[filter_key][page + 1] = ladybird_ids.pop()
+        return ladybird_ids
+
+    def neighbours(self, query, ladybird_id, before, after):
+        # 현재 필터에서 ladybird_id 앞뒤의 id (페이지 경계와 상관없이 keyset 으로 찾는다)
+        query = query.with_entities(LadybirdDB.id)
+        previous = [row.id for row in query.filter(LadybirdDB.id < ladybird_id).order_by(LadybirdDB.id.desc()).limit(before)]
+        following = [row.id for row in query.filter(LadybirdDB.id > ladybird_id).order_by(LadybirdDB.id).limit(after)]
+        return previous[::-1], following
+
+    def boundary(self, filter_key, query, page):
+        bounds = self.boundaries.setdefault(filter_key, {0: None})
+        if page in bounds:
+            return bounds[page]
+        # 가장 가까운 앞쪽 경계에서 index_stride 페이지씩 건너뛰며 sparse index 를 채운다
+        known = max(p for p in bounds if p < page)
+        first_id = bounds[known]
+        while known < page:
+            step = min(self.index_stride, page - known)
+            seek = query if first_id is None else query.filter(LadybirdDB.id >= first_id)
+            row = seek.offset(step * self.page_size).limit(1).first()
+            if row is None:
+                return None
+            known += step
+            first_id = row.id
+            bounds[known] = first_id
+        return first_id
+
+class OrderedPager(Pager):
+    # 유사도 순서처럼 미리 정해진 id 순서를 그대로 페이지로 나눈다.
+    # 필터(클래스/태그 변경)에서 빠진 id 는 그 페이지에서만 빠진다
+    def __init__(self, page_size, ordered_ids):
+        super().__init__(page_size)
+        self.ordered_ids = list(ordered_ids)
+        self.positions = {ladybird_id: i for i, ladybird_id in enumerate(self.ordered_ids)}
+
+    def page_count(self, filter_key, query):
+        return max(1, -(-len(self.ordered_ids) // self.page_size))
+
+    def visible_ids(self, query, ladybird_ids):
+        visible = set()
+        for part in chunked(ladybird_ids):
+            visible.update(row.id for row in query.with_entities(LadybirdDB.id).filter(LadybirdDB.id.in_(part)))
+        return [ladybird_id for ladybird_id in ladybird_ids if ladybird_id in visible]
+
+    def page_ids(self, filter_key, query, page):
+        return self.visible_ids(query, self.ordered_ids[page * self.page_size:(page + 1) * self.page_size])
+
+    def neighbours(self, query, ladybird_id, before, after):
+        # 정해진 순서에서 앞뒤로 (필터에서 빠진 것을 감안해 넉넉히) 읽은 뒤 필터에 남은 것만 쓴다
+        position = self.positions.get(ladybird_id)
+        if position is None:
+            return [], []
+        previous = self.visible_ids(query, self.ordered_ids[max(0, position - before * 2):position])
+        following = self.visible_ids(query, self.ordered_ids[position + 1:position + 1 + after * 2])
+        return previous[-before:] if before else [], following[:after]
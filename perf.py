@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from sqlalchemy import event
+
+# 단계별 소요 시간과 사용자 동작별 SQL 문 개수를 잰다.
+# 꺼져 있으면 span() 은 미리 만들어 둔 빈 context manager 를 돌려주므로 비용이 거의 없다.
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    __slots__ = ('profiler', 'name', 'action', 'start', 'statements')
+
+    def __init__(self, profiler, name, action):
+        self.profiler = profiler
+        self.name = name
+        self.action = action
+
+    def __enter__(self):
+        self.statements = self.profiler.statements()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        statements = self.profiler.statements() - self.statements if self.action else None
+        self.profiler.record(self.name, self.start, elapsed, statements)
+        return False
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class Profiler:
+    def __init__(self, history=500):
+        self.enabled = False
+        self.history = history
+        self.samples = defaultdict(lambda: deque(maxlen=self.history))
+        self.sql_counts = defaultdict(lambda: deque(maxlen=self.history))
+        self.last_action = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin = time.perf_counter()
+        self.trace_file = None
+        self.trace_path = None
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def span(self, name):
+        # 페이지 렌더 안의 쿼리/경로 조회/디코딩 같은 단계
+        return Span(self, name, False) if self.enabled else NULL_SPAN
+
+    def action(self, name):
+        # 사용자 동작 하나 (페이지 이동, 태깅, NPY 로드 ...). SQL 문 개수도 같이 기록한다
+        return Span(self, name, True) if self.enabled else NULL_SPAN
+
+    def watch(self, engine):
+        event.listen(engine, 'before_cursor_execute', self.count_statement)
+
+    def count_statement(self, *args):
+        if self.enabled:
+            self.local.statements = getattr(self.local, 'statements', 0) + 1
+
+    def statements(self):
+        # 스레드별로 세므로 워커의 캐시 쿼리는 UI 동작에 섞이지 않는다
+        return getattr(self.local, 'statements', 0)
+
+    def record(self, name, start, elapsed, statements=None):
+        with self.lock:
+            self.samples[name].append(elapsed)
+            if statements is not None:
+                self.sql_counts[name].append(statements)
+                self.last_action = (name, elapsed, statements)
+            if self.trace_file is not None:
+                trace_event = {'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                               'ts': round((start - self.origin) * 1e6), 'dur': round(elapsed * 1e6)}
+                if statements is not None:
+                    trace_event['args'] = {'sql': statements}
+                self.trace_file.write(json.dumps(trace_event) + ',\n')
+
+    def stats(self, name):
+        with self.lock:
+            values = list(self.samples.get(name, ()))
+            sql = list(self.sql_counts.get(name, ()))
+        if not values:
+            return None
+        return {'count': len(values), 'last': values[-1], 'p50': percentile(values, 50),
+                'p95': percentile(values, 95), 'max': max(values),
+                'sql': sum(sql) / len(sql) if sql else None}
+
+    def names(self):
+        with self.lock:
+            return sorted(self.samples)
+
+    def summary(self):
+        lines = []
+        for name in self.names():
+            s = self.stats(name)
+            if s is None:
+                continue
+            line = f"{name:<24} n={s['count']:<5} last={s['last'] * 1000:8.1f}ms p50={s['p50'] * 1000:8.1f}ms p95={s['p95'] * 1000:8.1f}ms"
+            if s['sql'] is not None:
+                line += f" sql={s['sql']:.1f}"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def overlay_text(self):
+        if self.last_action is None:
+            return 'perf: no actions yet'
+        name, elapsed, statements = self.last_action
+        s = self.stats(name)
+        return f"{name}: {elapsed * 1000:.0f}ms, {statements} SQL | p50 {s['p50'] * 1000:.0f}ms p95 {s['p95'] * 1000:.0f}ms (n={s['count']})"
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.sql_counts.clear()
+            self.last_action = None
+
+    def start_trace(self, path):
+        # chrome://tracing / Perfetto 에서 열 수 있는 trace event 형식 (닫는 ']' 는 없어도 된다)
+        self.stop_trace()
+        with self.lock:
+            self.trace_file = open(path, 'w')
+            self.trace_file.write('[\n')
+            self.trace_path = path
+
+    def stop_trace(self):
+        with self.lock:
+            if self.trace_file is not None:
+                self.trace_file.close()
+            self.trace_file = None
+            path, self.trace_path = self.trace_path, None
+        return path
+
+profiler = Profiler()
+
+if os.environ.get('TAG_BUG_PERF', '0') != '0':
+    profiler.enable()
+if os.environ.get('TAG_BUG_PERF_TRACE'):
+    profiler.enable()
+    profiler.start_trace(os.environ['TAG_BUG_PERF_TRACE'])
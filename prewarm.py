@@ -0,0 +1,132 @@
+import argparse
+import os
+import sys
+from collections import defaultdict
+from multiprocessing import Pool
+from sqlalchemy.orm import sessionmaker
+from create_db import LadybirdDB, open_engine
+from db_ops import chunked
+from npy_subset import load_npy_ids
+from manifest import DatasetManifest, DATA_ROOT
+from thumb_cache import ThumbnailCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from image_loader import decode_source, fit_tile, image_to_thumbnail, THUMBNAIL_SIZE, DETAIL_SIZE
+from tag_cli import Throughput
+from similarity import SimilarityIndex, image_features, FEATURE_SIZE
+
+# 새 데이터셋을 받았을 때 UI 가 읽는 썸네일 캐시와 manifest 를 미리 채운다.
+# Qt 위젯 없이 QtGui 의 QImage 만 쓰므로 서버에서도 실행할 수 있다.
+# 이미 최신 타일이 있는 경로는 건너뛰므로 중단했다가 다시 실행하면 이어서 한다
+
+def render(job):
+    # 워커 프로세스: 가장 큰 크기로 한 번만 디코딩하고 작은 크기(와 유사도 특징)는 거기서 줄인다
+    image_path, sizes, with_features = job
+    largest = max(sizes + [FEATURE_SIZE] if with_features else sizes)
+    image, source_size = decode_source(image_path, largest, largest, False)
+    if image.isNull():
+        return image_path, [], None
+    thumbnails = []
+    for size in sizes:
+        image = fit_tile(image, size, size, False)
+        thumbnails.append((size, image_to_thumbnail(image, source_size)))
+    features = image_features(fit_tile(image, FEATURE_SIZE, FEATURE_SIZE, False)) if with_features else None
+    return image_path, thumbnails, features
+
+def load_ids(args):
+    if args.npy:
+        return load_npy_ids(args.npy).astype('U').tolist()
+    engine = open_engine(args.db)
+    with sessionmaker(bind=engine)() as session:
+        query = session.query(LadybirdDB.id)
+        if args.class_:
+            query = query.filter(LadybirdDB.class_.in_(args.class_))
+        ladybird_ids = [row.id for row in query.order_by(LadybirdDB.id)]
+    engine.dispose()
+    return ladybird_ids
+
+def plan_jobs(cache, entries, ladybird_sizes, pattern_sizes, feature_paths):
+    # 경로마다 아직 캐시에 없는 크기만 모은다. (작업 목록, 이미 캐시에 있던 타일 수)
+    wanted = defaultdict(set, {image_path: set() for image_path in feature_paths})
+    hits = 0
+    for attribute, sizes in (('ladybird_path', ladybird_sizes), ('pattern_path', pattern_sizes)):
+        paths = [getattr(entry, attribute) for entry in entries.values() if getattr(entry, attribute)]
+        for size in sizes:
+            cached = cache.cached_paths(paths, size, size, False)
+            hits += len(cached)
+            for image_path in paths:
+                if image_path not in cached:
+                    wanted[image_path].add(size)
+    jobs = [(image_path, sorted(sizes, reverse=True), image_path in feature_paths) for image_path, sizes in wanted.items()]
+    return jobs, hits
+
+def prewarm(args):
+    ladybird_ids = load_ids(args)
+    manifest = DatasetManifest(args.db, args.root)
+    cache = ThumbnailCache(args.cache_dir, args.cache_mb * 1024 * 1024)
+    # 기본은 격자 타일과 디테일 창 크기 (디테일 창도 원본 대신 캐시를 읽는다)
+    ladybird_sizes = sorted(set(args.size or [THUMBNAIL_SIZE, DETAIL_SIZE]))
+    pattern_sizes = [args.pattern_size] if args.pattern_size else []
+    index = SimilarityIndex(args.db) if args.features else None
+    print(f"{len(ladybird_ids)} ids, tile sizes {ladybird_sizes}, pattern size {pattern_sizes or 'skipped'}, "
+          f"{args.workers} workers, cache {cache.cache_path}", file=sys.stderr)
+
+    throughput = Throughput('prewarm', args.chunk_size, unit='ids')
+    decoded = cached = failed = 0
+    with Pool(args.workers) as pool:
+        for chunk in chunked(ladybird_ids, args.chunk_size):
+            # manifest 에 없는 id 는 여기서 디렉터리를 읽어 manifest 에 저장된다
+            entries = manifest.resolve(chunk)
+            for entry in entries.values():
+                cache.remember_source(entry.ladybird_path, entry.ladybird_mtime, entry.ladybird_size)
+                cache.remember_source(entry.pattern_path, entry.pattern_mtime, entry.pattern_size)
+            feature_paths = {}
+            if index is not None:
+                # 유사도 인덱스에 없는 id 의 ladybird 이미지 -> id
+                ids_with_path = [ladybird_id for ladybird_id in chunk if entries.get(ladybird_id) and entries[ladybird_id].ladybird_path]
+                feature_paths = {entries[ladybird_id].ladybird_path: ladybird_id
+                                 for ladybird_id, slot in zip(ids_with_path, index.lookup(ids_with_path)) if slot < 0}
+            jobs, hits = plan_jobs(cache, entries, ladybird_sizes, pattern_sizes, feature_paths)
+            cached += hits
+            results = defaultdict(list)
+            features = []
+            for image_path, thumbnails, feature in pool.imap_unordered(render, jobs, chunksize=16):
+                if not thumbnails and feature is None:
+                    failed += 1
+                    continue
+                decoded += 1
+                for size, thumbnail in thumbnails:
+                    results[size].append((image_path, thumbnail))
+                if feature is not None:
+                    features.append((feature_paths[image_path], feature))
+            # 캐시 DB 에는 부모 프로세스만 쓴다 (chunk 단위로 커밋되므로 중단해도 그때까지는 남는다)
+            for size, items in results.items():
+                cache.put_many(items, size, size, False)
+            if features:
+                index.add([ladybird_id for ladybird_id, _ in features], [feature for _, feature in features])
+                index.flush()
+            throughput.add(len(chunk))
+    throughput.report(final=True)
+    print(f"{decoded} images decoded, {cached} tiles already cached, {failed} unreadable")
+    if cache.total_bytes > cache.max_bytes * 0.9:
+        print(f"warning: thumbnail cache is full ({cache.total_bytes / 1024 / 1024:.0f} MB); "
+              f"older tiles were evicted. Raise --cache-mb / TAG_BUG_CACHE_MB to keep everything.", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-generate Tag Bug thumbnails and manifest for a dataset')
+    parser.add_argument('db', help='DB whose ids are warmed (the manifest is stored next to it)')
+    parser.add_argument('--npy', help='only warm the ids in this NPY subset')
+    parser.add_argument('--class', dest='class_', action='append', help='only warm this class (repeatable)')
+    parser.add_argument('--root', default=DATA_ROOT, help='dataset root with {id}/ladybirds and {id}/patterns, or a pack_shards.py output')
+    parser.add_argument('--size', type=int, action='append',
+                        help=f'ladybird tile size to cache (repeatable, default {THUMBNAIL_SIZE} for the grid and {DETAIL_SIZE} for the detail view). '
+                             'Smaller grid tiles are scaled down from the nearest larger cached tile')
+    parser.add_argument('--pattern-size', type=int, default=DETAIL_SIZE, help='detail view pattern size, 0 to skip')
+    parser.add_argument('--features', action='store_true', help='also fill the similarity index (sort by similarity / near-duplicates)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_MAX_BYTES // 1024 // 1024)
+    args = parser.parse_args(argv)
+    prewarm(args)
+
+if __name__ == '__main__':
+    main()
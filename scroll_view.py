@@ -0,0 +1,199 @@
+import bisect
+from collections import OrderedDict
+from PyQt5.QtWidgets import QListView, QStyledItemDelegate, QStyle, QAbstractItemView
+from PyQt5.QtGui import QPixmap, QPen
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, QRect, QPoint
+from create_db import LadybirdDB
+
+class LadybirdListModel(QAbstractListModel):
+    # 스크롤할 때 필요한 만큼만 DB 에서 id 를 읽어 온다
+    def __init__(self, resolve, tile_loader, tile_size, parent=None, chunk_size=500, max_pixmaps=2000):
+        super().__init__(parent)
+        self.resolve = resolve
+        self.tile_loader = tile_loader
+        self.tile_size = tile_size
+        self.chunk_size = chunk_size
+        self.max_pixmaps = max_pixmaps
+        self.grayscale = False
+        self.query = None
+        self.ladybird_ids = []
+        self.rows = {}
+        self.pixmaps = OrderedDict()
+        self.pending = {}
+        self.exhausted = True
+        self.tile_loader.tile_loaded.connect(self.on_tile_loaded)
+
+    def set_query(self, query, grayscale=False):
+        self.beginResetModel()
+        self.query = None if query is None else query.with_entities(LadybirdDB.id).order_by(LadybirdDB.id)
+        self.grayscale = grayscale
+        self.ladybird_ids = []
+        self.rows = {}
+        self.pixmaps = OrderedDict()
+        self.pending = {}
+        self.exhausted = self.query is None
+        self.endResetModel()
+
+    def update_query(self, query):
+        # 필터가 바뀌어도 읽어 둔 행은 그대로 두고 뒤쪽을 읽을 조건만 바꾼다
+        self.query = query.with_entities(LadybirdDB.id).order_by(LadybirdDB.id)
+
+    def set_grayscale(self, grayscale):
+        # 행은 그대로 두고 타일만 다시 읽는다 (reset 하면 view 의 선택이 신호 없이 사라진다)
+        self.grayscale = grayscale
+        self.pixmaps = OrderedDict()
+        self.pending = {}
+        if self.ladybird_ids:
+            self.dataChanged.emit(self.index(0), self.index(len(self.ladybird_ids) - 1), [Qt.DecorationRole])
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ladybird_ids)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        query = self.query
+        if self.ladybird_ids:
+            query = query.filter(LadybirdDB.id > self.ladybird_ids[-1])
+        fetched = [row.id for row in query.limit(self.chunk_size)]
+        if len(fetched) < self.chunk_size:
+            self.exhausted = True
+        if not fetched:
+            return
+        start = len(self.ladybird_ids)
+        self.beginInsertRows(QModelIndex(), start, start + len(fetched) - 1)
+        for offset, ladybird_id in enumerate(fetched):
+            self.rows[ladybird_id] = start + offset
+        self.ladybird_ids.extend(fetched)
+        self.endInsertRows()
+
+    def update_ids(self, removed, added):
+        # 다른 창에서 필터에 들어오거나 빠진 id 만 고친다. 아직 읽지 않은 뒤쪽은 fetchMore 가 읽는다
+        for ladybird_id in removed:
+            row = bisect.bisect_left(self.ladybird_ids, ladybird_id)
+            if row < len(self.ladybird_ids) and self.ladybird_ids[row] == ladybird_id:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.ladybird_ids[row]
+                self.pixmaps.pop(ladybird_id, None)
+                self.endRemoveRows()
+        for ladybird_id in added:
+            row = bisect.bisect_left(self.ladybird_ids, ladybird_id)
+            if row < len(self.ladybird_ids) and self.ladybird_ids[row] == ladybird_id:
+                continue
+            if row == len(self.ladybird_ids) and not self.exhausted:
+                continue
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.ladybird_ids.insert(row, ladybird_id)
+            self.endInsertRows()
+        self.rows = {ladybird_id: row for row, ladybird_id in enumerate(self.ladybird_ids)}
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        ladybird_id = self.ladybird_ids[index.row()]
+        if role == Qt.DisplayRole or role == Qt.ToolTipRole:
+            return ladybird_id
+        if role == Qt.DecorationRole:
+            return self.pixmaps.get(ladybird_id)
+        if role == Qt.UserRole:
+            return self.resolve(ladybird_id)
+        return None
+
+    def load_visible(self, first_row, last_row):
+        # 화면에 보이는 행의 타일만 디코딩을 요청한다
+        paths = {}
+        for ladybird_id in self.ladybird_ids[first_row:last_row + 1]:
+            if ladybird_id not in self.pixmaps:
+                image_path = self.resolve(ladybird_id)
+                if image_path:
+                    paths[image_path] = ladybird_id
+        if not paths:
+            return
+        self.pending = paths
+        _, images = self.tile_loader.request(list(paths), self.tile_size, self.tile_size, self.grayscale)
+        for image_path, image in images.items():
+            self.set_pixmap(paths[image_path], QPixmap.fromImage(image))
+
+    def on_tile_loaded(self, generation, image_path, image):
+        ladybird_id = self.pending.get(image_path)
+        if ladybird_id is not None and generation == self.tile_loader.generation and not image.isNull():
+            self.set_pixmap(ladybird_id, QPixmap.fromImage(image))
+
+    def set_pixmap(self, ladybird_id, pixmap):
+        row = self.rows.get(ladybird_id)
+        if row is None:
+            return
+        self.pixmaps[ladybird_id] = pixmap
+        # 화면 밖으로 오래 나가 있던 타일부터 메모리에서 내린다
+        while len(self.pixmaps) > self.max_pixmaps:
+            self.pixmaps.popitem(last=False)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+class TileDelegate(QStyledItemDelegate):
+    def __init__(self, tile_size, placeholder, parent=None):
+        super().__init__(parent)
+        self.tile_size = tile_size
+        self.placeholder = placeholder
+
+    def sizeHint(self, option, index):
+        return QSize(self.tile_size + 4, self.tile_size + 4)
+
+    def paint(self, painter, option, index):
+        pixmap = index.data(Qt.DecorationRole)
+        if pixmap is None:
+            pixmap = self.placeholder
+        rect = option.rect
+        x = rect.x() + (rect.width() - pixmap.width()) // 2
+        y = rect.y() + (rect.height() - pixmap.height()) // 2
+        painter.drawPixmap(x, y, pixmap)
+        if option.state & QStyle.State_Selected:
+            painter.save()
+            painter.setPen(QPen(Qt.red, 2))
+            painter.drawRect(QRect(rect.x() + 1, rect.y() + 1, rect.width() - 2, rect.height() - 2))
+            painter.restore()
+
+class TileListView(QListView):
+    def __init__(self, main_window, tile_size, placeholder, parent=None):
+        super().__init__(parent)
+        self.main_window = main_window
+        self.setViewMode(QListView.IconMode)
+        self.setMovement(QListView.Static)
+        self.setResizeMode(QListView.Adjust)
+        self.setUniformItemSizes(True)
+        # Batched 는 행이 빠지거나 들어올 때 배치 중간의 짧은 스크롤 범위로 위치가 잘린다.
+        # 크기가 모두 같아서 한 번에 배치해도 빠르다
+        self.setLayoutMode(QListView.SinglePass)
+        self.setSpacing(2)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setSelectionRectVisible(True)
+        self.setItemDelegate(TileDelegate(tile_size, placeholder, self))
+        self.verticalScrollBar().valueChanged.connect(self.load_visible)
+
+    def setModel(self, model):
+        super().setModel(model)
+        model.modelReset.connect(self.load_visible)
+        model.rowsInserted.connect(self.load_visible)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.load_visible()
+
+    def load_visible(self, *args):
+        model = self.model()
+        if model is None or model.rowCount() == 0:
+            return
+        viewport = self.viewport().rect()
+        first = self.indexAt(viewport.topLeft() + QPoint(self.spacing() + 1, self.spacing() + 1))
+        first_row = first.row() if first.isValid() else 0
+        tile = self.itemDelegate().tile_size + 4 + 2 * self.spacing()
+        per_view = max(1, viewport.width() // tile) * (viewport.height() // tile + 2)
+        model.load_visible(first_row, min(model.rowCount() - 1, first_row + per_view))
+
+    def contextMenuEvent(self, event):
+        index = self.indexAt(event.pos())
+        if index.isValid():
+            self.main_window.show_context_menu(self.viewport().mapToGlobal(event.pos()), index.data(Qt.DisplayRole))
@@ -0,0 +1,109 @@
+import json
+from sqlalchemy import Table, Column, String, MetaData, select, text
+from create_db import LadybirdDB
+
+excluded_metadata = MetaData()
+
+# 쿼리 전체 선택에서 뺀 id. 개수가 많아도 bound parameter 한도에 걸리지 않도록
+# 세션 connection 의 임시 테이블에 써 두고 NOT IN (SELECT id ...) 로 뺀다
+excluded_table = Table('selection_excluded', excluded_metadata, Column('id', String, primary_key=True),
+                       prefixes=['TEMPORARY'], sqlite_with_rowid=False)
+
+class Selection:
+    # 선택한 ladybird id 집합 (경로가 아니라 id 만 저장한다).
+    # select_query() 는 "현재 필터에 맞는 전체" 선택으로, id 를 펼치지 않고 조건과 제외한 id 만 들고 있는다
+    def __init__(self):
+        self.ids = set()
+        self.class_filters = None
+        self.npy_subset = None
+        self.excluded = set()
+        self.total = 0
+        # 임시 테이블에 마지막으로 쓴 (세션, excluded 버전)
+        self.version = 0
+        self.written = None
+
+    def is_query(self):
+        return self.class_filters is not None
+
+    def __len__(self):
+        if self.is_query():
+            return max(0, self.total - len(self.excluded))
+        return len(self.ids)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def add(self, ladybird_id):
+        if self.is_query():
+            self.excluded.discard(ladybird_id)
+            self.version += 1
+        else:
+            self.ids.add(ladybird_id)
+
+    def discard(self, ladybird_id):
+        if self.is_query():
+            self.excluded.add(ladybird_id)
+            self.version += 1
+        else:
+            self.ids.discard(ladybird_id)
+
+    def clear(self):
+        self.ids = set()
+        self.class_filters = None
+        self.npy_subset = None
+        self.excluded = set()
+        self.total = 0
+        self.version += 1
+
+    def select_query(self, class_filters, npy_subset, total):
+        self.clear()
+        self.class_filters = frozenset(class_filters)
+        self.npy_subset = npy_subset
+        self.total = total
+
+    def query(self, session):
+        # 쿼리 전체 선택을 SQL 조건으로 바꾼다. 태그/삭제는 이 쿼리로 바로 실행한다
+        query = session.query(LadybirdDB).filter(LadybirdDB.class_.in_(self.class_filters))
+        if self.npy_subset is not None:
+            query = self.npy_subset.filter(query)
+        if self.excluded:
+            self.write_excluded(session)
+            query = query.filter(LadybirdDB.id.notin_(select(excluded_table.c.id)))
+        return query
+
+    def write_excluded(self, session):
+        if self.written == (session, self.version):
+            return
+        session.execute(text('DROP TABLE IF EXISTS temp.selection_excluded'))
+        excluded_table.create(session.connection())
+        # npy_subset 처럼 JSON 배열 하나로 넘겨 SQLite 안에서 펼친다
+        insert = text('INSERT OR IGNORE INTO temp.selection_excluded (id) SELECT value FROM json_each(:ids)')
+        session.execute(insert, {'ids': json.dumps(list(self.excluded))})
+        session.commit()
+        self.written = (session, self.version)
+
+    def selected_among(self, session, ladybird_ids):
+        if not self.is_query():
+            return self.ids.intersection(ladybird_ids)
+        if not ladybird_ids:
+            return set()
+        # 화면에 보이는 id 만 조건에 맞는지 확인한다
+        query = self.query(session).with_entities(LadybirdDB.id).filter(LadybirdDB.id.in_(ladybird_ids))
+        return {row.id for row in query}
+
+    def iter_ids(self, session, chunk_size=50000):
+        if not self.is_query():
+            yield from self.ids
+            return
+        query = self.query(session).with_entities(LadybirdDB.id).order_by(LadybirdDB.id)
+        last_id = None
+        while True:
+            page = query if last_id is None else query.filter(LadybirdDB.id > last_id)
+            ladybird_ids = [row.id for row in page.limit(chunk_size)]
+            yield from ladybird_ids
+            if len(ladybird_ids) < chunk_size:
+                return
+            last_id = ladybird_ids[-1]
+
+    def first(self, session):
+        return next(self.iter_ids(session, 1), None)
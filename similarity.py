@@ -0,0 +1,141 @@
+import os
+import numpy as np
+from PyQt5.QtGui import QImage
+from PyQt5.QtCore import Qt
+from atlas import image_to_array
+from slot_store import SlotStore
+
+# 작게 디코딩한 ladybird 이미지에서 뽑는 특징:
+#   색 히스토그램 (채널당 HIST_BINS 단계, sqrt 로 정규화) + 8x8 밝기 배치 (평균 0, 길이 1) -> float32 벡터.
+#   float16 으로 저장하면 검색 시간 대부분이 float32 변환에 들어서 float32 로 저장한다
+#   9x8 밝기의 가로 차이로 만든 64bit dHash -> 거의 같은 이미지 묶기
+FEATURE_SIZE = 32
+HIST_BINS = 4
+LAYOUT_SIZE = 8
+FEATURE_DIM = HIST_BINS ** 3 + LAYOUT_SIZE ** 2
+
+def similarity_paths_for(db_path):
+    stem = os.path.splitext(db_path)[0]
+    return stem + '.features.npy', stem + '.features.norms.npy', stem + '.features.hash.npy', stem + '.features.ids.npy'
+
+def gray_pixels(image, width, height):
+    small = image.convertToFormat(QImage.Format_RGB888).scaled(width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    return image_to_array(small).astype(np.float32).mean(axis=2)
+
+def image_features(image):
+    pixels = image_to_array(image)
+    bins = (pixels // (256 // HIST_BINS)).astype(np.int64)
+    index = (bins[..., 0] * HIST_BINS + bins[..., 1]) * HIST_BINS + bins[..., 2]
+    histogram = np.sqrt(np.bincount(index.ravel(), minlength=HIST_BINS ** 3) / max(index.size, 1))
+    layout = gray_pixels(image, LAYOUT_SIZE, LAYOUT_SIZE).ravel()
+    layout -= layout.mean()
+    layout /= max(np.linalg.norm(layout), 1e-6)
+    gray = gray_pixels(image, 9, 8)
+    dhash = np.packbits(gray[:, 1:] > gray[:, :-1]).view('>u8')[0]
+    return np.concatenate([histogram, layout]).astype(np.float32), np.uint64(dhash)
+
+class UnionFind:
+    def __init__(self, count):
+        self.parent = list(range(count))
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+class SimilarityIndex:
+    # id 별 특징 벡터와 dHash 를 memmap 으로 저장하고 NumPy 로 한 번에 거리를 계산한다
+    def __init__(self, db_path, capacity=4096):
+        features_path, norms_path, hash_path, ids_path = similarity_paths_for(db_path)
+        self.store = SlotStore(ids_path, {'features': (features_path, np.float32, (FEATURE_DIM,)),
+                                          'norms': (norms_path, np.float32, ()),
+                                          'hashes': (hash_path, np.uint64, ())}, capacity)
+
+    def __len__(self):
+        return len(self.store)
+
+    def lookup(self, ladybird_ids):
+        return self.store.lookup(ladybird_ids)
+
+    def add(self, ladybird_ids, features):
+        # features: image_features() 결과 (벡터, 해시) 목록
+        vectors = np.stack([vector for vector, _ in features]).astype(np.float32)
+        self.store.add(ladybird_ids, features=vectors, norms=np.einsum('ij,ij->i', vectors, vectors),
+                       hashes=np.array([dhash for _, dhash in features], dtype=np.uint64))
+
+    def flush(self):
+        self.store.flush()
+
+    def query_vector(self, ladybird_ids):
+        # 여러 개를 골랐으면 평균 벡터와 가까운 순서로 찾는다
+        slots = self.lookup(ladybird_ids)
+        slots = slots[slots >= 0]
+        if len(slots) == 0:
+            return None
+        with self.store.lock:
+            return self.store.read('features', slots).mean(axis=0)
+
+    def nearest(self, vector, k=100, slots=None, chunk_size=1 << 18):
+        # 전체(또는 slots 안)에서 vector 와 가장 가까운 k 개의 (slot, 거리 제곱)
+        vector = np.asarray(vector, dtype=np.float32)
+        best_slots = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float32)
+        with self.store.lock:
+            count = len(self.store)
+            features, norms = self.store['features'], self.store['norms']
+            if slots is not None:
+                slots = np.sort(np.asarray(slots, dtype=np.int64))
+            total = count if slots is None else len(slots)
+            for start in range(0, total, chunk_size):
+                if slots is None:
+                    block_slots = np.arange(start, min(start + chunk_size, count))
+                    block = features[start:start + len(block_slots)]
+                    block_norms = norms[start:start + len(block_slots)]
+                else:
+                    block_slots = slots[start:start + chunk_size]
+                    block, block_norms = features[block_slots], norms[block_slots]
+                # |x - q|^2 = |x|^2 - 2 x.q + |q|^2 (|x|^2 는 저장해 두고, |q|^2 는 순위에 영향이 없어 뺀다)
+                distances = block_norms - 2 * (block @ vector)
+                best_slots = np.concatenate([best_slots, block_slots])
+                best_distances = np.concatenate([best_distances, distances])
+                if len(best_distances) > k:
+                    keep = np.argpartition(best_distances, k)[:k]
+                    best_slots, best_distances = best_slots[keep], best_distances[keep]
+        order = np.argsort(best_distances, kind='stable')
+        return best_slots[order], best_distances[order] + vector @ vector
+
+    def nearest_ids(self, vector, k=100, slots=None):
+        found, _ = self.nearest(vector, k, slots)
+        return self.store.ids_at(found)
+
+    def duplicate_groups(self, slots, max_distance=8, bands=4):
+        # dHash 를 bands 조각으로 나누고, 한 조각이 같은 것끼리 묶은 bucket 안에서
+        # 첫 번째 것과의 해밍 거리만 비교한다 (모든 쌍을 비교하지 않는 근사).
+        # 두 개 이상 묶인 그룹만 큰 것부터 slot 배열로 돌려준다
+        slots = np.asarray(slots, dtype=np.int64)
+        with self.store.lock:
+            hashes = self.store.read('hashes', slots)
+        groups = UnionFind(len(slots))
+        band_bits = 64 // bands
+        for band in range(bands):
+            keys = (hashes >> np.uint64(band * band_bits)) & np.uint64((1 << band_bits) - 1)
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            run_start = np.concatenate([[0], np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1])
+            first = order[np.repeat(run_start, np.diff(np.append(run_start, len(order))))]
+            close = (first != order) & (np.bitwise_count(hashes[order] ^ hashes[first]) <= max_distance)
+            for a, b in zip(order[close].tolist(), first[close].tolist()):
+                groups.union(a, b)
+        members = {}
+        for i in range(len(slots)):
+            members.setdefault(groups.find(i), []).append(i)
+        result = [slots[group] for group in members.values() if len(group) > 1]
+        result.sort(key=len, reverse=True)
+        return result
@@ -0,0 +1,168 @@
+import fcntl
+import os
+import threading
+import time
+import numpy as np
+from numpy.lib.format import open_memmap
+
+class SlotStore:
+    # id 마다 slot 하나를 주고 같은 slot 번호로 .npy memmap 배열 여러 개에 값을 저장한다.
+    # ids 파일의 i 번째 id 가 slot i 이다. columns: {name: (path, dtype, shape)}
+    # UI 와 prewarm.py --features 가 같은 파일에 쓰므로 add 부터 flush 까지는 ids 파일 옆의 lock 파일을 잡고,
+    # 잡을 때 다른 프로세스가 그 사이에 저장한 ids 와 배열을 다시 읽은 뒤 그 뒤에 slot 을 붙인다
+    def __init__(self, ids_path, columns, capacity=4096, max_hold=2.0):
+        self.ids_path = ids_path
+        self.columns = columns
+        self.max_hold = max_hold
+        self.lock = threading.Lock()
+        self.lock_path = ids_path + '.lock'
+        self.lock_file = None
+        self.locked_at = 0
+        # 마지막으로 읽거나 쓴 ids 파일 (바뀌었는지 비교한다)
+        self.saved = None
+        self.arrays = {}
+        self.slot_ids = np.array([], dtype='S1')
+        self.lock_files()
+        try:
+            if os.path.exists(ids_path) and all(self.matches(name) for name in columns):
+                self.load()
+            else:
+                # 형식이 바뀌었으면 (예: 타일 크기) 처음부터 다시 만든다
+                for name in columns:
+                    self.arrays[name] = self.create(name, capacity)
+                self.save()
+                self.reindex()
+        finally:
+            self.unlock_files()
+
+    def matches(self, name):
+        path, dtype, shape = self.columns[name]
+        if not os.path.exists(path):
+            return False
+        array = np.load(path, mmap_mode='r')
+        return array.dtype == np.dtype(dtype) and array.shape[1:] == tuple(shape)
+
+    def file_state(self):
+        try:
+            stat = os.stat(self.ids_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        self.slot_ids = np.load(self.ids_path)
+        for name, (path, _, _) in self.columns.items():
+            self.arrays[name] = open_memmap(path, mode='r+')
+        self.saved = self.file_state()
+        self.reindex()
+
+    def save(self):
+        # 다른 프로세스가 반쯤 쓴 파일을 읽지 않도록 임시 파일에 쓰고 바꾼다
+        temp_path = self.ids_path + '.tmp.npy'
+        np.save(temp_path, self.slot_ids)
+        os.replace(temp_path, self.ids_path)
+        self.saved = self.file_state()
+
+    def lock_files(self):
+        # 다른 프로세스가 쓰는 중이면 그쪽이 flush 할 때까지 기다린다
+        if self.lock_file is not None:
+            return
+        self.lock_file = open(self.lock_path, 'a')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        self.locked_at = time.monotonic()
+        if self.saved is not None and self.file_state() != self.saved:
+            self.load()
+
+    def unlock_files(self):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+    def create(self, name, capacity, path=None):
+        column_path, dtype, shape = self.columns[name]
+        return open_memmap(path or column_path, mode='w+', dtype=dtype, shape=(capacity,) + tuple(shape))
+
+    def __len__(self):
+        return len(self.slot_ids)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def capacity(self):
+        return len(next(iter(self.arrays.values())))
+
+    def reindex(self):
+        # id -> slot 조회는 정렬한 id 배열에서 searchsorted 로 한다
+        self.order = np.argsort(self.slot_ids, kind='stable')
+        self.sorted_ids = self.slot_ids[self.order]
+
+    def lookup(self, ladybird_ids):
+        # 없는 id 는 -1
+        query = np.asarray(ladybird_ids, dtype='S')
+        if len(self.sorted_ids) == 0 or len(query) == 0:
+            return np.full(len(query), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_ids, query), len(self.sorted_ids) - 1)
+        found = self.sorted_ids[positions] == query
+        return np.where(found, self.order[positions], -1)
+
+    def ids_at(self, slots):
+        return [ladybird_id.decode() for ladybird_id in self.slot_ids[slots]]
+
+    def grow(self, needed):
+        capacity = self.capacity()
+        while capacity < needed:
+            capacity *= 2
+        for name, array in list(self.arrays.items()):
+            path = self.columns[name][0]
+            temp_path = path + '.tmp.npy'
+            grown = self.create(name, capacity, temp_path)
+            grown[:len(self.slot_ids)] = array[:len(self.slot_ids)]
+            grown.flush()
+            del grown
+            array.flush()
+            self.arrays[name] = array = None
+            os.replace(temp_path, path)
+            self.arrays[name] = open_memmap(path, mode='r+')
+
+    def add(self, ladybird_ids, **values):
+        # 이미 있는 id 는 같은 slot 에 덮어쓴다
+        with self.lock:
+            self.lock_files()
+            slots = self.lookup(ladybird_ids)
+            new = slots < 0
+            if new.any():
+                start = len(self.slot_ids)
+                if start + new.sum() > self.capacity():
+                    self.grow(start + new.sum())
+                slots[new] = np.arange(start, start + new.sum())
+                self.slot_ids = np.concatenate([self.slot_ids, np.asarray(ladybird_ids, dtype='S')[new]])
+                self.reindex()
+            for name, value in values.items():
+                self.arrays[name][slots] = value
+            # 오래 걸리는 빌드가 lock 을 계속 잡고 있지 않도록 중간중간 저장하고 놓는다
+            if time.monotonic() - self.locked_at > self.max_hold:
+                self.write()
+            return slots
+
+    def read(self, name, slots):
+        # memmap 은 slot 순서로 읽어야 디스크를 순차로 읽는다
+        slots = np.asarray(slots, dtype=np.int64)
+        order = np.argsort(slots)
+        array = self.arrays[name]
+        result = np.empty((len(slots),) + array.shape[1:], dtype=array.dtype)
+        result[order] = array[slots[order]]
+        return result
+
+    def flush(self):
+        with self.lock:
+            self.write()
+
+    def write(self):
+        # lock 을 잡지 않았으면 add 한 것이 없다 (오래된 ids 로 다른 프로세스가 쓴 것을 덮지 않는다)
+        if self.lock_file is None:
+            return
+        for array in self.arrays.values():
+            array.flush()
+        self.save()
+        self.unlock_files()
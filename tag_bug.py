@@ -1,53 +1,108 @@
 import sys
 import os
+import time
+import logging
+from collections import OrderedDict, Counter
+from itertools import islice
 import numpy as np
-from PyQt5.QtWidgets import QApplication, QMainWindow, QAction, QFileDialog, QMessageBox, QVBoxLayout, QWidget, QLabel, QPushButton, QGridLayout, QHBoxLayout, QMenu, QInputDialog, QProgressBar, QRubberBand, QShortcut, QDialog, QLineEdit, QTextEdit
+from PyQt5.QtWidgets import QApplication, QMainWindow, QAction, QFileDialog, QMessageBox, QVBoxLayout, QWidget, QLabel, QPushButton, QGridLayout, QHBoxLayout, QMenu, QInputDialog, QProgressBar, QRubberBand, QShortcut, QDialog, QLineEdit, QTextEdit, QSizePolicy, QComboBox, QCheckBox, QProgressDialog
 from PyQt5.QtGui import QPixmap, QContextMenuEvent, QImage, QKeySequence, QIcon, QPainter, QPen
-from PyQt5.QtCore import Qt, QRect, QPoint, QSize
-from sqlalchemy import create_engine
+from PyQt5.QtCore import Qt, QRect, QPoint, QSize, QTimer, QThread, QEventLoop, pyqtSignal
 from sqlalchemy.orm import sessionmaker
-from create_db import LadybirdDB, Base 
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.exc import OperationalError
+from create_db import LadybirdDB, Base, open_engine
+from thumb_cache import ThumbnailCache
+from detail_loader import DetailLoader
+from image_loader import TileLoader, DecodeThread, decode_tile, THUMBNAIL_SIZE
+from paging import Pager, OrderedPager
+from scroll_view import LadybirdListModel, TileListView
+from db_ops import chunked, count_classes, query_update_class, query_delete, MAX_VARIABLES
+from npy_subset import NpySubset, load_npy_ids
+from export import export_query, named_totals
+from label_stats import LabelStats
+from manifest import DatasetManifest, MISSING_ENTRY, DATA_ROOT
+from perf import profiler
+from selection import Selection
+from write_queue import WriteQueue
+from change_feed import ChangeFeed, client_name
+from atlas import TileAtlas
+from overview import OverviewWindow
+from similarity import SimilarityIndex, image_features, FEATURE_SIZE
+
+# 격자 타일은 실제 칸 크기에 맞춰 디코딩한다 (캐시가 잘 맞도록 STEP 단위로 자른다)
+MIN_TILE_SIZE = 40
+MAX_TILE_SIZE = 400
+TILE_SIZE_STEP = 10
+
+log = logging.getLogger('tag_bug')
+
+# 커밋 대기 중인 삭제 (pending_edits 의 값)
+PENDING_DELETE = object()
+
+# 남은 쓰기를 기다릴 때 한 번에 막는 시간과 진행 창을 띄우기까지의 시간 (초)
+FLUSH_STEP = 0.05
+FLUSH_DIALOG_DELAY = 0.5
 
 class ImageLabel(QLabel):
+    # 격자의 한 칸. 페이지가 바뀌어도 라벨은 재사용하고 경로/이미지/선택 상태만 바꾼다
     def __init__(self, image_path, parent=None):
         super().__init__(parent)
         self.image_path = image_path
-        self.setStyleSheet("QLabel { border: 2px solid transparent; }")
+        self.ladybird_id = None
+        self.image = None
+        self.color_image = None
+        self.grayscale = False
+        self.tile_size = None
+        self.setContentsMargins(2, 2, 2, 2)
+        self.setAlignment(Qt.AlignCenter)
+        # 칸 크기는 픽스맵이 아니라 격자 레이아웃이 정한다
+        self.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
         self.selected = False
 
     def setSelected(self, selected):
-        self.selected = selected
-        self.setStyleSheet("QLabel { border: 2px solid %s; }" % ("red" if self.selected else "transparent"))
+        # 스타일시트를 바꾸면 다시 polish 되므로 테두리는 paintEvent 에서 직접 그린다
+        if selected != self.selected:
+            self.selected = selected
+            self.update()
 
-    def contextMenuEvent(self, event: QContextMenuEvent):
-        context_menu = QMenu(self)
-        
-        # Detail 메뉴 추가
-        detail_action = context_menu.addAction("Detail")
-        
-        remove_menu = context_menu.addMenu("Remove")
-        remove_from_path_action = remove_menu.addAction("Remove from Path")
-        remove_from_db_action = remove_menu.addAction("Remove from DB")
-        tag_menu = context_menu.addMenu("Tag")
-        
-        for cls in self.parent().parent().all_classes:
-            tag_action = tag_menu.addAction(cls)
-            tag_action.triggered.connect(lambda checked, cls=cls: self.parent().parent().update_image_class(cls))
-        
-        tag_menu.addSeparator()
-        
-        add_tag_action = tag_menu.addAction("Add Tag")
-        add_tag_action.triggered.connect(self.parent().parent().add_new_tag)
-        
-        action = context_menu.exec_(self.mapToGlobal(event.pos()))
+    def set_image(self, image, grayscale):
+        self.image = image
+        self.grayscale = grayscale
+        if not grayscale:
+            self.color_image = image
+        self.setPixmap(QPixmap.fromImage(image))
 
-        if action == remove_from_path_action:
-            self.parent().parent().remove_from_path()
-        elif action == remove_from_db_action:
-            self.parent().parent().remove_selected_images()
-        elif action == detail_action:
-            ladybird_id = os.path.basename(os.path.dirname(os.path.dirname(self.image_path)))
-            self.parent().parent().show_detail_for_image(ladybird_id)
+    def set_tile(self, image_path, placeholder):
+        self.image_path = image_path
+        self.image = None
+        self.color_image = None
+        self.setPixmap(placeholder)
+
+    def clear_tile(self):
+        self.image_path = None
+        self.ladybird_id = None
+        self.image = None
+        self.color_image = None
+        self.selected = False
+        self.clear()
+        self.hide()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.selected:
+            rect = self.rect().adjusted(1, 1, -1, -1)
+            pixmap = self.pixmap()
+            if pixmap is not None and not pixmap.isNull():
+                rect = QRect(QPoint(0, 0), pixmap.size()).adjusted(-1, -1, 1, 1)
+                rect.moveCenter(self.contentsRect().center())
+            painter = QPainter(self)
+            painter.setPen(QPen(Qt.red, 2))
+            painter.drawRect(rect)
+            painter.end()
+
+    def contextMenuEvent(self, event: QContextMenuEvent):
+        self.parent().parent().show_context_menu(self.mapToGlobal(event.pos()), self.ladybird_id)
 
 class DetailWindow(QMainWindow):
     def __init__(self, parent=None, db_session=None):
@@ -55,7 +110,13 @@ class DetailWindow(QMainWindow):
         self.parent = parent
         self.db_session = db_session
         self.selected_ladybirds = set()
+        self.ladybird_id = None
+        # 현재 필터 결과에서 보고 있는 id 의 앞/뒤 id (가까운 것이 previous 의 끝, following 의 처음)
+        self.previous_ids = []
+        self.following_ids = []
+        self.prefetch_count = 3
         self.initUI()
+        self.parent.detail_loader.frame_loaded.connect(self.on_frame_loaded)
         
     def initUI(self):
         self.setWindowTitle('Image Detail')
@@ -94,47 +155,133 @@ class DetailWindow(QMainWindow):
         image_layout.addWidget(right_panel)
         
         main_layout.addLayout(image_layout)
+
+        # 현재 필터 결과 안에서 앞뒤로 넘기기
+        nav_layout = QHBoxLayout()
+        self.previous_button = QPushButton("< Previous")
+        self.previous_button.clicked.connect(self.show_previous)
+        self.next_button = QPushButton("Next >")
+        self.next_button.clicked.connect(self.show_next)
+        nav_layout.addWidget(self.previous_button)
+        nav_layout.addWidget(self.next_button)
+        main_layout.addLayout(nav_layout)
+        for key in (Qt.Key_Right, Qt.Key_Down, Qt.Key_PageDown, Qt.Key_Space):
+            QShortcut(QKeySequence(key), self, self.show_next)
+        for key in (Qt.Key_Left, Qt.Key_Up, Qt.Key_PageUp):
+            QShortcut(QKeySequence(key), self, self.show_previous)
         
     def update_detail(self, ladybird_id=None):
+        self.ladybird_id = ladybird_id
         if not ladybird_id:
             self.info_text.setText("Not Selected.")
             self.ladybird_label.clear()
             self.pattern_label.clear()
+            self.previous_ids, self.following_ids = [], []
+            self.update_buttons()
             return
             
-        base_path = f'/data1/lpf/augmented_230823/{ladybird_id}'
-        ladybird_path = f'{base_path}/ladybirds'
-        pattern_path = f'{base_path}/patterns'
-        
-        # 정보 텍스트 업데이트
-        info = f"Ladybird ID: {ladybird_id}\n"
-        info += f"Saved Path: {base_path}\n"
-        info += f"Tag: {self.db_session.query(LadybirdDB.class_).filter_by(id=ladybird_id).first()[0]}\n"
-        if ladybird_id in self.selected_ladybirds:
-            info += "Status: Selected (Saved in Special Path)"
-        self.info_text.setText(info)
-        
-        # 이미지 업데이트
-        if os.path.exists(ladybird_path):
-            ladybird_image = os.listdir(ladybird_path)[0]
-            pixmap = QPixmap(os.path.join(ladybird_path, ladybird_image))
-            self.ladybird_label.setPixmap(pixmap.scaled(400, 400, Qt.KeepAspectRatio))
+        with profiler.action('detail'):
+            base_path = os.path.join(self.parent.data_root, ladybird_id)
             
-        if os.path.exists(pattern_path):
-            pattern_image = os.listdir(pattern_path)[0]
-            pixmap = QPixmap(os.path.join(pattern_path, pattern_image))
-            painter = QPainter(pixmap)
-            painter.setPen(QPen(Qt.green, 2))
-            painter.drawRect(36, 12,  55, 105)
-            painter.end()
+            # 정보 텍스트 업데이트 (태그는 바뀔 수 있어서 매번 읽는다)
+            info = f"Ladybird ID: {ladybird_id}\n"
+            info += f"Saved Path: {base_path}\n"
+            with profiler.span('detail.query'):
+                row = self.db_session.query(LadybirdDB.class_).filter_by(id=ladybird_id).first()
+                info += f"Tag: {row[0] if row else '(deleted)'}\n"
+            if ladybird_id in self.selected_ladybirds:
+                info += "Status: Selected (Saved in Special Path)"
+            self.info_text.setText(info)
+
+            with profiler.span('detail.neighbours'):
+                self.previous_ids, self.following_ids = self.parent.detail_neighbours(ladybird_id, self.prefetch_count)
+            self.update_buttons()
+            
+            # 이미지 업데이트: 미리 만들어 둔 프레임이 있으면 바로 그리고, 없으면 도착할 때 그린다.
+            # 다음 쪽을 먼저, 그다음 이전 쪽을 백그라운드에서 만든다
+            neighbours = self.following_ids + self.previous_ids[::-1]
+            frame = self.parent.detail_loader.request(ladybird_id, neighbours)
+            if frame is not None:
+                self.show_frame(frame)
+            else:
+                self.ladybird_label.setText("Loading...")
+                self.pattern_label.setText("Loading...")
 
-            self.pattern_label.setPixmap(pixmap.scaled(400, 400, Qt.KeepAspectRatio))
+    def show_frame(self, frame):
+        with profiler.span('detail.show'):
+            for label, image in ((self.ladybird_label, frame.ladybird), (self.pattern_label, frame.pattern)):
+                if image.isNull():
+                    label.clear()
+                else:
+                    label.setPixmap(QPixmap.fromImage(image))
+
+    def on_frame_loaded(self, ladybird_id, frame):
+        if ladybird_id == self.ladybird_id:
+            self.show_frame(frame)
+
+    def update_buttons(self):
+        self.previous_button.setEnabled(bool(self.previous_ids))
+        self.next_button.setEnabled(bool(self.following_ids))
+
+    def show_next(self):
+        if self.following_ids:
+            self.update_detail(self.following_ids[0])
+
+    def show_previous(self):
+        if self.previous_ids:
+            self.update_detail(self.previous_ids[-1])
+
+class ManifestRefreshThread(QThread):
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, manifest, parent=None):
+        super().__init__(parent)
+        self.manifest = manifest
+        self.changed = 0
+
+    def run(self):
+        self.changed = self.manifest.refresh(lambda done, total: self.progress.emit(done, total))
+
+class ExportThread(QThread):
+    # UI 세션과 따로 연결을 열어 내보낸다 (NPY subset 은 그 연결의 임시 테이블에 다시 넣는다)
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, db_path, class_filters, subset_ids, output, options, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.class_filters = list(class_filters)
+        self.subset_ids = subset_ids
+        self.output = output
+        self.options = options
+        self.totals = None
+        self.error = None
+
+    def run(self):
+        engine = open_engine(self.db_path, poolclass=StaticPool)
+        session = sessionmaker(bind=engine)()
+        try:
+            query = session.query(LadybirdDB).filter(LadybirdDB.class_.in_(self.class_filters))
+            if self.subset_ids is not None:
+                subset = NpySubset(self.subset_ids)
+                subset.attach(session)
+                query = subset.filter(query)
+            self.totals = export_query(query, self.output, progress=lambda done, total: self.progress.emit(done, total), **self.options)
+        except Exception as e:
+            self.error = e
+        finally:
+            session.close()
+            engine.dispose()
 
 class LabelCountWindow(QDialog):
-    def __init__(self, parent=None, db_session=None):
+    def __init__(self, parent=None, db_session=None, label_stats=None):
         super().__init__(parent)
         self.db_session = db_session
+        self.label_stats = label_stats
         self.initUI()
+        # 태그/삭제가 일어나면 다시 세지 않고 바로 반영한다
+        if self.label_stats is not None:
+            self.label_stats.add_listener(self.update_counts)
+            self.finished.connect(lambda result: self.label_stats.remove_listener(self.update_counts))
         
     def initUI(self):
         self.setWindowTitle('Label Count')
@@ -151,22 +298,26 @@ class LabelCountWindow(QDialog):
         button_layout = QHBoxLayout()
         button_layout.addStretch()
         reload_button = QPushButton('Reload')
-        reload_button.clicked.connect(self.update_counts)
+        reload_button.clicked.connect(self.reload_counts)
         button_layout.addWidget(reload_button)
         
         layout.addLayout(button_layout)
         self.setLayout(layout)
         self.update_counts()
         
+    def reload_counts(self):
+        if self.db_session and self.label_stats is not None:
+            # 아직 커밋되지 않은 변경이 DB 에 반영된 뒤에 다시 센다
+            if self.parent() is not None and not self.parent().flush_writes():
+                return
+            self.label_stats.load(self.db_session)
+
     def update_counts(self):
-        if self.db_session:
-            all_labels = [item.class_ for item in self.db_session.query(LadybirdDB.class_).distinct()]
+        if self.label_stats is not None:
             result_text = "Current Label Count:\n\n"
             
-            for label in all_labels:
-                if label:
-                    count = self.db_session.query(LadybirdDB).filter(LadybirdDB.class_==label).count()
-                    result_text += f"{label}: {count}\n"
+            for label, count in self.label_stats.labels():
+                result_text += f"{label}: {count}\n"
             
             self.text_display.setText(result_text)
 
@@ -175,18 +326,77 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.detail_window = None
         self.detail_windows = []  # 디테일 윈도우 참조 저장
+        # 창 크기가 바뀌면 타일 크기를 다시 계산한다 (연속 resize 이벤트는 묶어서 처리)
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
         self.initUI()
         self.db_session = None
         self.grid_width = 10
         self.grid_height = 10
         self.images_per_page = self.grid_width * self.grid_height
         self.current_page = 0
-        self.selected_images = set()
+        self.selection = Selection()
+        self.write_queue = None
+        self.pending_edits = {}
+        # 같은 DB 를 연 다른 창/사람의 변경을 주기적으로 가져온다
+        self.client = client_name()
+        self.change_feed = ChangeFeed(self.client)
+        self.change_timer = QTimer(self)
+        self.change_timer.timeout.connect(self.poll_changes)
+        self.change_poll_interval = 2000
         self.class_filters = set()
         self.all_classes = set()
         self.rubberBand = None
         self.origin = QPoint()
-        self.npy_paths = None
+        self.npy_subset = None
+        self.label_stats = LabelStats()
+        self.thumbnail_cache = ThumbnailCache()
+        self.detail_loader = DetailLoader(self.thumbnail_cache, self.resolve_entries, parent=self)
+        self.manifest = None
+        self.manifest_thread = None
+        self.db_path = None
+        self.export_thread = None
+        # 이미지 root (디렉터리 트리 또는 pack_shards.py 로 만든 shard). File > Set Data Root 로 바꾼다
+        self.data_root = DATA_ROOT
+        self.tile_atlas = None
+        self.overview_window = None
+        self.similarity_index = None
+        self.similarity_thread = None
+        # 유사도 순서로 보는 동안 원래 NPY 범위 (다시 찾을 때 이 안에서 찾는다)
+        self.similarity_scope = None
+        # overview 영역/유사도 결과를 띄우기 전의 NPY 와 제목 (Close Result View 로 돌아간다)
+        self.previous_view = None
+        self.similar_limit = 1000
+        self.tile_labels = {}
+        self.grid_slots = []
+        self.grid_shape = None
+        self.total_count = 0
+        self.data_version = 0
+        self.page_buffer = OrderedDict()
+        self.pager = Pager(self.images_per_page)
+        self.page_buffer_size = 8
+        self.prefetch_pages = 1
+        self.prefetch_previous = False
+        self.tile_loader = TileLoader(self.thumbnail_cache, self.tile_buffer_capacity(), self)
+        self.tile_loader.tile_loaded.connect(self.on_tile_loaded)
+        self.placeholder_pixmap = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self.placeholder_pixmap.fill(Qt.lightGray)
+        self.placeholders = {THUMBNAIL_SIZE: self.placeholder_pixmap}
+        self.tile_size = THUMBNAIL_SIZE
+        self.resize_timer.timeout.connect(self.on_resized)
+
+        # 연속 스크롤 모드 (보이는 타일만 그리는 model/view)
+        self.scroll_mode = False
+        self.scroll_loader = TileLoader(self.thumbnail_cache, self.tile_buffer_capacity(), self)
+        self.scroll_model = LadybirdListModel(self.resolve_image_path, self.scroll_loader, THUMBNAIL_SIZE, self)
+        self.scroll_view = TileListView(self, THUMBNAIL_SIZE, self.placeholder_pixmap, self)
+        self.scroll_view.setModel(self.scroll_model)
+        self.scroll_view.selectionModel().selectionChanged.connect(self.on_scroll_selection_changed)
+        self.scroll_model.modelReset.connect(self.on_scroll_model_reset)
+        self.scroll_view.hide()
+        self.layout.insertWidget(self.layout.indexOf(self.grid_layout) + 1, self.scroll_view)
+        self.layout.setStretchFactor(self.grid_layout, 1)
+        self.resize_for_grid()
 
     def initUI(self):
         self.setWindowTitle('Tag Bug')
@@ -206,11 +416,42 @@ class MainWindow(QMainWindow):
         load_npy_action.triggered.connect(self.load_npy)
         file_menu.addAction(load_npy_action)
 
-        self.view_action_list = ['NPY Deactivate', 'All Activate', 'All Deactivate']
+        save_npy_action = QAction('Save NPY', self)
+        save_npy_action.triggered.connect(self.save_npy)
+        file_menu.addAction(save_npy_action)
+
+        export_action = QAction('Export Filtered', self)
+        export_action.triggered.connect(self.show_export_dialog)
+        file_menu.addAction(export_action)
+
+        file_menu.addSeparator()
+
+        data_root_action = QAction('Set Data Root', self)
+        data_root_action.triggered.connect(self.set_data_root)
+        file_menu.addAction(data_root_action)
+
+        refresh_manifest_action = QAction('Refresh Manifest', self)
+        refresh_manifest_action.triggered.connect(self.refresh_manifest)
+        file_menu.addAction(refresh_manifest_action)
+
+        flush_action = QAction('Flush Pending Edits', self)
+        flush_action.triggered.connect(self.flush_pending_edits)
+        file_menu.addAction(flush_action)
+
+        file_menu.addSeparator()
+
+        overview_action = QAction('Mosaic Overview', self)
+        overview_action.triggered.connect(self.show_overview)
+        file_menu.addAction(overview_action)
+
+        self.view_action_list = ['NPY Deactivate', 'Close Result View', 'All Activate', 'All Deactivate']
       
         npy_deactivate_action = QAction('NPY Deactivate', self)
         npy_deactivate_action.triggered.connect(self.npy_deactivate)
         self.view_menu.addAction(npy_deactivate_action)
+        close_result_action = QAction('Close Result View', self)
+        close_result_action.triggered.connect(self.close_result_view)
+        self.view_menu.addAction(close_result_action)
         self.view_menu.addSeparator()
 
         all_activate_action = QAction('All Activate', self)
@@ -231,6 +472,24 @@ class MainWindow(QMainWindow):
         unselect_all_action = QAction('Unselect All', self)
         unselect_all_action.triggered.connect(self.unselect_all)
         select_menu.addAction(unselect_all_action)
+
+        select_matching_action = QAction('Select All Matching', self)
+        select_matching_action.triggered.connect(self.select_all_matching)
+        select_menu.addAction(select_matching_action)
+
+        similarity_menu = menubar.addMenu('Similarity')
+        similar_action = QAction('Sort by Similarity to Selected', self)
+        similar_action.triggered.connect(lambda: self.sort_by_similarity())
+        similarity_menu.addAction(similar_action)
+
+        duplicates_action = QAction('Group Near-Duplicates', self)
+        duplicates_action.triggered.connect(self.group_near_duplicates)
+        similarity_menu.addAction(duplicates_action)
+
+        similarity_menu.addSeparator()
+        build_similarity_action = QAction('Build Similarity Index', self)
+        build_similarity_action.triggered.connect(self.build_similarity_index)
+        similarity_menu.addAction(build_similarity_action)
         
         option_menu = menubar.addMenu('Option')
 
@@ -243,6 +502,32 @@ class MainWindow(QMainWindow):
         ratio_action = QAction("Grid Ratio", self)
         ratio_action.triggered.connect(self.show_ratio_dialog)
         option_menu.addAction(ratio_action)
+
+        scroll_action = QAction("Continuous Scroll", self, checkable=True)
+        scroll_action.setChecked(False)
+        scroll_action.triggered.connect(self.toggle_scroll_mode)
+        option_menu.addAction(scroll_action)
+
+        option_menu.addSeparator()
+        prefetch_action = QAction("Prefetch Pages", self)
+        prefetch_action.triggered.connect(self.show_prefetch_dialog)
+        option_menu.addAction(prefetch_action)
+
+        prefetch_previous_action = QAction("Prefetch Previous Page", self, checkable=True)
+        prefetch_previous_action.setChecked(False)
+        prefetch_previous_action.triggered.connect(self.toggle_prefetch_previous)
+        option_menu.addAction(prefetch_previous_action)
+
+        option_menu.addSeparator()
+        perf_overlay_action = QAction("Performance Overlay", self, checkable=True)
+        perf_overlay_action.setChecked(profiler.enabled)
+        perf_overlay_action.triggered.connect(self.toggle_perf_overlay)
+        option_menu.addAction(perf_overlay_action)
+
+        self.perf_trace_action = QAction("Record Performance Trace", self, checkable=True)
+        self.perf_trace_action.setChecked(profiler.trace_file is not None)
+        self.perf_trace_action.triggered.connect(self.toggle_perf_trace)
+        option_menu.addAction(self.perf_trace_action)
         
         self.main_widget = QWidget(self)
         self.setCentralWidget(self.main_widget)
@@ -268,36 +553,89 @@ class MainWindow(QMainWindow):
         self.next_button.clicked.connect(self.next_page)
         self.button_layout.addWidget(self.next_button)
 
+        self.go_to_button = QPushButton('Go to Page', self)
+        self.go_to_button.clicked.connect(self.go_to_page)
+        self.button_layout.addWidget(self.go_to_button)
+
         self.progress_bar = QProgressBar(self)
         self.layout.addWidget(self.progress_bar)
         self.progress_bar.hide()
         self.select_all_shortcut = QShortcut(QKeySequence("Ctrl+A"), self)
         self.select_all_shortcut.activated.connect(self.select_all_images)
 
+        # 최근 동작의 소요 시간/SQL 개수와 백분위수를 상태 표시줄에 보여준다
+        self.pending_label = QLabel(self)
+        self.statusBar().addPermanentWidget(self.pending_label)
+        self.perf_label = QLabel(self)
+        self.statusBar().addPermanentWidget(self.perf_label)
+        self.perf_timer = QTimer(self)
+        self.perf_timer.timeout.connect(self.update_perf_overlay)
+        self.perf_label.setVisible(profiler.enabled)
+        if profiler.enabled:
+            self.perf_timer.start(500)
+
     def select_all_images(self):
-        for i in range(self.grid_layout.rowCount()):
-            for j in range(self.grid_layout.columnCount()):
-                item = self.grid_layout.itemAtPosition(i, j)
-                if item:
-                    widget = item.widget()
-                    if isinstance(widget, ImageLabel):
-                        widget.setSelected(True)
-                        self.toggle_image_selection(True, widget.image_path)
-        self.display_images()
+        if self.scroll_mode:
+            self.scroll_view.selectAll()
+            return
+        # 테두리만 다시 그린다 (DB 조회/디코딩 없음)
+        with profiler.action('select_all'):
+            for label in self.tile_labels.values():
+                label.setSelected(True)
+                self.toggle_image_selection(True, label.ladybird_id)
+
+    def select_all_matching(self):
+        # 현재 클래스 필터/NPY 에 맞는 전체를 id 목록 없이 선택한다
+        if not self.db_session:
+            QMessageBox.warning(self, "Warning", "Please load database first.")
+            return
+        total_count = self.pager.count(self.filter_key(), self.build_query())
+        self.selection.select_query(self.class_filters, self.npy_subset, total_count)
+        for label in self.tile_labels.values():
+            label.setSelected(True)
+        if self.scroll_mode:
+            self.scroll_view.selectAll()
+        self.statusBar().showMessage(f"{total_count} images selected", 3000)
         
     def load_db(self):
         options = QFileDialog.Options()
         initial_dir = '/data1/lpf/database/'
         db_path, _ = QFileDialog.getOpenFileName(self, "Select DB File", initial_dir, "SQLite Files (*.db);;All Files (*)", options=options)
         if db_path:
+            if not self.close_write_queue():
+                return
             try:
-                engine = create_engine(f'sqlite:///{db_path}')
+                # NPY 임시 테이블이 유지되도록 UI 는 하나의 connection 만 사용한다
+                engine = open_engine(db_path, poolclass=StaticPool)
+                profiler.watch(engine)
                 Base.metadata.bind = engine
                 DBSession = sessionmaker(bind=engine)
                 self.db_session = DBSession()
+                self.manifest = DatasetManifest(db_path, self.data_root)
+                profiler.watch(self.manifest.engine)
+                self.close_overview()
+                self.stop_similarity_build()
+                self.db_path = db_path
+                self.tile_atlas = None
+                self.similarity_index = None
+                self.detail_loader.clear()
+                if self.detail_window is not None:
+                    self.detail_window.db_session = self.db_session
+                    self.detail_window.update_detail(None)
+                if self.npy_subset is not None:
+                    self.npy_subset.attach(self.db_session)
+                self.change_feed.sync(self.db_session, lambda: self.label_stats.load(self.db_session))
+                self.selection.clear()
+                self.write_queue = WriteQueue(db_path, self, client=self.client)
+                self.write_queue.committed.connect(self.on_writes_committed)
+                self.write_queue.failed.connect(self.on_writes_failed)
+                self.write_queue.start()
+                self.data_version += 1
+                self.pager.invalidate()
                 self.load_all_classes()
                 self.load_class_filters()
                 self.display_images()
+                self.change_timer.start(self.change_poll_interval)
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"An error occurred while loading the database: {str(e)}")
 
@@ -306,12 +644,20 @@ class MainWindow(QMainWindow):
         npy_path, _ = QFileDialog.getOpenFileName(self, "Select NPY File", "", "Numpy Files (*.npy)", options=options)
         if npy_path:
             try:
-                npy_paths = np.load(npy_path, allow_pickle=True)
-                self.npy_paths = [path.split('/')[4] for path in npy_paths]
-                self.current_page = 0
-                npy_filename = os.path.basename(npy_path)
-                self.setWindowTitle(f'Tag Bug - {npy_filename}')
-                self.display_images()
+                with profiler.action('load_npy'):
+                    self.clear_query_selection()
+                    self.set_pager()
+                    self.previous_view = None
+                    with profiler.span('npy.read'):
+                        self.npy_subset = NpySubset(load_npy_ids(npy_path))
+                    if self.db_session:
+                        with profiler.span('npy.attach'):
+                            self.npy_subset.attach(self.db_session)
+                    self.data_version += 1
+                    self.current_page = 0
+                    npy_filename = os.path.basename(npy_path)
+                    self.setWindowTitle(f'Tag Bug - {npy_filename}')
+                    self.display_images()
                 
                 # Update label count window if it exists
                 # for child in self.children():
@@ -321,12 +667,26 @@ class MainWindow(QMainWindow):
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"An error occurred while loading the NPY file: {str(e)}")
 
+    def save_npy(self):
+        # 지금 보고 있는 subset (Remove from Path 로 뺀 것 반영) 을 정렬된 id 배열로 저장한다
+        if self.npy_subset is None:
+            QMessageBox.warning(self, "Warning", "No NPY subset is loaded.")
+            return
+        options = QFileDialog.Options()
+        npy_path, _ = QFileDialog.getSaveFileName(self, "Save NPY File", "", "Numpy Files (*.npy)", options=options)
+        if npy_path:
+            try:
+                if not npy_path.endswith('.npy'):
+                    npy_path += '.npy'
+                self.npy_subset.save(npy_path)
+                QMessageBox.information(self, "Success", f"{len(self.npy_subset)} ids saved to {os.path.basename(npy_path)}.")
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"An error occurred while saving the NPY file: {str(e)}")
+
     def load_all_classes(self):
         if self.db_session:
             try:
-                classes = self.db_session.query(LadybirdDB.class_).distinct().all()
-                new_classes = {cls[0] if cls[0] else 'None' for cls in classes}
-                self.update_new_classes(new_classes)
+                self.update_new_classes(self.label_stats.classes())
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"An error occurred while loading all classes: {str(e)}")
 
@@ -350,7 +710,7 @@ class MainWindow(QMainWindow):
 
     def update_class_filter_menu(self):
         for action in self.view_menu.actions():
-            if action.text() not in ['NPY Deactivate', 'All Activate', 'All Deactivate', 'Label Count']:
+            if action.text() not in self.view_action_list + ['Label Count']:
                 self.view_menu.removeAction(action)
         self.view_menu.addSeparator()
         for cls in self.all_classes:
@@ -370,74 +730,279 @@ class MainWindow(QMainWindow):
     def all_activate(self):
         self.class_filters = self.all_classes.copy()
         for action in self.view_menu.actions():
-            if action.text() not in ['NPY Deactivate', 'All Activate', 'All Deactivate']:
+            if action.text() not in self.view_action_list:
                 action.setChecked(True)
         self.display_images()
 
     def all_deactivate(self):
         self.class_filters.clear()
         for action in self.view_menu.actions():
-            if action.text() not in ['NPY Deactivate', 'All Activate', 'All Deactivate']:
+            if action.text() not in self.view_action_list:
                 action.setChecked(False)
         self.display_images()
 
     def display_images(self):
-        for i in reversed(range(self.grid_layout.count())): 
-            widget_to_remove = self.grid_layout.itemAt(i).widget()
-            self.grid_layout.removeWidget(widget_to_remove)
-            widget_to_remove.setParent(None)
-        self.load_all_classes()
-        if self.db_session:
-            query = self.db_session.query(LadybirdDB).filter(LadybirdDB.class_.in_(self.class_filters))
-            if self.npy_paths is not None:
-                query = query.filter(LadybirdDB.id.in_(self.npy_paths))
-            total_count = query.count()
-            start_index = self.current_page * self.images_per_page
-            ladybirds = query.offset(start_index).limit(self.images_per_page).all()
+        with profiler.action('display_images'):
+            self.load_all_classes()
+            if self.scroll_mode or not self.db_session:
+                for label in self.grid_slots:
+                    label.clear_tile()
+                self.tile_labels = {}
+            if self.scroll_mode:
+                if self.db_session:
+                    self.total_count = self.pager.count(self.filter_key(), self.build_query())
+                    self.page_info_label.setText(f"Total Images: {self.total_count}")
+                self.scroll_model.set_query(self.build_query() if self.db_session else None, self.grayscale)
+                return
+            if self.db_session:
+                self.tile_size = self.current_tile_size()
+                with profiler.span('page.count'):
+                    self.total_count = self.pager.count(self.filter_key(), self.build_query())
+                start_index = self.current_page * self.images_per_page
+                with profiler.span('page.ids'):
+                    ladybird_ids = self.without_pending(self.fetch_page_ids(self.current_page))
             
-            self.page_info_label.setText(f"Page: {start_index + 1} - {start_index + len(ladybirds)} / Total Images: {total_count}")
+                self.page_info_label.setText(f"Page: {start_index + 1} - {start_index + len(ladybird_ids)} / Total Images: {self.total_count}")
             
-            position = [(i, j) for i in range(self.grid_height) for j in range(self.grid_width)]
+                self.ensure_grid_slots()
+                with profiler.span('page.resolve'):
+                    self.resolve_entries(ladybird_ids)
+                    image_paths = [self.resolve_image_path(ladybird_id) for ladybird_id in ladybird_ids]
+                image_paths += [None] * (len(self.grid_slots) - len(image_paths))
+                selected = self.selection.selected_among(self.db_session, ladybird_ids)
+                # 같은 칸에 같은 이미지가 이미 그려져 있으면 다시 읽지 않는다
+                stale = [path for label, path in zip(self.grid_slots, image_paths)
+                         if path and not self.tile_is_current(label, path)]
+                with profiler.span('page.tiles'):
+                    generation, images = self.tile_loader.request(stale, self.tile_size, self.tile_size, self.grayscale)
+                self.tile_labels = {}
             
-            for pos, ladybird in zip(position, ladybirds):
-                base_path = f'/data1/lpf/augmented_230823/{ladybird.id}/ladybirds/'
-                if os.path.exists(base_path):
-                    for filename in os.listdir(base_path)[:1]:
-                        image_path = os.path.join(base_path, filename)
-                        label = ImageLabel(image_path, self)
-                        pixmap = self.load_image(image_path)
-                        if pixmap:
-                            pixmap = pixmap.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                            label.setPixmap(pixmap)
-                            if image_path in self.selected_images:
-                                label.setSelected(True)
-                            self.grid_layout.addWidget(label, *pos)
-                        else:
-                            error_label = QLabel(f"Failed to load image: {image_path}", self)
-                            self.grid_layout.addWidget(error_label, *pos)
-
-        # Update label count window if it exists
-        # for child in self.children():
-        #     if isinstance(child, LabelCountWindow):
-        #         child.update_counts()
-
-    def load_image(self, image_path):
-        if os.path.exists(image_path):
-            image = QImage(image_path)
-            if not image.isNull():
-                if self.grayscale:
-                    image = image.convertToFormat(QImage.Format_Grayscale8)
-                return QPixmap.fromImage(image)
-            else:
-                return QPixmap.fromImage(image)
-        print(f"Cannot load image: {image_path}")
-        return None
+                with profiler.span('page.widgets'):
+                    for label, ladybird_id, image_path in zip(self.grid_slots, ladybird_ids + [None] * len(self.grid_slots), image_paths):
+                        if not image_path:
+                            label.clear_tile()
+                            continue
+                        if not self.tile_is_current(label, image_path):
+                            image = images.get(image_path)
+                            # 디코딩이 끝날 때까지 placeholder 를 보여준다
+                            if image is not None:
+                                label.image_path = image_path
+                                label.set_image(image, self.grayscale)
+                            else:
+                                label.set_tile(image_path, self.placeholder_for(self.tile_size))
+                        label.ladybird_id = ladybird_id
+                        label.tile_size = self.tile_size
+                        label.setSelected(ladybird_id in selected)
+                        label.show()
+                        self.tile_labels[image_path] = label
 
-    def next_page(self):
+                # 현재 페이지를 그린 뒤 이웃 페이지를 미리 읽어 둔다
+                QTimer.singleShot(0, self.prefetch_neighbours)
+
+            # Update label count window if it exists
+            # for child in self.children():
+            #     if isinstance(child, LabelCountWindow):
+            #         child.update_counts()
+
+    def ensure_grid_slots(self):
+        # 격자 크기가 바뀔 때만 라벨을 새로 만든다
+        if self.grid_shape == (self.grid_width, self.grid_height):
+            return
+        for label in self.grid_slots:
+            self.grid_layout.removeWidget(label)
+            label.setParent(None)
+        self.grid_slots = []
+        for i in range(self.grid_height):
+            for j in range(self.grid_width):
+                label = ImageLabel(None, self)
+                label.hide()
+                self.grid_layout.addWidget(label, i, j)
+                self.grid_slots.append(label)
+        self.grid_shape = (self.grid_width, self.grid_height)
+
+    def tile_is_current(self, label, image_path):
+        return (label.image_path == image_path and label.image is not None
+                and label.grayscale == self.grayscale and label.tile_size == self.tile_size)
+
+    def current_tile_size(self):
+        # 격자 한 칸의 실제 크기 (창이 아직 배치되지 않았으면 기본 크기)
+        rect = self.grid_layout.geometry()
+        if not self.isVisible() or rect.width() <= 0 or rect.height() <= 0:
+            return THUMBNAIL_SIZE
+        spacing = max(self.grid_layout.spacing(), 0)
+        cell_width = (rect.width() - spacing * (self.grid_width - 1)) // self.grid_width
+        cell_height = (rect.height() - spacing * (self.grid_height - 1)) // self.grid_height
+        size = (min(cell_width, cell_height) - 4) // TILE_SIZE_STEP * TILE_SIZE_STEP
+        return max(MIN_TILE_SIZE, min(MAX_TILE_SIZE, size))
+
+    def placeholder_for(self, size):
+        if size not in self.placeholders:
+            placeholder = QPixmap(size, size)
+            placeholder.fill(Qt.lightGray)
+            self.placeholders[size] = placeholder
+        return self.placeholders[size]
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resize_timer.start(150)
+
+    def on_resized(self):
+        if self.db_session and not self.scroll_mode and self.current_tile_size() != self.tile_size:
+            self.display_images()
+
+    def resize_for_grid(self):
+        # 이미지 크기(100) + 여백(20)을 고려한 새로운 창 크기 계산
+        new_window_width = (self.grid_width * 100)  # 좌우 여백 40px 추가
+        new_window_height = (self.grid_height * 126)  # 상단 메뉴바, 버튼 등 고려하여 120px 추가
+        # 화면보다 크면 화면에 맞추고 타일을 줄인다
+        screen = QApplication.primaryScreen()
+        if screen is not None:
+            available = screen.availableGeometry()
+            new_window_width = min(new_window_width, available.width())
+            new_window_height = min(new_window_height, available.height())
+        
+        # 창 크기 조정
+        self.resize(new_window_width, new_window_height)
+
+    def build_query(self):
         query = self.db_session.query(LadybirdDB).filter(LadybirdDB.class_.in_(self.class_filters))
-        if self.npy_paths is not None:
-            query = query.filter(LadybirdDB.id.in_(self.npy_paths))
-        total_count = query.count()
+        if self.npy_subset is not None:
+            query = self.npy_subset.filter(query)
+        return query
+
+    def without_pending(self, ladybird_ids):
+        # 아직 커밋되지 않은 태그/삭제로 현재 필터에서 빠지는 id 는 미리 숨긴다
+        if not self.pending_edits:
+            return ladybird_ids
+        visible = []
+        for ladybird_id in ladybird_ids:
+            pending = self.pending_edits.get(ladybird_id)
+            if pending is None or pending is not PENDING_DELETE and pending in self.class_filters:
+                visible.append(ladybird_id)
+        return visible
+
+    def pending_previous(self, ladybird_ids):
+        # 라벨 통계를 바로 갱신할 수 있도록 대기 중인 변경까지 반영한 현재 클래스를 센다
+        previous = Counter()
+        stored = []
+        for ladybird_id in ladybird_ids:
+            pending = self.pending_edits.get(ladybird_id)
+            if pending is None:
+                stored.append(ladybird_id)
+            elif pending is not PENDING_DELETE:
+                previous[pending] += 1
+        for chunk in chunked(stored, MAX_VARIABLES - 1):
+            previous.update(count_classes(self.db_session, chunk))
+        return previous
+
+    def filter_key(self):
+        return (frozenset(self.class_filters), self.data_version)
+
+    def fetch_page_ids(self, page):
+        key = self.filter_key() + (self.images_per_page, page)
+        if key in self.page_buffer:
+            self.page_buffer.move_to_end(key)
+            return self.page_buffer[key]
+        ladybird_ids = self.pager.page_ids(self.filter_key(), self.build_query(), page)
+        self.page_buffer[key] = ladybird_ids
+        while len(self.page_buffer) > self.page_buffer_size:
+            self.page_buffer.popitem(last=False)
+        return ladybird_ids
+
+    def prefetch_neighbours(self):
+        if not self.db_session or self.prefetch_pages <= 0 and not self.prefetch_previous:
+            return
+        last_page = (self.total_count - 1) // self.images_per_page
+        pages = [self.current_page + i for i in range(1, self.prefetch_pages + 1)]
+        if self.prefetch_previous:
+            pages.append(self.current_page - 1)
+        ladybird_ids = []
+        with profiler.span('prefetch.ids'):
+            for page in pages:
+                if 0 <= page <= last_page:
+                    ladybird_ids.extend(self.fetch_page_ids(page))
+        self.tile_loader.prefetch(ladybird_ids, self.resolve_image_path, self.tile_size, self.tile_size, self.grayscale)
+
+    def tile_buffer_capacity(self):
+        return self.images_per_page * (2 + self.prefetch_pages + int(self.prefetch_previous))
+
+    def show_prefetch_dialog(self):
+        pages, ok = QInputDialog.getInt(self, "Prefetch Pages", "Pages to prefetch ahead:", self.prefetch_pages, 0, 10)
+        if ok:
+            self.prefetch_pages = pages
+            self.tile_loader.resize(self.tile_buffer_capacity())
+
+    def toggle_prefetch_previous(self):
+        self.prefetch_previous = not self.prefetch_previous
+        self.tile_loader.resize(self.tile_buffer_capacity())
+
+    def resolve_entries(self, ladybird_ids):
+        # 경로와 크기/mtime 은 manifest 에서만 가져온다 (원본 파일 stat/listdir 없음)
+        if not self.manifest:
+            return {}
+        entries = self.manifest.resolve(ladybird_ids)
+        for entry in entries.values():
+            self.thumbnail_cache.remember_source(entry.ladybird_path, entry.ladybird_mtime, entry.ladybird_size)
+            self.thumbnail_cache.remember_source(entry.pattern_path, entry.pattern_mtime, entry.pattern_size)
+        return entries
+
+    def resolve_image_path(self, ladybird_id):
+        return self.resolve_entries([ladybird_id]).get(ladybird_id, MISSING_ENTRY).ladybird_path
+
+    def set_data_root(self):
+        if self.manifest_thread is not None and self.manifest_thread.isRunning():
+            QMessageBox.warning(self, "Warning", "The manifest is being refreshed. Try again when it finishes.")
+            return
+        root = QFileDialog.getExistingDirectory(self, "Select Data Root", self.data_root)
+        if root:
+            try:
+                self.data_root = root
+                if self.db_path:
+                    # 저장된 경로는 예전 root 기준이라 manifest 가 비우고 다시 읽는다
+                    self.manifest = DatasetManifest(self.db_path, root)
+                    profiler.watch(self.manifest.engine)
+                    self.detail_loader.clear()
+                    self.display_images()
+                    QMessageBox.information(self, "Success", f"Reading images from {root} ({self.manifest.source.kind}).")
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"An error occurred while opening the data root: {str(e)}")
+
+    def refresh_manifest(self):
+        if not self.manifest:
+            QMessageBox.warning(self, "Warning", "Please load database first.")
+            return
+        if self.manifest_thread is not None and self.manifest_thread.isRunning():
+            return
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.manifest_thread = ManifestRefreshThread(self.manifest, self)
+        self.manifest_thread.progress.connect(self.update_progress)
+        self.manifest_thread.finished.connect(self.on_manifest_refreshed)
+        self.manifest_thread.start()
+
+    def update_progress(self, done, total):
+        self.progress_bar.setMaximum(max(total, 1))
+        self.progress_bar.setValue(done)
+
+    def on_manifest_refreshed(self):
+        self.progress_bar.hide()
+        self.statusBar().showMessage(f"Manifest refreshed: {self.manifest_thread.changed} entries changed.", 5000)
+        self.detail_loader.clear()
+        self.display_images()
+
+    def on_tile_loaded(self, generation, image_path, image):
+        if generation != self.tile_loader.generation:
+            return
+        label = self.tile_labels.get(image_path)
+        if label is None:
+            return
+        if image.isNull():
+            label.setText(f"Failed to load image: {image_path}")
+        else:
+            label.set_image(image, self.grayscale)
+
+    def next_page(self):
+        total_count = self.pager.count(self.filter_key(), self.build_query())
         if (self.current_page + 1) * self.images_per_page < total_count:
             self.current_page += 1
             self.display_images()
@@ -447,96 +1012,513 @@ class MainWindow(QMainWindow):
             self.current_page -= 1
             self.display_images()
 
+    def go_to_page(self):
+        if not self.db_session:
+            return
+        page_count = self.pager.page_count(self.filter_key(), self.build_query())
+        page, ok = QInputDialog.getInt(self, "Go to Page", f"Page (1 - {page_count}):", self.current_page + 1, 1, page_count)
+        if ok:
+            self.current_page = page - 1
+            self.display_images()
+
+    def show_export_dialog(self):
+        # 지금 필터 (클래스 + NPY) 에 맞는 행을 학습용 목록으로 내보낸다. tag_cli export 와 같은 코드를 쓴다
+        if not self.db_session:
+            QMessageBox.warning(self, "Warning", "Please load database first.")
+            return
+        if self.export_thread is not None and self.export_thread.isRunning():
+            QMessageBox.warning(self, "Warning", "An export is already running.")
+            return
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Export Filtered")
+        layout = QVBoxLayout()
+
+        format_combo = QComboBox()
+        format_combo.addItems(['CSV (id, class)', 'NPY (ids)'])
+        split_check = QCheckBox("One file per class")
+        sample_combo = QComboBox()
+        sample_combo.addItems(['All rows', 'At most N per class', 'Fraction of each class'])
+        sample_input = QLineEdit('1000')
+        sample_layout = QHBoxLayout()
+        sample_layout.addWidget(sample_combo)
+        sample_layout.addWidget(sample_input)
+        path_root_input = QLineEdit()
+        # Load NPY 는 '/a/b/c/{id}/...' 처럼 네 번째 '/' 다음을 id 로 읽는다
+        path_root_input.setPlaceholderText(f"Optional: write '<root>/<id>' paths, e.g. {self.data_root}")
+        export_button = QPushButton("Export")
+        export_button.clicked.connect(dialog.accept)
+
+        layout.addWidget(QLabel(f"{self.total_count} rows match the current filter."))
+        layout.addWidget(format_combo)
+        layout.addWidget(split_check)
+        layout.addLayout(sample_layout)
+        layout.addWidget(path_root_input)
+        layout.addWidget(export_button)
+        dialog.setLayout(layout)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+
+        output_format = 'npy' if format_combo.currentIndex() == 1 else 'csv'
+        options = {'output_format': output_format, 'split': split_check.isChecked(),
+                   'path_root': path_root_input.text().strip() or None}
+        try:
+            if sample_combo.currentIndex() == 1:
+                options['per_class'] = int(sample_input.text())
+            elif sample_combo.currentIndex() == 2:
+                options['fraction'] = float(sample_input.text())
+        except ValueError:
+            QMessageBox.warning(self, "Error", "Please enter a valid sample size")
+            return
+        if not 0 < options.get('fraction', 1) <= 1 or options.get('per_class', 0) < 0:
+            QMessageBox.warning(self, "Error", "The fraction must be in (0, 1] and the sample size must not be negative")
+            return
+        file_filter = "Numpy Files (*.npy)" if output_format == 'npy' else "CSV Files (*.csv)"
+        output, _ = QFileDialog.getSaveFileName(self, "Export File", "", file_filter)
+        if not output:
+            return
+        if not output.endswith('.' + output_format):
+            output += '.' + output_format
+        # 대기 중인 태그/삭제까지 반영해서 내보낸다
+        if not self.flush_writes():
+            return
+        subset_ids = None if self.npy_subset is None else self.npy_subset.ids()
+        self.export_thread = ExportThread(self.db_path, self.class_filters, subset_ids, output, options, self)
+        self.export_thread.progress.connect(self.update_progress)
+        self.export_thread.finished.connect(self.on_export_finished)
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.export_thread.start()
+
+    def on_export_finished(self):
+        self.progress_bar.hide()
+        thread = self.export_thread
+        if thread.error is not None:
+            QMessageBox.critical(self, "Error", f"An error occurred while exporting: {str(thread.error)}")
+            return
+        counts = ', '.join(f"{name}: {count}" for name, count in named_totals(thread.totals))
+        QMessageBox.information(self, "Success", f"{sum(thread.totals.values())} rows exported to {os.path.basename(thread.output)}.\n{counts}")
+
     def npy_deactivate(self):
-        self.npy_paths = None
+        self.clear_query_selection()
+        self.set_pager()
+        self.previous_view = None
+        if self.npy_subset is not None:
+            self.npy_subset.detach()
+        self.npy_subset = None
+        self.data_version += 1
         self.setWindowTitle('Tag Bug')
         self.display_images()
 
     def remove_selected_images(self):
-        if not self.selected_images:
+        if not self.selection:
             QMessageBox.warning(self, "Warning", "No images selected.")
             return
         
-        reply = QMessageBox.question(self, 'Confirm', f'{len(self.selected_images)} images will be deleted from DB.',
+        reply = QMessageBox.question(self, 'Confirm', f'{len(self.selection)} images will be deleted from DB.',
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            for image_path in self.selected_images:
-                ladybird_id = os.path.basename(os.path.dirname(os.path.dirname(image_path)))
-                ladybird = self.db_session.query(LadybirdDB).filter_by(id=ladybird_id).first()
-                if ladybird:
-                    self.db_session.delete(ladybird)
-            
-            self.db_session.commit()
+            if not self.selection.is_query():
+                with profiler.action('delete'):
+                    ladybird_ids = list(self.selection.ids)
+                    previous = self.pending_previous(ladybird_ids)
+                    self.queue_write('delete', ladybird_ids, PENDING_DELETE, previous)
+                    self.label_stats.apply_delete(previous)
+                    if self.scroll_mode:
+                        self.scroll_view.clearSelection()
+                        self.selection.clear()
+                        self.update_scroll_rows(ladybird_ids, [])
+                    else:
+                        self.selection.clear()
+                        self.display_images()
+                QMessageBox.information(self, "Success", f"{sum(previous.values())} selected images removed from DB.")
+                return
+            if not self.flush_writes():
+                return
+            try:
+                with profiler.action('delete'):
+                    result = query_delete(self.db_session, self.selection.query(self.db_session), self.client)
+                    self.db_session.commit()
+            except Exception as e:
+                self.db_session.rollback()
+                QMessageBox.critical(self, "Error", f"An error occurred while removing images: {str(e)}")
+                return
+            self.label_stats.apply_delete(result.previous)
+            self.data_version += 1
+            self.pager.invalidate()
             
-            self.selected_images.clear()
+            self.selection.clear()
             self.display_images()
-            QMessageBox.information(self, "Success", "Selected images removed from DB.")
+            QMessageBox.information(self, "Success", f"{result.affected} selected images removed from DB.")
 
     def remove_from_path(self):
-        if not self.selected_images:
+        if not self.selection:
             QMessageBox.warning(self, "Warning", "No images selected.")
             return
         
-        reply = QMessageBox.question(self, 'Confirm', f'{len(self.selected_images)} images will be removed from path.',
+        reply = QMessageBox.question(self, 'Confirm', f'{len(self.selection)} images will be removed from path.',
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            for image_path in self.selected_images:
-                ladybird_id = os.path.basename(os.path.dirname(os.path.dirname(image_path)))
-                if self.npy_paths is not None and ladybird_id in self.npy_paths:
-                    self.npy_paths.remove(ladybird_id)
-            self.selected_images.clear()
+            if self.npy_subset is not None:
+                # 쿼리 전체 선택이면 조건에 맞는 id 를 나눠서 읽어 온 뒤 제거한다
+                self.npy_subset.remove(list(self.selection.iter_ids(self.db_session)))
+            self.data_version += 1
+            self.selection.clear()
             self.display_images()
             QMessageBox.information(self, "Success", "Selected images removed from path.")
 
-    def toggle_image_selection(self, selected, image_path):
+    def toggle_image_selection(self, selected, ladybird_id):
         if selected:
-            self.selected_images.add(image_path)
+            self.selection.add(ladybird_id)
         else:
-            self.selected_images.discard(image_path)
+            self.selection.discard(ladybird_id)
+
+    def clear_query_selection(self):
+        # 쿼리 전체 선택은 NPY 임시 테이블을 참조하므로 NPY 가 바뀌면 해제한다
+        if self.selection.is_query():
+            self.selection.clear()
 
     def update_image_class(self, new_class):
-        if not self.selected_images:
+        if not self.selection:
             QMessageBox.warning(self, "Warning", "No images selected.")
             return
         
-        for image_path in self.selected_images:
-            ladybird_id = os.path.basename(os.path.dirname(os.path.dirname(image_path)))
-            ladybird = self.db_session.query(LadybirdDB).filter_by(id=ladybird_id).first()
-            if ladybird:
-                ladybird.class_ = new_class
+        with profiler.action('tag'):
+            self.tag_selected(new_class)
+
+    def tag_selected(self, new_class):
+        if not self.selection.is_query():
+            # 화면과 통계에는 바로 반영하고 DB 쓰기는 백그라운드 writer 가 모아서 커밋한다
+            ladybird_ids = list(self.selection.ids)
+            previous = self.pending_previous(ladybird_ids)
+            self.queue_write('tag', ladybird_ids, new_class, previous)
+            self.label_stats.apply_retag(previous, new_class)
+            self.statusBar().showMessage(f"{len(ladybird_ids)} images tagged as {new_class}.", 3000)
+            if self.scroll_mode:
+                self.scroll_view.clearSelection()
+            self.selection.clear()
+            self.load_all_classes()
+            if self.scroll_mode:
+                self.update_scroll_rows(ladybird_ids if new_class not in self.class_filters else [], [])
             else:
-                QMessageBox.critical(self, "Error", f"Image {image_path} not found in the database.")
-                return
+                self.display_images()
+            return
+
+        # 쿼리 전체 선택은 대기 중인 쓰기를 먼저 커밋한 뒤 조건을 그대로 UPDATE 한다
+        if not self.flush_writes():
+            return
+        with profiler.span('tag.update'):
+            ladybird_id = self.selection.first(self.db_session)
+            result = query_update_class(self.db_session, self.selection.query(self.db_session), new_class, self.client)
             
-        if self.selected_images:
-            image_path = list(self.selected_images)[0]
-            ladybird_id = os.path.basename(os.path.dirname(os.path.dirname(image_path)))
+        if ladybird_id is not None:
             if hasattr(self, 'detail_window') and self.detail_window is not None:
                 self.detail_window.update_detail(ladybird_id)
 
-        print(f"\n{len(self.selected_images)}개의 이미지가 {new_class} 클래스로 추가되었습니다.")                
-        self.db_session.commit()
-        self.selected_images.clear()
+        with profiler.span('tag.commit'):
+            self.db_session.commit()
+        self.label_stats.apply_retag(result.previous, new_class)
+        self.data_version += 1
+        self.pager.invalidate()
+        self.selection.clear()
         self.load_all_classes()
         self.display_images()
+        self.statusBar().showMessage(f"{result.affected} images tagged as {new_class}.", 3000)
+
+    def queue_write(self, kind, ladybird_ids, pending, previous=None):
+        self.write_queue.submit(kind, ladybird_ids, None if kind == 'delete' else pending, previous)
+        for ladybird_id in ladybird_ids:
+            self.pending_edits[ladybird_id] = pending
+        self.update_pending_label()
+
+    def on_writes_committed(self, results):
+        # 이미 닫은 writer 가 보낸 신호는 무시한다
+        if self.sender() is not self.write_queue:
+            return
+        missing = []
+        for op, result in results:
+            missing.extend(result.missing)
+            if op.previous is not None and op.previous != result.previous:
+                self.label_stats.correct(op.previous, result.previous, op.new_class)
+            value = PENDING_DELETE if op.kind == 'delete' else op.new_class
+            for ladybird_id in op.ladybird_ids:
+                # 같은 id 에 더 나중의 변경이 대기 중이면 남겨 둔다
+                if self.pending_edits.get(ladybird_id) == value:
+                    del self.pending_edits[ladybird_id]
+        if not self.write_queue.has_pending():
+            self.pending_edits = {}
+        # 바뀐 id 뒤쪽 페이지 경계만 다시 읽고 개수는 커밋 결과로 고친다 (필터 전체를 다시 세지 않는다)
+        changed = [ladybird_id for op, result in results for ladybird_id in op.ladybird_ids]
+        if changed:
+            self.pager.adjust(self.filter_key(), min(changed), self.committed_delta(results))
+            self.page_buffer.clear()
+        tag_ops = [op for op, result in results if op.kind == 'tag']
+        if tag_ops and self.detail_window is not None:
+            self.detail_window.update_detail(tag_ops[-1].ladybird_ids[0])
+        self.update_pending_label()
+        if self.scroll_mode:
+            # 화면에는 이미 반영했으므로 개수만 고친다
+            self.update_scroll_rows([], [])
+        else:
+            self.display_images()
+        if missing:
+            listed = ', '.join(missing[:10]) + (' ...' if len(missing) > 10 else '')
+            QMessageBox.warning(self, "Warning", f"{len(missing)} images were not found in the database: {listed}")
+
+    def committed_delta(self, results):
+        # 커밋된 쓰기로 현재 필터 (클래스 + NPY) 에 맞는 행 수가 얼마나 바뀌었는지. 알 수 없으면 None
+        delta = 0
+        for op, result in results:
+            if self.npy_subset is not None and not self.npy_subset.contains(op.ladybird_ids).all():
+                return None
+            before = sum(count for cls, count in result.previous.items() if cls in self.class_filters)
+            after = sum(result.previous.values()) if op.kind == 'tag' and op.new_class in self.class_filters else 0
+            delta += after - before
+        return delta
+
+    def on_writes_failed(self, error):
+        if self.sender() is not self.write_queue:
+            return
+        self.update_pending_label()
+        QMessageBox.critical(self, "Error", f"An error occurred while saving {self.write_queue.pending()} pending edits: {error}\n"
+                                            "The edits are kept. Use File > Flush Pending Edits to retry.")
+
+    def poll_changes(self):
+        # 다른 창/사람이 커밋한 태그/삭제를 가져와 바뀐 타일과 개수만 갱신한다
+        if not self.db_session:
+            return
+        try:
+            changes = self.change_feed.poll(self.db_session)
+        except OperationalError as e:
+            # 잠겨 있으면 다음 주기에 다시 읽는다
+            log.warning("could not read the change log: %s", e)
+            return
+        if changes is None:
+            self.reload_remote_changes()
+        elif changes:
+            self.apply_remote_changes(changes)
+
+    def reload_remote_changes(self):
+        # 대량 변경이나 놓친 변경이 있으면 개수와 페이지를 처음부터 다시 읽는다
+        self.change_feed.sync(self.db_session, lambda: self.label_stats.load(self.db_session))
+        self.data_version += 1
+        self.pager.invalidate()
+        self.load_all_classes()
+        self.display_images()
+        if self.detail_window is not None:
+            self.detail_window.update_detail(self.detail_window.ladybird_id)
+        self.statusBar().showMessage("Reloaded after changes from other annotators.", 3000)
+
+    def apply_remote_changes(self, changes):
+        self.label_stats.apply_changes(changes)
+        self.load_all_classes()
+        ladybird_ids = [change.ladybird_id for change in changes]
+        in_subset = self.npy_subset.contains(ladybird_ids) if self.npy_subset is not None else [True] * len(changes)
+        # 지금 필터 (클래스 + NPY) 에 들어오거나 빠진 id 만 목록을 바꾼다. 클래스만 바뀐 타일은 그대로 둔다
+        moved = {}
+        for change, member in zip(changes, in_subset):
+            before = change.previous_class in self.class_filters
+            after = change.kind == 'tag' and change.new_class in self.class_filters
+            if member and before != after:
+                moved[change.ladybird_id] = after
+        if not self.selection.is_query():
+            for change in changes:
+                if change.kind == 'delete':
+                    self.selection.discard(change.ladybird_id)
+        if moved:
+            self.pager.shift(self.filter_key(), min(moved))
+            self.page_buffer.clear()
+            if self.scroll_mode:
+                self.update_scroll_rows([ladybird_id for ladybird_id, after in moved.items() if not after],
+                                        sorted(ladybird_id for ladybird_id, after in moved.items() if after))
+            else:
+                # 같은 자리에 같은 이미지가 남은 타일은 다시 읽지 않는다
+                self.display_images()
+        if self.detail_window is not None and self.detail_window.ladybird_id in set(ladybird_ids):
+            self.detail_window.update_detail(self.detail_window.ladybird_id)
+        self.statusBar().showMessage(f"{len(changes)} changes from other annotators.", 3000)
+
+    def update_scroll_rows(self, removed, added):
+        # 연속 스크롤 model 을 다시 만들지 않고 필터에 들어오거나 빠진 행만 고친다 (읽어 둔 행과 스크롤 위치 유지)
+        self.total_count = self.pager.count(self.filter_key(), self.build_query())
+        self.page_info_label.setText(f"Total Images: {self.total_count}")
+        self.scroll_model.update_query(self.build_query())
+        self.scroll_model.update_ids(removed, added)
+
+    def update_pending_label(self):
+        pending = self.write_queue.pending() if self.write_queue is not None else 0
+        self.pending_label.setText(f"{pending} unsaved edits" if pending else "")
+
+    def wait_for_writes(self):
+        # UI 스레드를 막지 않도록 짧게 나눠 기다리며 이벤트를 처리한다.
+        # 오래 걸리면 진행 창을 띄우고, 취소하면 'cancelled' 를 돌려준다 (편집은 대기 상태로 남는다)
+        error = self.write_queue.flush(timeout=FLUSH_STEP)
+        if error != 'timed out':
+            return error
+        started = time.monotonic()
+        progress = None
+        polling = self.change_timer.isActive()
+        # 기다리는 동안 화면이 바뀌지 않게 변경 로그 읽기를 멈춘다
+        self.change_timer.stop()
+        try:
+            while error == 'timed out':
+                if progress is None and time.monotonic() - started >= FLUSH_DIALOG_DELAY:
+                    progress = QProgressDialog("", "Cancel", 0, 0, self)
+                    progress.setWindowTitle("Saving")
+                    progress.setWindowModality(Qt.WindowModal)
+                    progress.setMinimumDuration(0)
+                    progress.show()
+                if progress is None:
+                    # 진행 창이 뜨기 전에는 클릭/키 입력을 처리하지 않는다 (다시 들어오는 것을 막는다)
+                    QApplication.processEvents(QEventLoop.ExcludeUserInputEvents)
+                else:
+                    progress.setLabelText(f"Saving {self.write_queue.pending()} pending edits...")
+                    QApplication.processEvents()
+                    if progress.wasCanceled():
+                        return 'cancelled'
+                error = self.write_queue.flush(timeout=FLUSH_STEP)
+            return error
+        finally:
+            if progress is not None:
+                progress.close()
+            if polling:
+                self.change_timer.start()
+
+    def flush_writes(self):
+        if self.write_queue is None:
+            return True
+        error = self.wait_for_writes()
+        self.update_pending_label()
+        if error == 'cancelled':
+            self.statusBar().showMessage(f"{self.write_queue.pending()} edits are still being saved.", 3000)
+            return False
+        if error is not None:
+            QMessageBox.critical(self, "Error", f"An error occurred while saving pending edits: {error}")
+            return False
+        return True
+
+    def flush_pending_edits(self):
+        if self.flush_writes():
+            self.statusBar().showMessage("All edits saved.", 3000)
+
+    def close_write_queue(self):
+        # 다른 DB 를 열거나 창을 닫기 전에 남은 쓰기를 모두 커밋한다
+        if self.write_queue is None:
+            return True
+        while True:
+            error = self.wait_for_writes()
+            if error is None:
+                break
+            if error == 'cancelled':
+                self.update_pending_label()
+                return False
+            reply = QMessageBox.question(self, 'Unsaved Edits', f'{self.write_queue.pending()} edits could not be saved: {error}\nRetry?',
+                                         QMessageBox.Retry | QMessageBox.Discard | QMessageBox.Cancel, QMessageBox.Retry)
+            if reply == QMessageBox.Cancel:
+                return False
+            if reply == QMessageBox.Discard:
+                self.write_queue.discard()
+                break
+        self.write_queue.stop()
+        self.write_queue = None
+        self.change_timer.stop()
+        self.pending_edits = {}
+        self.update_pending_label()
+        return True
+
+    def toggle_scroll_mode(self):
+        self.scroll_mode = not self.scroll_mode
+        self.scroll_view.setVisible(self.scroll_mode)
+        for button in (self.prev_button, self.next_button, self.go_to_button):
+            button.setVisible(not self.scroll_mode)
+        self.display_images()
+
+    def on_scroll_selection_changed(self, selected, deselected):
+        for index in selected.indexes():
+            self.toggle_image_selection(True, index.data(Qt.DisplayRole))
+        for index in deselected.indexes():
+            self.toggle_image_selection(False, index.data(Qt.DisplayRole))
+
+    def on_scroll_model_reset(self):
+        # reset 은 view 의 선택을 deselect 신호 없이 지우므로 선택도 같이 비운다
+        if self.scroll_mode:
+            self.selection.clear()
+
+    def show_context_menu(self, global_pos, ladybird_id):
+        context_menu = QMenu(self)
+        
+        # Detail 메뉴 추가
+        detail_action = context_menu.addAction("Detail")
+        similar_action = context_menu.addAction("Find Similar")
+        
+        remove_menu = context_menu.addMenu("Remove")
+        remove_from_path_action = remove_menu.addAction("Remove from Path")
+        remove_from_db_action = remove_menu.addAction("Remove from DB")
+        tag_menu = context_menu.addMenu("Tag")
+        
+        for cls in self.all_classes:
+            tag_action = tag_menu.addAction(cls)
+            tag_action.triggered.connect(lambda checked, cls=cls: self.update_image_class(cls))
+        
+        tag_menu.addSeparator()
+        
+        add_tag_action = tag_menu.addAction("Add Tag")
+        add_tag_action.triggered.connect(self.add_new_tag)
         
-        # Update label count window if it exists
-        # for child in self.children():
-        #     if isinstance(child, LabelCountWindow):
-        #         child.update_counts()
+        action = context_menu.exec_(global_pos)
+
+        if action == remove_from_path_action:
+            self.remove_from_path()
+        elif action == remove_from_db_action:
+            self.remove_selected_images()
+        elif action == detail_action:
+            self.show_detail_for_image(ladybird_id)
+        elif action == similar_action:
+            # 선택한 타일이면 선택 전체, 아니면 이 타일 하나와 비슷한 것을 찾는다
+            in_selection = self.selection.selected_among(self.db_session, [ladybird_id])
+            self.sort_by_similarity(None if in_selection else [ladybird_id])
 
     def toggle_grayscale(self):
         self.grayscale = not self.grayscale
-        self.display_images()
+        if self.scroll_mode:
+            self.scroll_model.set_grayscale(self.grayscale)
+            self.scroll_view.load_visible()
+            return
+        with profiler.action('grayscale'):
+            self.apply_grayscale()
+
+    def apply_grayscale(self):
+        # 이미 디코딩한 타일은 변환만 하고, 컬러 원본이 없는 타일만 다시 요청한다
+        missing = []
+        for image_path, label in self.tile_labels.items():
+            if self.grayscale and label.image is not None:
+                image = label.image.convertToFormat(QImage.Format_Grayscale8)
+                self.tile_loader.buffer.put((image_path, self.tile_size, self.tile_size, True), image)
+                label.set_image(image, True)
+            elif not self.grayscale and label.color_image is not None:
+                label.set_image(label.color_image, False)
+            else:
+                missing.append(image_path)
+        generation, images = self.tile_loader.request(missing, self.tile_size, self.tile_size, self.grayscale)
+        for image_path, image in images.items():
+            self.tile_labels[image_path].set_image(image, self.grayscale)
+        if self.db_session:
+            QTimer.singleShot(0, self.prefetch_neighbours)
+
     def unselect_all(self):
-        self.selected_images.clear()
-        self.display_images()
+        self.selection.clear()
+        if self.scroll_mode:
+            self.scroll_view.clearSelection()
+            self.selection.clear()
+            return
+        for label in self.tile_labels.values():
+            label.setSelected(False)
 
     def add_new_tag(self):
         new_class, ok = QInputDialog.getText(self, "Add New Tag", "Enter new class:")
         if ok and new_class and new_class not in self.all_classes:
+            self.label_stats.add_class(new_class)
             self.update_new_classes({new_class})
             self.update_image_class(new_class)
 
@@ -559,21 +1541,13 @@ class MainWindow(QMainWindow):
             self.select_images_in_rect(selected_rect, event.modifiers() & Qt.ShiftModifier)
 
     def select_images_in_rect(self, rect, add_to_selection):
-        for i in range(self.grid_layout.rowCount()):
-            for j in range(self.grid_layout.columnCount()):
-                item = self.grid_layout.itemAtPosition(i, j)
-                if item:
-                    widget = item.widget()
-                    if isinstance(widget, ImageLabel):
-                        if rect.intersects(widget.geometry()):
-                            if add_to_selection:
-                                widget.selected = True
-                                widget.setStyleSheet("QLabel { border: 2px solid red; }")
-                                self.toggle_image_selection(True, widget.image_path)
-                            else:
-                                widget.selected = not widget.selected
-                                widget.setStyleSheet("QLabel { border: 2px solid %s; }" % ("red" if widget.selected else "transparent"))
-                                self.toggle_image_selection(widget.selected, widget.image_path)
+        for widget in self.tile_labels.values():
+            if rect.intersects(widget.geometry()):
+                if add_to_selection:
+                    widget.setSelected(True)
+                else:
+                    widget.setSelected(not widget.selected)
+                self.toggle_image_selection(widget.selected, widget.ladybird_id)
 
     def show_detail(self):
         if not self.detail_window:
@@ -581,10 +1555,13 @@ class MainWindow(QMainWindow):
         self.detail_window.show()
         
         # 현재 선택된 이미지가 있다면 업데이트
-        if self.selected_images:
-            image_path = list(self.selected_images)[0]
-            ladybird_id = os.path.basename(os.path.dirname(os.path.dirname(image_path)))
-            self.detail_window.update_detail(ladybird_id)
+        if self.selection:
+            self.detail_window.update_detail(self.selection.first(self.db_session))
+
+    def detail_neighbours(self, ladybird_id, count):
+        # 디테일 창에서 앞뒤로 넘길 id. 격자와 같은 필터/순서를 쓰고 커밋 대기 중인 변경도 반영한다
+        previous, following = self.pager.neighbours(self.build_query(), ladybird_id, count, count)
+        return self.without_pending(previous), self.without_pending(following)
 
     def show_detail_for_image(self, ladybird_id):
         if not self.detail_window:
@@ -629,27 +1606,281 @@ class MainWindow(QMainWindow):
                 self.grid_width = new_width
                 self.grid_height = new_height
                 self.images_per_page = self.grid_width * self.grid_height
-                
-                # 이미지 크기(100) + 여백(20)을 고려한 새로운 창 크기 계산
-                new_window_width = (self.grid_width * 100)  # 좌우 여백 40px 추가
-                new_window_height = (self.grid_height * 126)  # 상단 메뉴바, 버튼 등 고려하여 120px 추가
-                
-                # 창 크기 조정
-                self.resize(new_window_width, new_window_height)
+                self.tile_loader.resize(self.tile_buffer_capacity())
+                self.pager.set_page_size(self.images_per_page)
+                self.resize_for_grid()
                 
                 dialog.accept()
                 self.display_images()
         except ValueError:
             QMessageBox.warning(self, "Error", "Please enter valid numbers")
 
+    def toggle_perf_overlay(self, checked):
+        profiler.enable(checked or profiler.trace_file is not None)
+        self.perf_label.setVisible(checked)
+        if checked:
+            self.perf_timer.start(500)
+            self.update_perf_overlay()
+        else:
+            self.perf_timer.stop()
+            log.info("perf summary\n%s", profiler.summary())
+
+    def update_perf_overlay(self):
+        self.perf_label.setText(profiler.overlay_text())
+        self.perf_label.setToolTip(profiler.summary())
+
+    def toggle_perf_trace(self, checked):
+        if checked:
+            trace_path, _ = QFileDialog.getSaveFileName(self, "Save Trace File", "tag_bug_trace.json", "Trace Files (*.json)")
+            if not trace_path:
+                self.perf_trace_action.setChecked(False)
+                return
+            try:
+                profiler.start_trace(trace_path)
+            except OSError as e:
+                self.perf_trace_action.setChecked(False)
+                QMessageBox.critical(self, "Error", f"An error occurred while opening the trace file: {str(e)}")
+                return
+            profiler.enable()
+        else:
+            trace_path = profiler.stop_trace()
+            profiler.enable(self.perf_label.isVisible())
+            if trace_path:
+                QMessageBox.information(self, "Success", f"Trace saved to {trace_path}")
+
     def show_label_count(self):
         if self.db_session:
-            count_window = LabelCountWindow(self, self.db_session)
+            count_window = LabelCountWindow(self, self.db_session, self.label_stats)
             count_window.show()
         else:
             QMessageBox.warning(self, "Warning", "Please load database first.")
 
+    def show_overview(self):
+        if not self.db_session:
+            QMessageBox.warning(self, "Warning", "Please load database first.")
+            return
+        try:
+            # 아틀라스 파일은 overview 를 처음 열 때 만든다
+            if self.tile_atlas is None:
+                self.tile_atlas = TileAtlas(self.db_path)
+            self.close_overview()
+            self.overview_window = OverviewWindow(self, self.tile_atlas)
+            self.overview_window.show()
+            self.overview_window.load()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred while opening the overview: {str(e)}")
+
+    def close_overview(self):
+        if self.overview_window is not None:
+            self.overview_window.close()
+            self.overview_window = None
+
+    def show_ids(self, ladybird_ids, title, ordered=False):
+        # overview/유사도 결과의 id 들만 NPY 처럼 격자에 띄운다. ordered 면 주어진 순서대로 보여준다
+        self.clear_query_selection()
+        if ordered and not isinstance(self.pager, OrderedPager):
+            self.similarity_scope = self.npy_subset
+        self.set_pager(ladybird_ids if ordered else None)
+        if self.previous_view is None:
+            self.previous_view = (self.npy_subset, self.windowTitle())
+        if self.npy_subset is not None:
+            self.npy_subset.detach()
+        self.npy_subset = NpySubset(ladybird_ids)
+        self.npy_subset.attach(self.db_session)
+        self.data_version += 1
+        self.current_page = 0
+        self.setWindowTitle(f'Tag Bug - {title}')
+        self.display_images()
+        self.raise_()
+        self.activateWindow()
+
+    def close_result_view(self):
+        # show_ids 전에 보던 NPY (없으면 전체) 로 돌아간다
+        if self.previous_view is None:
+            return
+        subset, title = self.previous_view
+        self.previous_view = None
+        self.clear_query_selection()
+        self.set_pager()
+        if self.npy_subset is not None:
+            self.npy_subset.detach()
+        self.npy_subset = subset
+        if subset is not None and self.db_session:
+            subset.attach(self.db_session)
+        self.data_version += 1
+        self.current_page = 0
+        self.setWindowTitle(title)
+        self.display_images()
+
+    def set_pager(self, ordered_ids=None):
+        if ordered_ids is None:
+            if isinstance(self.pager, OrderedPager):
+                self.pager = Pager(self.images_per_page)
+            self.similarity_scope = None
+        else:
+            self.pager = OrderedPager(self.images_per_page, ordered_ids)
+
+    def similarity(self):
+        # 특징 파일은 처음 쓸 때 만든다
+        if self.similarity_index is None:
+            self.similarity_index = SimilarityIndex(self.db_path)
+        return self.similarity_index
+
+    def similarity_scope_subset(self):
+        if isinstance(self.pager, OrderedPager):
+            return self.similarity_scope
+        return self.npy_subset
+
+    def similarity_candidate_pages(self, index, chunk_size=50000):
+        # 현재 클래스 필터 (+ NPY) 에 맞는 id 를 keyset page 로 읽어 (id, slot) 으로 넘긴다 (전체 id 목록을 만들지 않는다).
+        # 유사도 순서로 보는 중이면 그 전 범위를 쓴다
+        scope = self.similarity_scope_subset()
+        query = self.db_session.query(LadybirdDB.id).filter(LadybirdDB.class_.in_(self.class_filters)).order_by(LadybirdDB.id)
+        last_id = None
+        while True:
+            page = query if last_id is None else query.filter(LadybirdDB.id > last_id)
+            ladybird_ids = np.asarray([row.id for row in page.limit(chunk_size)], dtype='S')
+            if len(ladybird_ids) == 0:
+                return
+            last_id = ladybird_ids[-1].decode()
+            in_scope = ladybird_ids if scope is None else ladybird_ids[scope.contains(ladybird_ids)]
+            yield in_scope, index.lookup(in_scope)
+            if len(ladybird_ids) < chunk_size:
+                return
+
+    def similarity_candidate_slots(self, index):
+        # (색인에 있는 후보 slot, 색인에 없는 후보 수)
+        found, missing = [np.empty(0, dtype=np.int64)], 0
+        for _, slots in self.similarity_candidate_pages(index):
+            found.append(slots[slots >= 0])
+            missing += int((slots < 0).sum())
+        return np.concatenate(found), missing
+
+    def filter_by_class(self, ladybird_ids):
+        # 클래스는 SQL 에 넣지 않고 읽은 뒤 거른다 (클래스가 많아도 chunk 크기가 줄지 않는다)
+        visible = set()
+        for chunk in chunked(ladybird_ids):
+            visible.update(row.id for row in self.db_session.query(LadybirdDB.id, LadybirdDB.class_).filter(
+                LadybirdDB.id.in_(chunk)) if row.class_ in self.class_filters)
+        return [ladybird_id for ladybird_id in ladybird_ids if ladybird_id in visible]
+
+    def ensure_features(self, ladybird_ids):
+        # 고른 id 에 특징이 없으면 바로 계산한다 (몇 개뿐이라 UI 스레드에서 해도 된다)
+        index = self.similarity()
+        missing = [ladybird_id for ladybird_id, slot in zip(ladybird_ids, index.lookup(ladybird_ids)) if slot < 0]
+        if not missing:
+            return
+        entries = self.resolve_entries(missing)
+        found, features = [], []
+        for ladybird_id in missing:
+            image_path = entries.get(ladybird_id, MISSING_ENTRY).ladybird_path
+            image = decode_tile(image_path, FEATURE_SIZE, FEATURE_SIZE, False) if image_path else QImage()
+            if not image.isNull():
+                found.append(ladybird_id)
+                features.append(image_features(image))
+        if found:
+            index.add(found, features)
+            index.flush()
+
+    def sort_by_similarity(self, ladybird_ids=None):
+        if not self.db_session:
+            QMessageBox.warning(self, "Warning", "Please load database first.")
+            return
+        if ladybird_ids is None:
+            ladybird_ids = list(islice(self.selection.iter_ids(self.db_session), 1000))
+        if not ladybird_ids:
+            QMessageBox.warning(self, "Warning", "No images selected.")
+            return
+        try:
+            with profiler.action('similar'):
+                index = self.similarity()
+                self.ensure_features(ladybird_ids[:50])
+                vector = index.query_vector(ladybird_ids)
+                if vector is None:
+                    QMessageBox.warning(self, "Warning", "Selected images could not be read.")
+                    return
+                scope = self.similarity_scope_subset()
+                slots = None
+                if scope is not None:
+                    slots = index.lookup(scope.ids())
+                    slots = slots[slots >= 0]
+                # 넉넉히 찾은 뒤 클래스 필터로 거른다. 필터가 좁아서 모자라면 필터에 맞는 id 안에서 다시 찾는다
+                found = index.nearest_ids(vector, self.similar_limit * 4, slots)
+                ranked = self.filter_by_class(found)[:self.similar_limit]
+                if len(ranked) < self.similar_limit and len(found) == self.similar_limit * 4:
+                    slots, _ = self.similarity_candidate_slots(index)
+                    ranked = index.nearest_ids(vector, self.similar_limit, slots)
+            if not ranked:
+                QMessageBox.information(self, "Information", "No indexed images match the current filter. Build the similarity index first.")
+                return
+            self.show_ids(ranked, f'similar to {len(ladybird_ids)} selected', ordered=True)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred while searching similar images: {str(e)}")
+
+    def group_near_duplicates(self):
+        if not self.db_session:
+            QMessageBox.warning(self, "Warning", "Please load database first.")
+            return
+        try:
+            with profiler.action('near_duplicates'):
+                index = self.similarity()
+                slots, missing = self.similarity_candidate_slots(index)
+                groups = index.duplicate_groups(slots)
+            if missing:
+                self.statusBar().showMessage(f"{missing} images are not in the similarity index yet (Similarity > Build Similarity Index)", 5000)
+            if not groups:
+                QMessageBox.information(self, "Information", "No near-duplicates found.")
+                return
+            ranked = [ladybird_id for group in groups for ladybird_id in index.store.ids_at(group)]
+            self.show_ids(ranked, f'{len(groups)} near-duplicate groups', ordered=True)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred while grouping near-duplicates: {str(e)}")
+
+    def build_similarity_index(self):
+        if not self.manifest:
+            QMessageBox.warning(self, "Warning", "Please load database first.")
+            return
+        if self.similarity_thread is not None and self.similarity_thread.isRunning():
+            return
+        index = self.similarity()
+        missing = [ladybird_id for ladybird_ids, slots in self.similarity_candidate_pages(index)
+                   for ladybird_id in ladybird_ids[slots < 0].astype('U').tolist()]
+        if not missing:
+            QMessageBox.information(self, "Information", "Similarity index is up to date.")
+            return
+        # 큰 데이터셋은 prewarm.py --features 로 미리 만들어 두는 편이 빠르다
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.similarity_thread = DecodeThread(self.manifest, missing, FEATURE_SIZE, image_features, index.add, index.flush, self)
+        self.similarity_thread.progress.connect(self.update_progress)
+        self.similarity_thread.finished.connect(self.on_similarity_built)
+        self.similarity_thread.start()
+
+    def on_similarity_built(self):
+        self.progress_bar.hide()
+        self.statusBar().showMessage(f"Similarity index: {len(self.similarity_index)} images", 5000)
+
+    def stop_similarity_build(self):
+        if self.similarity_thread is not None and self.similarity_thread.isRunning():
+            self.similarity_thread.requestInterruption()
+            self.similarity_thread.wait()
+
+    def closeEvent(self, event):
+        if not self.close_write_queue():
+            event.ignore()
+            return
+        self.close_overview()
+        self.stop_similarity_build()
+        for loader in (self.tile_loader, self.scroll_loader):
+            loader.cancel()
+            loader.pool.waitForDone()
+        self.detail_loader.clear()
+        self.detail_loader.pool.waitForDone()
+        profiler.stop_trace()
+        super().closeEvent(event)
+
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
     app = QApplication(sys.argv)
     main_window = MainWindow()
     app.setWindowIcon(QIcon('./icon.png')) 
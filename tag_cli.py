@@ -0,0 +1,156 @@
+import argparse
+import csv
+import sys
+import time
+from sqlalchemy import update, bindparam
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from create_db import LadybirdDB, open_engine
+from npy_subset import NpySubset, id_from_path, load_npy_ids, open_npy
+from export import export_query, named_totals
+from db_ops import log_reload
+
+# PyQt5 를 import 하지 않으므로 GUI 가 없는 서버에서도 실행할 수 있다
+
+ladybirds = LadybirdDB.__table__
+
+class Throughput:
+    def __init__(self, label, every=100000, unit='rows'):
+        self.label = label
+        self.every = every
+        self.unit = unit
+        self.count = 0
+        self.start = time.time()
+        self.next_report = every
+
+    def add(self, n):
+        self.count += n
+        if self.count >= self.next_report:
+            self.report()
+            self.next_report += self.every
+
+    def report(self, final=False):
+        elapsed = max(time.time() - self.start, 1e-9)
+        end = '\n' if final else '\r'
+        print(f"{self.label}: {self.count} {self.unit} in {elapsed:.1f}s ({self.count / elapsed:.0f} {self.unit}/s)", end=end, file=sys.stderr, flush=True)
+
+def read_csv_pairs(path, delimiter):
+    with open(path, newline='') as f:
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) < 2 or row[0] == 'id':
+                continue
+            yield id_from_path(row[0]), row[1]
+
+def read_npy_pairs(path, default_class):
+    values = open_npy(path)
+    if values.ndim == 2:
+        for ladybird_id, cls in values:
+            yield id_from_path(ladybird_id), str(cls)
+    else:
+        if default_class is None:
+            raise SystemExit('--class is required for a 1-D NPY of ids/paths')
+        # 1 차원 id/경로 배열은 load_npy_ids 로 한 번에 id 를 꺼낸다 (저장한 subset 의 'S' 배열 포함)
+        for ladybird_id in load_npy_ids(path).astype('U').tolist():
+            yield ladybird_id, default_class
+
+def read_pairs(args):
+    if args.source.endswith('.npy'):
+        return read_npy_pairs(args.source, args.class_)
+    pairs = read_csv_pairs(args.source, args.delimiter)
+    if args.class_ is not None:
+        return ((ladybird_id, args.class_) for ladybird_id, _ in pairs)
+    return pairs
+
+def batches(pairs, size):
+    batch = []
+    for ladybird_id, cls in pairs:
+        batch.append({'b_id': ladybird_id, 'b_class': cls})
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def import_tags(args):
+    engine = open_engine(args.db)
+    if args.insert_missing:
+        statement = sqlite_insert(ladybirds).values(id=bindparam('b_id'), class_=bindparam('b_class'))
+        statement = statement.on_conflict_do_update(index_elements=['id'], set_={'class_': statement.excluded.class_})
+    else:
+        statement = update(ladybirds).where(ladybirds.c.id == bindparam('b_id')).values(class_=bindparam('b_class'))
+    throughput = Throughput('import')
+    matched = 0
+    # chunk 단위로 트랜잭션을 나눠 커밋한다
+    try:
+        for batch in batches(read_pairs(args), args.chunk_size):
+            with engine.begin() as connection:
+                matched += connection.execute(statement, batch).rowcount
+            throughput.add(len(batch))
+    finally:
+        # 열려 있는 Tag Bug 창들이 (중단됐더라도) 끝난 뒤에 한 번만 전체를 다시 읽도록 표시한다
+        if throughput.count:
+            with engine.begin() as connection:
+                log_reload(connection, 'tag_cli import')
+    throughput.report(final=True)
+    print(f"{throughput.count} rows read, {matched} rows written")
+
+def export_tags(args):
+    engine = open_engine(args.db, poolclass=StaticPool)
+    session = sessionmaker(bind=engine)()
+    query = session.query(LadybirdDB)
+    if args.class_:
+        query = query.filter(LadybirdDB.class_.in_(args.class_))
+    if args.npy:
+        subset = NpySubset(load_npy_ids(args.npy))
+        subset.attach(session)
+        query = subset.filter(query)
+    output_format = args.format or ('npy' if args.output and args.output.endswith('.npy') else 'csv')
+    if not args.output and (output_format == 'npy' or args.split):
+        raise SystemExit('-o is required for NPY or --split exports')
+    throughput = Throughput('export')
+    totals = export_query(query, args.output or '-', output_format, args.split, args.per_class, args.fraction, args.seed,
+                          args.path_root, args.delimiter, args.chunk_size,
+                          lambda done, total: throughput.add(done - throughput.count))
+    throughput.report(final=True)
+    print(f"{sum(totals.values())} rows written ({', '.join(f'{name}: {count}' for name, count in named_totals(totals))})", file=sys.stderr)
+
+def fraction(value):
+    value = float(value)
+    if not 0 < value <= 1:
+        raise argparse.ArgumentTypeError(f"must be in (0, 1], got {value}")
+    return value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tag Bug headless batch tagging')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='stream (id, class) pairs from CSV or NPY into the DB')
+    import_parser.add_argument('db')
+    import_parser.add_argument('source', help='CSV with id,class rows or NPY of (id, class) pairs / ids')
+    import_parser.add_argument('--class', dest='class_', help='assign this class to every id in source')
+    import_parser.add_argument('--insert-missing', action='store_true', help='insert ids that are not in the DB')
+    import_parser.add_argument('--chunk-size', type=int, default=50000)
+    import_parser.add_argument('--delimiter', default=',')
+    import_parser.set_defaults(func=import_tags)
+
+    export_parser = subparsers.add_parser('export', help='stream tags as CSV, or ids as NPY training lists')
+    export_parser.add_argument('db')
+    export_parser.add_argument('-o', '--output', help='output file (CSV goes to stdout when omitted)')
+    export_parser.add_argument('--format', choices=['csv', 'npy'], help='default: npy for *.npy outputs, otherwise csv')
+    export_parser.add_argument('--class', dest='class_', action='append', help='only export this class (repeatable)')
+    export_parser.add_argument('--npy', help='only export ids in this NPY subset')
+    export_parser.add_argument('--split', action='store_true', help='write one file per class (OUTPUT.<class>.ext)')
+    export_parser.add_argument('--per-class', type=int, help='stratified sample: at most this many ids per class')
+    export_parser.add_argument('--fraction', type=fraction, help='stratified sample: this fraction of each class')
+    export_parser.add_argument('--seed', type=int, default=0)
+    export_parser.add_argument('--path-root', help="write '<root>/<id>' paths instead of ids (the layout Load NPY expects)")
+    export_parser.add_argument('--chunk-size', type=int, default=50000)
+    export_parser.add_argument('--delimiter', default=',')
+    export_parser.set_defaults(func=export_tags)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+from collections import namedtuple
+from sqlalchemy import create_engine, event, Column, String, Integer, Float, Boolean, LargeBinary, func
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db_ops import chunked
+from image_source import source_stat
+
+CacheBase = declarative_base()
+
+DEFAULT_CACHE_DIR = os.environ.get('TAG_BUG_CACHE_DIR', os.path.expanduser('~/.cache/tag_bug'))
+DEFAULT_MAX_BYTES = int(os.environ.get('TAG_BUG_CACHE_MB', '1024')) * 1024 * 1024
+
+# 디코딩된 타일의 raw 픽셀 (QImage 없이 저장/복원 가능하도록).
+# source_width/height 는 원본 이미지 크기 (디테일 창의 표시 영역 비율에 쓴다. 모르면 None)
+Thumbnail = namedtuple('Thumbnail', ['width', 'height', 'image_format', 'bytes_per_line', 'data', 'source_width', 'source_height'],
+                       defaults=(None, None))
+
+class ThumbnailDB(CacheBase):
+    __tablename__ = 'thumbnails'
+    path = Column(String, primary_key=True)
+    width = Column(Integer, primary_key=True)
+    height = Column(Integer, primary_key=True)
+    grayscale = Column(Boolean, primary_key=True)
+    mtime = Column(Float)
+    size = Column(Integer)
+    image_width = Column(Integer)
+    image_height = Column(Integer)
+    image_format = Column(Integer)
+    bytes_per_line = Column(Integer)
+    source_width = Column(Integer)
+    source_height = Column(Integer)
+    data = Column(LargeBinary)
+    nbytes = Column(Integer)
+    last_used = Column(Float, index=True)
+
+class ThumbnailCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_path = os.path.join(cache_dir, 'thumbnails.db')
+        self.max_bytes = max_bytes
+        self.engine = create_engine(f'sqlite:///{self.cache_path}', connect_args={'check_same_thread': False})
+        event.listen(self.engine, 'connect', self._on_connect)
+        CacheBase.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            columns = {row[1] for row in connection.exec_driver_sql('PRAGMA table_info(thumbnails)')}
+            # 예전 캐시에는 원본 크기 열이 없다 (그 타일은 원본 크기 없이 저장되어 있다)
+            for column in ('source_width', 'source_height'):
+                if column not in columns:
+                    connection.exec_driver_sql(f'ALTER TABLE thumbnails ADD COLUMN {column} INTEGER')
+        self.Session = sessionmaker(bind=self.engine)
+        self.source_stats = {}
+        self.lock = threading.Lock()
+        with self.Session() as session:
+            self.total_bytes = session.query(func.coalesce(func.sum(ThumbnailDB.nbytes), 0)).scalar()
+
+    @staticmethod
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+    def remember_source(self, path, mtime, size):
+        # manifest 에 있는 값을 쓰면 원본을 stat 하지 않아도 된다
+        if path and mtime is not None:
+            self.source_stats[path] = (mtime, size)
+
+    def source_key(self, path):
+        # 세션 중에는 원본 파일을 한 번만 stat 한다
+        if path not in self.source_stats:
+            try:
+                self.source_stats[path] = source_stat(path)
+            except OSError:
+                self.source_stats[path] = None
+        return self.source_stats[path]
+
+    def get_many(self, paths, width, height, grayscale, larger=False):
+        # larger=True 면 정확한 크기가 없을 때 더 큰 캐시 타일(컬러 포함)을 돌려준다.
+        # 호출하는 쪽에서 image_loader.fit_tile 로 줄여 쓴다
+        keys = {path: self.source_key(path) for path in paths}
+        paths = [path for path, key in keys.items() if key is not None]
+        if not paths:
+            return {}
+        found = {}
+        with self.Session() as session:
+            rows = session.query(ThumbnailDB).filter(
+                ThumbnailDB.path.in_(paths),
+                ThumbnailDB.width == width,
+                ThumbnailDB.height == height,
+                ThumbnailDB.grayscale == bool(grayscale)).all()
+            current = {row.path for row in rows if (row.mtime, row.size) == keys[row.path]}
+            missing = [path for path in paths if path not in current]
+            if larger and missing:
+                rows += session.query(ThumbnailDB).filter(
+                    ThumbnailDB.path.in_(missing),
+                    ThumbnailDB.width >= width,
+                    ThumbnailDB.height >= height,
+                    ThumbnailDB.grayscale.in_({bool(grayscale), False})).order_by(ThumbnailDB.width).all()
+            now = time.time()
+            for row in rows:
+                if row.path in found or (row.mtime, row.size) != keys[row.path]:
+                    continue
+                found[row.path] = Thumbnail(row.image_width, row.image_height, row.image_format, row.bytes_per_line, row.data,
+                                            row.source_width, row.source_height)
+                row.last_used = now
+            session.commit()
+        return found
+
+    def cached_paths(self, paths, width, height, grayscale):
+        # 원본이 바뀌지 않은 타일이 이미 있는 경로 (픽셀은 읽지 않는다)
+        keys = {path: self.source_key(path) for path in paths}
+        cached = set()
+        with self.Session() as session:
+            for chunk in chunked([path for path, key in keys.items() if key is not None]):
+                for row in session.query(ThumbnailDB.path, ThumbnailDB.mtime, ThumbnailDB.size).filter(
+                        ThumbnailDB.path.in_(chunk),
+                        ThumbnailDB.width == width,
+                        ThumbnailDB.height == height,
+                        ThumbnailDB.grayscale == bool(grayscale)):
+                    if (row.mtime, row.size) == keys[row.path]:
+                        cached.add(row.path)
+        return cached
+
+    def get(self, path, width, height, grayscale):
+        return self.get_many([path], width, height, grayscale).get(path)
+
+    def put(self, path, width, height, grayscale, thumbnail):
+        self.put_many([(path, thumbnail)], width, height, grayscale)
+
+    def put_many(self, items, width, height, grayscale):
+        now = time.time()
+        # 같은 타일을 동시에 쓰는 다른 스레드가 이전 크기 읽기와 upsert/커밋 사이에 끼면
+        # 둘 다 새 행으로 세므로 한 lock 안에서 읽고, 쓰고, 커밋한다
+        with self.lock, self.Session() as session:
+            added = 0
+            for path, thumbnail in items:
+                key = self.source_key(path)
+                if key is None:
+                    continue
+                old = session.query(ThumbnailDB.nbytes).filter_by(path=path, width=width, height=height, grayscale=bool(grayscale)).scalar()
+                nbytes = len(thumbnail.data)
+                values = dict(
+                    mtime=key[0], size=key[1],
+                    image_width=thumbnail.width, image_height=thumbnail.height,
+                    image_format=thumbnail.image_format, bytes_per_line=thumbnail.bytes_per_line,
+                    source_width=thumbnail.source_width, source_height=thumbnail.source_height,
+                    data=thumbnail.data, nbytes=nbytes, last_used=now)
+                # 여러 워커가 같은 타일을 동시에 쓸 수 있으므로 upsert 로 저장한다
+                session.execute(sqlite_insert(ThumbnailDB).values(
+                    path=path, width=width, height=height, grayscale=bool(grayscale), **values
+                ).on_conflict_do_update(index_elements=['path', 'width', 'height', 'grayscale'], set_=values))
+                added += nbytes - (old or 0)
+            session.commit()
+            self.total_bytes += added
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self, target_bytes=None):
+        # LRU: 가장 오래 사용되지 않은 타일부터 삭제
+        if target_bytes is None:
+            target_bytes = int(self.max_bytes * 0.9)
+        with self.lock, self.Session() as session:
+            freed = 0
+            stale = []
+            for row in session.query(ThumbnailDB.path, ThumbnailDB.width, ThumbnailDB.height,
+                                     ThumbnailDB.grayscale, ThumbnailDB.nbytes).order_by(ThumbnailDB.last_used).yield_per(1000):
+                if self.total_bytes - freed <= target_bytes:
+                    break
+                stale.append(row[:4])
+                freed += row.nbytes
+            for key in stale:
+                session.query(ThumbnailDB).filter_by(path=key[0], width=key[1], height=key[2], grayscale=key[3]).delete()
+            session.commit()
+        self.total_bytes -= freed
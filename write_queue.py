@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import namedtuple, deque
+from itertools import islice
+from PyQt5.QtCore import QThread, pyqtSignal
+from sqlalchemy.orm import sessionmaker
+from create_db import open_engine
+from db_ops import bulk_update_class, bulk_delete, prune_change_log, is_busy_error
+
+# kind: 'tag' 또는 'delete'. previous 는 큐에 넣을 때 화면/통계에 먼저 반영한 이전 클래스별 개수
+WriteOp = namedtuple('WriteOp', ['kind', 'ladybird_ids', 'new_class', 'previous'])
+
+class WriteQueue(QThread):
+    # 태그/삭제를 UI 스레드 밖에서 자기 connection 으로 모아서 커밋한다.
+    # 커밋이 끝날 때까지 작업은 큐에 남아 있고, 실패하면 retry() 전까지 멈춘다.
+    # 다른 창이 쓰고 있어서 잠겨 있으면 busy_retries 번까지는 멈추지 않고 다시 시도한다
+    committed = pyqtSignal(list)
+    failed = pyqtSignal(str)
+
+    def __init__(self, db_path, parent=None, linger=0.05, max_batch=200, client=None, busy_retries=5):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.linger = linger
+        self.max_batch = max_batch
+        self.client = client
+        self.busy_retries = busy_retries
+        self.ops = deque()
+        self.condition = threading.Condition()
+        self.paused = False
+        self.stopping = False
+        self.error = None
+
+    def submit(self, kind, ladybird_ids, new_class=None, previous=None):
+        with self.condition:
+            self.ops.append(WriteOp(kind, list(ladybird_ids), new_class, previous))
+            self.condition.notify_all()
+
+    def pending(self):
+        with self.condition:
+            return sum(len(op.ladybird_ids) for op in self.ops)
+
+    def has_pending(self):
+        with self.condition:
+            return bool(self.ops)
+
+    def retry(self):
+        with self.condition:
+            self.paused = False
+            self.error = None
+            self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        # 큐가 비거나 쓰기가 실패할 때까지 기다린다. 실패했으면 오류 메시지를 돌려준다
+        with self.condition:
+            self.paused = False
+            self.error = None
+            self.condition.notify_all()
+            if self.ops and not self.isRunning():
+                return 'writer is not running'
+            self.condition.wait_for(lambda: not self.ops or self.error is not None, timeout)
+            if self.error is not None:
+                return self.error
+            return None if not self.ops else 'timed out'
+
+    def discard(self):
+        with self.condition:
+            self.ops.clear()
+            self.error = None
+            self.condition.notify_all()
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.wait()
+
+    def run(self):
+        engine = open_engine(self.db_path)
+        Session = sessionmaker(bind=engine)
+        try:
+            with Session() as session:
+                prune_change_log(session)
+                session.commit()
+        except Exception:
+            # 정리는 다음에 열 때 해도 된다
+            pass
+        busy = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.stopping or (self.ops and not self.paused))
+                if not self.ops or self.paused:
+                    break
+            # 연속 태깅을 한 트랜잭션으로 묶을 수 있도록 잠깐 기다린다
+            if self.linger and not self.stopping:
+                time.sleep(self.linger)
+            with self.condition:
+                batch = list(islice(self.ops, self.max_batch))
+            try:
+                results = []
+                with Session() as session:
+                    for op in batch:
+                        if op.kind == 'tag':
+                            results.append((op, bulk_update_class(session, op.ladybird_ids, op.new_class, self.client)))
+                        else:
+                            results.append((op, bulk_delete(session, op.ladybird_ids, self.client)))
+                    session.commit()
+            except Exception as e:
+                if is_busy_error(e) and busy < self.busy_retries and not self.stopping:
+                    busy += 1
+                    time.sleep(min(0.2 * 2 ** busy, 5))
+                    continue
+                with self.condition:
+                    self.paused = True
+                    self.error = str(e)
+                    self.condition.notify_all()
+                self.failed.emit(str(e))
+                continue
+            busy = 0
+            with self.condition:
+                for _ in batch:
+                    self.ops.popleft()
+                self.condition.notify_all()
+            self.committed.emit(results)
+        engine.dispose()